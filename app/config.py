@@ -17,7 +17,101 @@ class Settings(BaseSettings):
     llm_base_url: str = "https://api.openai.com/v1"  # Fallback for legacy support
     llm_api_key: str = "your-api-key"  # Fallback for legacy support
     llm_model_name: str = "gpt-3.5-turbo"  # Fallback for legacy support
-    
+
+    # LLM HTTP connection pooling (per provider base_url)
+    llm_pool_max_connections: int = 200
+    llm_pool_max_keepalive: int = 50
+    llm_pool_keepalive_expiry: float = 30.0
+
+    # LLM request timeouts, deadline and retries (retries only happen before the first token)
+    llm_connect_timeout_seconds: float = 10.0
+    llm_first_byte_timeout_seconds: float = 60.0
+    llm_stream_idle_timeout_seconds: float = 30.0
+    llm_request_deadline_seconds: float = 300.0
+    llm_max_retries: int = 2
+    llm_retry_base_delay_seconds: float = 0.5
+    llm_retry_max_delay_seconds: float = 8.0
+
+    # Circuit breakers per provider and model (fallback chains are set per model in llms.yml)
+    circuit_failure_rate_threshold: float = 0.5
+    circuit_slow_call_seconds: float = 30.0  # Time to first token counted as slow
+    circuit_slow_call_rate_threshold: float = 0.8
+    circuit_min_calls: int = 5
+    circuit_window_size: int = 20
+    circuit_open_seconds: float = 30.0
+
+    # Hedged streams: a second request if the first token is slower than the model's recent percentile
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20  # Below this many samples the default delay is used
+    hedge_default_delay_seconds: float = 2.0
+    hedge_min_delay_seconds: float = 0.25
+    hedge_max_delay_seconds: float = 10.0
+
+    # Session store: resident LRU hot set with idle expiry over a persistent backend
+    session_max_resident: int = 1000
+    session_idle_ttl_seconds: float = 1800.0
+    session_backend: str = "sqlite"  # "sqlite" or "json"
+    session_db_path: str = "data/sessions.db"
+    session_spill_dir: str = "data/sessions"  # Used by the json backend
+
+    # Cross-worker pub/sub: "memory" (single worker), "sqlite" (workers on one host) or "redis"
+    pubsub_backend: str = "memory"
+    pubsub_db_path: str = "data/pubsub.db"
+    pubsub_poll_interval_seconds: float = 0.05
+    redis_url: Optional[str] = None
+
+    # Session event logging: background writer batching per session file
+    log_queue_max_events: int = 10000
+    log_batch_max_events: int = 256
+    log_flush_interval_seconds: float = 0.25
+    log_max_open_files: int = 128
+
+    # Log housekeeping: rotation, compression and retention of logs/
+    log_rotate_max_bytes: int = 10 * 1024 * 1024
+    log_rotate_max_age_seconds: float = 86400.0
+    log_compression: str = "gzip"  # "gzip", "zstd" (needs the zstandard package) or "none"
+    log_retention_days: float = 30.0
+    log_download_retention_seconds: float = 3600.0  # chat_session_*.txt download files
+    log_blob_retention_days: float = 31.0  # Unused prompt blobs; keep above log_retention_days so logs can resolve them
+    log_housekeeping_interval_seconds: float = 300.0
+
+    # System prompt composition cache (entries keyed by tool/data source selection)
+    prompt_cache_max_entries: int = 256
+
+    # Prompt fragments: prompts/<kind>/<id>.md templates plus the base prompt file, hot-reloaded by mtime
+    prompt_fragments_dir: str = "prompts"
+    system_prompt_file: str = "system_prompt.md"
+    prompt_reload_interval_seconds: float = 2.0
+
+    # Conversation context window: token budget for models without context_budget_tokens in llms.yml
+    context_default_budget_tokens: int = 8000
+
+    # Background history compaction (opt-in): older turns are summarized by a cheap model
+    # in the context sent to the model; the stored history keeps every message
+    compaction_enabled: bool = False
+    compaction_llm_name: str = "Claude 3.5 Haiku"
+    compaction_threshold_tokens: int = 6000
+    compaction_keep_recent_messages: int = 6
+
+    # Exact-match LLM response cache (memory LRU over an optional SQLite tier; empty db path disables disk)
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 1000
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_db_path: Optional[str] = "data/response_cache.db"
+    response_cache_max_disk_entries: int = 10000
+
+    # Single-flight: concurrent identical LLM requests share one upstream call
+    single_flight_enabled: bool = True
+
+    # LLM request queue: limits per provider and model come from llms.yml
+    llm_queue_max_waiting: int = 100
+    llm_queue_timeout_seconds: float = 120.0
+
+    # Streamed output coalescing: deltas arriving within the window are sent as one frame (0 disables)
+    stream_coalesce_window_ms: float = 25.0
+    stream_coalesce_max_bytes: int = 1024  # Buffered content flushed early at this size
+
     # Development & Testing
     test_mode: bool = False
     test_email: str = "test@test.com"
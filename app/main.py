@@ -6,8 +6,12 @@ from starlette.responses import HTMLResponse
 from starlette.routing import Mount
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.middleware.auth import AuthMiddleware
-from app.routers import chat, websocket, llm_configs, theme, tools, config
+from app.routers import chat, websocket, llm_configs, theme, tools, config, metrics
 from app.services.llm_client import llm_client
+from app.services.session_manager import session_manager
+from app.services.history_compactor import history_compactor
+from app.utils.session_logger import session_event_writer
+from app.utils.log_housekeeping import log_housekeeper
 from app.config import settings
 import os
 
@@ -57,6 +61,10 @@ async def lifespan(app: FastAPI):
     
     print(f"Final SYSTEM_PROMPT_CONTENT: '{SYSTEM_PROMPT_CONTENT}'")
 
+    session_event_writer.start()
+    await log_housekeeper.start()
+    await session_manager.start()
+
     if not settings.disable_llm_calls:
         try:
             print("Performing LLM health check...")
@@ -73,6 +81,11 @@ async def lifespan(app: FastAPI):
     else:
         print("LLM health check disabled")
     yield
+    await history_compactor.stop()
+    await session_manager.stop()
+    await llm_client.aclose()
+    await log_housekeeper.stop()
+    session_event_writer.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -84,6 +97,7 @@ app.include_router(llm_configs.router)
 app.include_router(theme.router)
 app.include_router(tools.router)
 app.include_router(config.router)
+app.include_router(metrics.router)
 
 # Mount frontend static files from built assets
 app.mount("/static", StaticFiles(directory="frontend/dist"), name="static")
@@ -1,13 +1,20 @@
+import asyncio
 import json
+from contextlib import aclosing
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from app.services.session_manager import session_manager
-from app.utils.session_logger import log_session_event
+from app.utils.session_logger import log_session_event, store_prompt_blob
+from app.utils.transcript import TRANSCRIPT_FORMATS, iter_transcript
 from app.services.llm_client import llm_client
+from app.services.context_window import context_window_manager, context_budget_for
+from app.services.history_compactor import history_compactor
+from app.services.generation_tracker import generation_tracker
+from app.services.stream_events import DONE, status_event
+from app.services.token_counter import token_counter
+from app.services.request_policy import request_policy
 from app.services.system_prompt_engine import system_prompt_engine
 from app.config import settings
-from datetime import datetime
-import os
 from typing import List, Optional
 
 router = APIRouter()
@@ -23,38 +30,25 @@ async def create_chat_session(request: Request):
     return {"session_id": session_id}
 
 @router.get("/chat/{session_id}/download")
-async def download_chat_session(session_id: str):
+async def download_chat_session(session_id: str, format: str = "txt"):
     session = session_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-
-    chat_history = session.get("messages", [])
-    selected_tools = session.get("selected_tools", [])
-    selected_data_sources = session.get("selected_data_sources", [])
-
-    # Format the chat history
-    formatted_content = f"Chat Session ID: {session_id}\n"
-    formatted_content += f"Timestamp: {datetime.now().isoformat()}\n"
-    formatted_content += f"Selected LLM: {llm_client.current_llm_name}\n"
-    formatted_content += f"Selected Tools: {', '.join(selected_tools) if selected_tools else 'None'}\n"
-    formatted_content += f"Selected Data Sources: {', '.join(selected_data_sources) if selected_data_sources else 'None'}\n\n"
-
-    for msg in chat_history:
-        role = msg.get("role", "unknown").capitalize()
-        content = msg.get("content", "")
-        formatted_content += f"{role}: {content}\n\n"
-
-    # Create a temporary file to store the content
-    file_name = f"chat_session_{session_id}.txt"
-    file_path = os.path.join("logs", file_name)
-
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(formatted_content)
-
-    return FileResponse(path=file_path, filename=file_name, media_type="text/plain")
+    if format not in TRANSCRIPT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'. Use one of: {', '.join(TRANSCRIPT_FORMATS)}")
+
+    media_type, extension = TRANSCRIPT_FORMATS[format]
+    llm_name = session.get('llm_name') or llm_client.current_llm_name
+    return StreamingResponse(
+        iter_transcript(session_id, session, llm_name, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="chat_session_{session_id}.{extension}"'},
+    )
 
 @router.post("/chat/{session_id}/message")
 async def chat_message(session_id: str, request: Request, message: dict):
+    # The whole request, including the provider call, must finish by this deadline
+    deadline = request_policy.new_deadline()
     session = session_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -75,13 +69,14 @@ async def chat_message(session_id: str, request: Request, message: dict):
     session_manager.update_session_tools(session_id, selected_tools)
     session_manager.update_session_data_sources(session_id, selected_data_sources)
     
-    # Handle LLM selection
+    # Handle LLM selection (bound to this session, never to the shared client)
     if llm_name:
         try:
-            llm_client.set_llm(llm_name)
-            log_session_event(session_id, {"event": "llm_changed", "llm_name": llm_name})
+            llm_client.get_provider(llm_name)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=f"Invalid LLM selection: {e}")
+        session_manager.update_session_llm(session_id, llm_name)
+    session_llm_name = llm_name or session.get("llm_name")
 
     # Log parameter updates
     log_session_event(session_id, {
@@ -97,7 +92,13 @@ async def chat_message(session_id: str, request: Request, message: dict):
 
     # Prepare messages
     user_message = {"role": "user", "content": user_content}
-    session_messages = session.get("messages", [])
+
+    # Provider family and token budget of the session's model
+    try:
+        session_llm = llm_client.get_provider(session_llm_name)
+        provider, budget_tokens = session_llm.provider, context_budget_for(session_llm)
+    except ValueError:
+        provider, budget_tokens = "openai", settings.context_default_budget_tokens
     
     # Generate dynamic system prompt for this conversation
     system_prompt = system_prompt_engine.generate_system_prompt(
@@ -108,31 +109,34 @@ async def chat_message(session_id: str, request: Request, message: dict):
     # Log system prompt for debugging
     log_session_event(session_id, {
         "event": "system_prompt_generated",
-        "system_prompt": system_prompt,
+        "system_prompt_sha256": store_prompt_blob(system_prompt),
+        "system_prompt_chars": len(system_prompt),
+        "system_prompt_tokens": token_counter.count_text(system_prompt, provider),
+        "data_source_tokens": system_prompt_engine.data_source_tokens(selected_data_sources, provider),
         "selected_tools": selected_tools,
         "selected_data_sources": selected_data_sources
     })
     
     # Add system message if this is the first user message or update existing one
-    if not session_messages:
-        system_message = {"role": "system", "content": system_prompt}
-        session_messages.append(system_message)
-    else:
-        # Update system message to reflect current selections
-        for msg in session_messages:
-            if msg["role"] == "system":
-                msg["content"] = system_prompt
-                break
+    session_manager.set_system_prompt(session_id, system_prompt)
     
     # Add user message
-    session_messages.append(user_message)
-    log_session_event(session_id, {"event": "user_message", "message": user_message})
+    session_manager.append_message(session_id, user_message)
+    log_session_event(session_id, {
+        "event": "user_message",
+        "message": user_message,
+        "tokens": token_counter.count_message(user_message, provider)
+    })
 
-    # Prepare messages for LLM (copy for thread safety)
-    llm_messages = list(session_messages)
+    # Prepare messages for LLM, with any history summary in place of the turns it covers,
+    # windowed to the model's token budget (a copy, so later appends don't affect this request)
+    llm_messages, context = context_window_manager.build_context(
+        session_id, session_manager.context_messages(session_id), budget_tokens, provider)
+    if context["dropped"]:
+        log_session_event(session_id, {"event": "context_trimmed", "budget_tokens": budget_tokens, **context})
 
-    def generate_response():
-        """Generator for streaming response with tool selection feedback."""
+    async def generate_response():
+        """Async generator for streaming response with tool selection feedback."""
         # Stream tool selection feedback
         for tool_name in selected_tools:
             log_session_event(session_id, {"event": "tool_selected", "tool_name": tool_name})
@@ -143,36 +147,75 @@ async def chat_message(session_id: str, request: Request, message: dict):
             log_session_event(session_id, {"event": "data_source_selected", "data_source": data_source})
             yield f"data: {json.dumps({'type': 'data_source_selected', 'data_source': data_source})}\n\n"
 
-        # Single streaming LLM call
-        full_content = ""
+        # Single streaming LLM call, read in a task of its own so a disconnect can abort it
+        content_parts = []
+        usage = None
+        generation = generation_tracker.start(session_id, lambda: llm_client.achat_completion(
+            messages=llm_messages, stream=True, llm_name=session_llm_name, deadline=deadline))
+        watcher = asyncio.create_task(_cancel_on_disconnect(request, generation))
         try:
-            for chunk in llm_client.chat_completion(messages=llm_messages, stream=True):
-                if chunk.startswith(b'data:'):
-                    chunk = chunk[len(b'data:'):].strip()
-                if chunk == b'[DONE]':
-                    break
-                if chunk:
-                    try:
-                        data = json.loads(chunk)
-                        content = data["choices"][0]["delta"].get("content", "")
-                        if content:
-                            full_content += content
-                            yield f"data: {json.dumps({'content': content})}\n\n"
-                    except json.JSONDecodeError:
+            # aclosing stops the upstream call as soon as we stop reading
+            async with aclosing(generation.events()) as stream:
+                async for event in stream:
+                    if event.done:
+                        break
+                    if event.status is not None:
+                        # Queue wait, fallback or hedge before the model started; passed through to the client
+                        log_session_event(session_id, {"event": "llm_status", **event.status})
+                        yield event.sse()
                         continue
+                    if event.usage:
+                        # Token counts, including prompt cache reads and writes
+                        usage = event.usage
+                    if event.content:
+                        content_parts.append(event.content)
+                        yield event.sse()
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server stopped the response: the client is gone
+            generation.cancel_reason = generation.cancel_reason or "client_disconnected"
+            raise
         except Exception as e:
             error_msg = f"Error during streaming: {str(e)}"
             log_session_event(session_id, {"event": "streaming_error", "error": error_msg})
             yield f"data: {json.dumps({'error': error_msg})}\n\n"
         finally:
-            # Store assistant response
+            watcher.cancel()
+            # Store assistant response, partial if the generation was cancelled
+            full_content = "".join(content_parts)
+            assistant_response = {"role": "assistant", "content": full_content}
+            tokens = token_counter.count_message(assistant_response, provider) if full_content else 0
+            if generation.cancel_reason:
+                log_session_event(session_id, {
+                    "event": "generation_cancelled",
+                    "reason": generation.cancel_reason,
+                    "prompt_tokens": context["tokens"],
+                    "completion_tokens": tokens,
+                    "usage": usage
+                })
             if full_content:
-                assistant_response = {"role": "assistant", "content": full_content}
-                session_messages.append(assistant_response)
-                log_session_event(session_id, {"event": "assistant_response", "response": assistant_response})
-                session_manager.update_session_messages(session_id, session_messages)
-            
-            # Signal completion
-            yield f"data: [DONE]\n\n"
-
-    return StreamingResponse(generate_response(), media_type="text/event-stream")
\ No newline at end of file
+                log_session_event(session_id, {
+                    "event": "assistant_response",
+                    "response": assistant_response,
+                    "tokens": tokens,
+                    "usage": usage
+                })
+                session_manager.append_message(session_id, assistant_response)
+                history_compactor.maybe_schedule(session_id)
+
+        if generation.cancel_reason == "client_disconnected":
+            return
+        if generation.cancel_reason:
+            yield status_event({"status": "cancelled", "reason": generation.cancel_reason}).sse()
+        # Signal completion
+        yield DONE.sse()
+
+    return StreamingResponse(generate_response(), media_type="text/event-stream")
+
+
+async def _cancel_on_disconnect(request: Request, generation):
+    """Cancel the generation as soon as the client disconnects."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            generation.cancel("client_disconnected")
+            return
\ No newline at end of file
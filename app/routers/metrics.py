@@ -0,0 +1,46 @@
+"""
+API endpoints for runtime metrics.
+"""
+from fastapi import APIRouter
+from typing import Dict, Any
+from app.services.session_manager import session_manager
+from app.services.http_pool import http_pool
+from app.services.llm_client import llm_client
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.rate_limiter import rate_limiter
+from app.services.generation_tracker import generation_tracker
+from app.services.context_window import context_window_manager
+from app.services.token_counter import token_counter
+from app.services.history_compactor import history_compactor
+from app.services.system_prompt_engine import system_prompt_engine
+from app.services.prompt_registry import prompt_registry
+from app.utils.session_logger import session_event_writer
+from app.utils.log_housekeeping import log_housekeeper
+
+router = APIRouter()
+
+@router.get("/api/metrics")
+async def get_metrics() -> Dict[str, Any]:
+    """Get cache, pool and store counters."""
+    return {
+        "sessions": session_manager.sessions.stats(),
+        "pubsub": session_manager.pubsub.stats(),
+        "llm_http_pool": http_pool.stats(),
+        "llm_usage": llm_client.usage_stats(),
+        "llm_retries": llm_client.retry_stats(),
+        "llm_fallbacks": llm_client.fallback_stats(),
+        "circuit_breakers": llm_client.circuit_breakers.stats(),
+        "hedging": llm_client.hedger.stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "llm_rate_limits": rate_limiter.stats(),
+        "generations": generation_tracker.stats(),
+        "context_window": context_window_manager.stats(),
+        "token_counter": token_counter.stats(),
+        "history_compaction": history_compactor.stats(),
+        "system_prompt_cache": system_prompt_engine.cache_stats(),
+        "prompt_registry": prompt_registry.stats(),
+        "session_logger": session_event_writer.stats(),
+        "log_housekeeping": log_housekeeper.stats(),
+    }
@@ -28,6 +28,10 @@ async def websocket_endpoint(websocket: WebSocket):
                     print(f"New session created and WebSocket registered: {session_id}")
                 
                 await websocket.send_json({"type": "session_id", "session_id": session_id})
+            elif data.get('type') == 'stop_generation' and session_id:
+                # The user pressed stop: abort the session's in-flight LLM stream on any worker
+                cancelled = session_manager.cancel_generations(session_id, "stopped_by_user")
+                await websocket.send_json({"type": "generation_stopped", "cancelled": cancelled})
             else:
                 # Handle other messages as before, or pass to session manager
                 if session_id:
@@ -39,6 +43,8 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         if session_id:
             session_manager.unregister_websocket(session_id)
+            # Tab closed: nobody is left to read the answer
+            session_manager.cancel_generations(session_id, "websocket_disconnected")
             print(f"WebSocket disconnected for session: {session_id}")
         else:
             print("WebSocket disconnected before session init")
@@ -0,0 +1,172 @@
+"""
+Circuit breakers for LLM providers and models.
+
+Each provider and each model has a breaker tracking the outcome of its
+recent calls. Too many failures or slow calls open the circuit, and calls
+are refused at once instead of waiting on a degraded provider. After a
+cool-down the circuit goes half-open and lets a single probe call through:
+success closes it, failure opens it again.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List
+from app.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised when a call is refused because every candidate model's circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 30.0,
+                 slow_call_rate_threshold: float = 0.8,
+                 min_calls: int = 5,
+                 window_size: int = 20,
+                 open_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (failed, slow) per recent call
+        self._outcomes: deque = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only one probe at a time is allowed."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: bool, latency: float = 0.0):
+        """Record the outcome of a call that allow() let through."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                # A call started before the circuit opened; it doesn't change anything now
+                return
+            if state == HALF_OPEN:
+                self._probe_in_flight = False
+                if success and latency < self.slow_call_seconds:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append((not success, success and latency >= self.slow_call_seconds))
+            if self._should_trip():
+                self._open()
+
+    def abandon(self):
+        """Forget a call that ended without an outcome (cancelled, or refused by another breaker)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self._current_state(),
+                "calls": calls,
+                "failure_rate": sum(f for f, _ in self._outcomes) / calls if calls else 0.0,
+                "slow_call_rate": sum(s for _, s in self._outcomes) / calls if calls else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _should_trip(self) -> bool:
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return False
+        failures = sum(f for f, _ in self._outcomes)
+        slow = sum(s for _, s in self._outcomes)
+        return failures / calls >= self.failure_rate_threshold or slow / calls >= self.slow_call_rate_threshold
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._probe_in_flight = False
+        self.times_opened += 1
+
+
+class CircuitBreakers:
+    """Breakers by scope name ("provider:<provider>", "model:<llm name>"), created on first use."""
+
+    def __init__(self, **breaker_options):
+        self._options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, scope: str) -> CircuitBreaker:
+        breaker = self._breakers.get(scope)
+        if breaker is None:
+            breaker = self._breakers.setdefault(scope, CircuitBreaker(**self._options))
+        return breaker
+
+    def allow(self, scopes: List[str]) -> bool:
+        """Whether every scope allows a call; probes taken before a refusal are given back."""
+        allowed = []
+        for scope in scopes:
+            breaker = self.get(scope)
+            if not breaker.allow():
+                for taken in allowed:
+                    taken.abandon()
+                return False
+            allowed.append(breaker)
+        return True
+
+    def record(self, scopes: List[str], success: bool, latency: float = 0.0):
+        for scope in scopes:
+            self.get(scope).record(success, latency)
+
+    def abandon(self, scopes: List[str]):
+        for scope in scopes:
+            self.get(scope).abandon()
+
+    def reset(self):
+        """Close every circuit and forget all outcomes."""
+        self._breakers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {scope: breaker.stats() for scope, breaker in self._breakers.items()}
+
+
+# Global instance
+circuit_breakers = CircuitBreakers(
+    failure_rate_threshold=settings.circuit_failure_rate_threshold,
+    slow_call_seconds=settings.circuit_slow_call_seconds,
+    slow_call_rate_threshold=settings.circuit_slow_call_rate_threshold,
+    min_calls=settings.circuit_min_calls,
+    window_size=settings.circuit_window_size,
+    open_seconds=settings.circuit_open_seconds,
+)
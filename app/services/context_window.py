@@ -0,0 +1,150 @@
+"""
+Token-budgeted context windows for LLM requests.
+
+Long conversations are windowed to the model's token budget: the system
+message is always kept, then the newest messages that fit. Per-message
+token counts are cached per session, so a new turn only counts the
+messages added since the last one.
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.token_counter import token_counter
+
+
+class _SessionCounts:
+    """Cached counts for one session's messages, with running prefix sums."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.messages: List[Dict[str, Any]] = []
+        self.counts: List[int] = []
+        self.prefix: List[int] = []  # prefix[i] = sum(counts[:i + 1])
+
+
+class ContextWindowManager:
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionCounts]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.trimmed_requests = 0
+        self.messages_dropped = 0
+        self.messages_counted = 0
+
+    def build_context(self, session_id: str, messages: List[Dict[str, Any]],
+                      budget_tokens: int, provider: str = "openai") -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Window messages to budget_tokens.
+
+        Keeps a leading system message and the newest messages that fit, never
+        starting the window on an assistant turn. The latest message is always
+        sent, even if it alone exceeds the budget. Returns the messages to send
+        and a summary with the token total and the number of dropped messages.
+        """
+        with self._lock:
+            counts = self._update_counts(session_id, messages, provider)
+            self.requests += 1
+
+            system_tokens = 0
+            first = 0
+            if messages and messages[0].get("role") == "system":
+                system_tokens = counts.counts[0]
+                first = 1
+            total = counts.prefix[-1] if counts.prefix else 0
+
+            if total <= budget_tokens or len(messages) - first <= 1:
+                return list(messages), {"tokens": total, "dropped": 0}
+
+            # Smallest start index whose suffix fits: suffix(start) = total - prefix[start - 1]
+            history_budget = budget_tokens - system_tokens
+            needed = total - history_budget
+            start = max(bisect_left(counts.prefix, needed) + 1, first)
+            start = min(start, len(messages) - 1)
+            # Begin the window on a user turn so providers see a valid alternation
+            while start < len(messages) - 1 and messages[start].get("role") != "user":
+                start += 1
+
+            window = messages[:first] + messages[start:]
+            tokens = system_tokens + total - counts.prefix[start - 1]
+            dropped = start - first
+            self.trimmed_requests += 1
+            self.messages_dropped += dropped
+            return window, {"tokens": tokens, "dropped": dropped}
+
+    def count_tokens(self, session_id: str, messages: List[Dict[str, Any]], provider: Optional[str] = None) -> int:
+        """Total tokens of messages, reusing the session's cached counts (and provider, if not given)."""
+        with self._lock:
+            if provider is None:
+                cached = self._sessions.get(session_id)
+                provider = cached.provider if cached is not None else "openai"
+            counts = self._update_counts(session_id, messages, provider)
+            return counts.prefix[-1] if counts.prefix else 0
+
+    def forget(self, session_id: str):
+        """Drop cached counts for a session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "requests": self.requests,
+            "trimmed_requests": self.trimmed_requests,
+            "messages_dropped": self.messages_dropped,
+            "messages_counted": self.messages_counted,
+        }
+
+    def _update_counts(self, session_id: str, messages: List[Dict[str, Any]], provider: str) -> _SessionCounts:
+        counts = self._sessions.get(session_id)
+        if counts is None or counts.provider != provider:
+            # Counts differ per tokenizer, so a model switch to another provider recounts
+            self._sessions.pop(session_id, None)
+            counts = _SessionCounts(provider)
+            self._sessions[session_id] = counts
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+
+        # Only messages that are new or changed are counted again; usually just the latest turn
+        changed = 0
+        first_changed = len(messages)
+        for index, message in enumerate(messages):
+            if index < len(counts.messages) and _same_message(counts.messages[index], message):
+                continue
+            if index < len(counts.messages):
+                counts.messages[index] = message
+                counts.counts[index] = token_counter.count_message(message, provider)
+            else:
+                counts.messages.append(message)
+                counts.counts.append(token_counter.count_message(message, provider))
+            first_changed = min(first_changed, index)
+            changed += 1
+        del counts.messages[len(messages):], counts.counts[len(messages):]
+        # Prefix sums are only rebuilt from the first changed message on
+        first_changed = min(first_changed, len(counts.prefix))
+        del counts.prefix[first_changed:]
+        running = counts.prefix[-1] if counts.prefix else 0
+        for count in counts.counts[first_changed:]:
+            running += count
+            counts.prefix.append(running)
+        self.messages_counted += changed
+        return counts
+
+
+def _same_message(cached: Dict[str, Any], message: Dict[str, Any]) -> bool:
+    if cached is message:
+        return True
+    return cached.get("role") == message.get("role") and cached.get("content") == message.get("content")
+
+
+def context_budget_for(llm) -> int:
+    """Token budget for a provider handle, falling back to the deployment default."""
+    return llm.context_budget_tokens or settings.context_default_budget_tokens
+
+
+# Global instance
+context_window_manager = ContextWindowManager(max_sessions=settings.session_max_resident)
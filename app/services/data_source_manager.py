@@ -2,7 +2,8 @@
 Data Source Manager for handling different data source integrations.
 Provides clean routing and content injection based on selected data sources.
 """
-from typing import List
+from typing import Callable, List
+from app.services.prompt_registry import prompt_registry
 
 
 class DataSourceManager:
@@ -14,6 +15,8 @@ class DataSourceManager:
             "data-test": self._handle_test_data_source,
             "new-mexico-history": self._handle_new_mexico_history,
         }
+        # Bumped whenever data source content may have changed, so cached prompts are rebuilt
+        self.version = 0
     
     def get_data_source_content(self, data_source_ids: List[str]) -> str:
         """
@@ -38,6 +41,15 @@ class DataSourceManager:
         
         return "\n\n".join(content_parts) if content_parts else ""
     
+    def register_data_source(self, data_source_id: str, handler: Callable[[], str]):
+        """Add or replace a data source handler."""
+        self._data_sources[data_source_id] = handler
+        self.invalidate()
+
+    def invalidate(self):
+        """Mark data source content as changed."""
+        self.version += 1
+
     def is_data_source_available(self, data_source_id: str) -> bool:
         """Check if a data source is available."""
         return data_source_id in self._data_sources
@@ -48,28 +60,11 @@ class DataSourceManager:
     
     def _handle_test_data_source(self) -> str:
         """Handle the test data source."""
-        return (
-            "TEST DATA SOURCE ACTIVE: This is a demonstration data source that provides "
-            "sample test data. It contains simulated information for testing purposes "
-            "and should not be used for production queries. The test data includes "
-            "fictional user records, mock transactions, and placeholder content "
-            "designed to validate data source integration functionality."
-        )
+        return prompt_registry.get("data_sources", "data-test") or ""
     
     def _handle_new_mexico_history(self) -> str:
         """Handle the New Mexico history data source."""
-        return (
-            "NEW MEXICO HISTORICAL DATA SOURCE: You now have access to comprehensive "
-            "historical information about New Mexico. This includes data about the state's "
-            "rich cultural heritage spanning from ancient Pueblo civilizations through "
-            "Spanish colonization (1598), Mexican territorial period (1821-1846), "
-            "and U.S. statehood (1912). Key topics include: Native American tribes "
-            "(Pueblo, Navajo, Apache), Spanish colonial missions, the Santa Fe Trail, "
-            "territorial conflicts, mining history, nuclear research at Los Alamos, "
-            "and the unique tri-cultural blend of Native American, Hispanic, and Anglo "
-            "influences that define modern New Mexico. The state capital Santa Fe "
-            "is one of the oldest continuously inhabited cities in the United States."
-        )
+        return prompt_registry.get("data_sources", "new-mexico-history") or ""
 
 
 # Global instance
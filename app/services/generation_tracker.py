@@ -0,0 +1,122 @@
+"""
+In-flight LLM generations, cancellable per session.
+
+A generation reads its upstream stream in a task of its own and hands the
+events over through a queue, so cancelling it (client disconnected, user
+pressed stop) aborts the upstream HTTP stream at once without touching
+the task that writes the response. Content deltas are coalesced on the
+way into the queue.
+"""
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+from app.config import settings
+from app.services.stream_coalescer import StreamCoalescer
+from app.services.stream_events import StreamDelta
+
+_END = object()
+
+
+class Generation:
+    def __init__(self, tracker: "GenerationTracker", session_id: str,
+                 open_stream: Callable[[], Awaitable[AsyncIterator[StreamDelta]]]):
+        self.session_id = session_id
+        self.cancel_reason: Optional[str] = None
+        self._tracker = tracker
+        self._open_stream = open_stream
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def events(self) -> AsyncIterator[StreamDelta]:
+        """Upstream events as they arrive; ends early once the generation is cancelled."""
+        self._task = asyncio.create_task(self._pump())
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Finished, cancelled, or the reader went away: nothing more is read upstream
+            self._task.cancel()
+            self._tracker._finish(self)
+
+    def cancel(self, reason: str) -> bool:
+        """Abort the upstream stream; returns False if it had already ended or been cancelled."""
+        if self.cancel_reason is not None or self._task is None or self._task.done():
+            return False
+        self.cancel_reason = reason
+        self._task.cancel()
+        self._tracker.cancelled[reason] = self._tracker.cancelled.get(reason, 0) + 1
+        return True
+
+    async def _pump(self):
+        coalescer = StreamCoalescer(self._queue.put_nowait, self._tracker.coalesce_window_seconds,
+                                    self._tracker.coalesce_max_bytes)
+        try:
+            stream = await self._open_stream()
+            async with aclosing(stream):
+                async for event in stream:
+                    coalescer.push(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            coalescer.flush()
+            self._queue.put_nowait(e)
+            return
+        finally:
+            self._tracker.deltas_received += coalescer.received
+            self._tracker.deltas_sent += coalescer.sent
+        # Buffered content is still delivered after a cancel, so the partial answer is complete
+        coalescer.flush()
+        self._queue.put_nowait(_END)
+
+
+class GenerationTracker:
+    def __init__(self, coalesce_window_seconds: float = 0.0, coalesce_max_bytes: int = 1024):
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self.coalesce_max_bytes = coalesce_max_bytes
+        self._active: Dict[str, Set[Generation]] = {}
+        self.started = 0
+        # Cancelled generations per reason
+        self.cancelled: Dict[str, int] = {}
+        # Content deltas from providers, and the coalesced deltas sent on
+        self.deltas_received = 0
+        self.deltas_sent = 0
+
+    def start(self, session_id: str, open_stream: Callable[[], Awaitable[AsyncIterator[StreamDelta]]]) -> Generation:
+        """Track a generation; the upstream call is made when its events are first read."""
+        generation = Generation(self, session_id, open_stream)
+        self._active.setdefault(session_id, set()).add(generation)
+        self.started += 1
+        return generation
+
+    def cancel(self, session_id: str, reason: str) -> int:
+        """Cancel the session's in-flight generations; returns how many were cancelled."""
+        return sum(generation.cancel(reason) for generation in list(self._active.get(session_id, ())))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": sum(len(generations) for generations in self._active.values()),
+            "started": self.started,
+            "cancelled": dict(self.cancelled),
+            "coalesce_window_ms": self.coalesce_window_seconds * 1000,
+            "deltas_received": self.deltas_received,
+            "deltas_sent": self.deltas_sent,
+        }
+
+    def _finish(self, generation: Generation):
+        generations = self._active.get(generation.session_id)
+        if generations is not None:
+            generations.discard(generation)
+            if not generations:
+                del self._active[generation.session_id]
+
+
+# Global instance
+generation_tracker = GenerationTracker(
+    coalesce_window_seconds=settings.stream_coalesce_window_ms / 1000,
+    coalesce_max_bytes=settings.stream_coalesce_max_bytes,
+)
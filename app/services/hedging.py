@@ -0,0 +1,76 @@
+"""
+Hedged streaming requests.
+
+Time to first token is tracked per model. When hedging is on and a stream
+has not produced its first token within a high percentile of that
+model's recent times, a second request is sent (to the same model or to
+the equivalent set as hedge_with in llms.yml) and the first to start
+streaming wins.
+"""
+import math
+import threading
+from collections import deque
+from typing import Any, Dict
+from app.config import settings
+
+
+class Hedger:
+    def __init__(self,
+                 enabled: bool = False,
+                 percentile: float = 95.0,
+                 min_samples: int = 20,
+                 window_size: int = 200,
+                 default_delay: float = 2.0,
+                 min_delay: float = 0.25,
+                 max_delay: float = 10.0):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+
+    def record(self, llm_name: str, ttft_seconds: float):
+        """Record one observed time to first token."""
+        with self._lock:
+            samples = self._samples.get(llm_name)
+            if samples is None:
+                samples = self._samples[llm_name] = deque(maxlen=self.window_size)
+            samples.append(ttft_seconds)
+
+    def delay_for(self, llm_name: str) -> float:
+        """Seconds to wait for the first token before hedging, from the model's recent percentile."""
+        with self._lock:
+            samples = sorted(self._samples.get(llm_name, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        # Nearest-rank percentile
+        index = max(0, math.ceil(len(samples) * self.percentile / 100) - 1)
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "delays": {name: round(self.delay_for(name), 3) for name in list(self._samples)},
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+        }
+
+
+# Global instance
+hedger = Hedger(
+    enabled=settings.hedging_enabled,
+    percentile=settings.hedge_percentile,
+    min_samples=settings.hedge_min_samples,
+    default_delay=settings.hedge_default_delay_seconds,
+    min_delay=settings.hedge_min_delay_seconds,
+    max_delay=settings.hedge_max_delay_seconds,
+)
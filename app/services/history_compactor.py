@@ -0,0 +1,139 @@
+"""
+Background compaction of long conversation histories.
+
+When a session's context passes a token threshold, the older turns are
+summarized by a cheap model in a background task, and the summary stands
+in for them in the context sent to the model. The stored history is kept
+as it was, for downloads. Requests never wait for it: they keep using the
+full context until the summary lands. Off unless compaction_enabled is set.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+from app.config import settings
+from app.services.context_window import context_window_manager
+from app.services.llm_client import llm_client
+from app.services.session_manager import session_manager
+from app.utils.session_logger import log_session_event
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the following conversation so it can replace the original messages "
+    "as context for continuing it. Keep facts, decisions, names, numbers and open "
+    "questions; drop pleasantries. Reply with the summary only."
+)
+
+
+class HistoryCompactor:
+    def __init__(self,
+                 llm_name: str = "Claude 3.5 Haiku",
+                 threshold_tokens: int = 6000,
+                 keep_recent_messages: int = 6,
+                 enabled: bool = True):
+        self.llm_name = llm_name
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.enabled = enabled
+        self._in_progress: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.compacted = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def maybe_schedule(self, session_id: str) -> Optional[asyncio.Task]:
+        """Start a compaction task if the session's history is over the threshold."""
+        if not self.enabled or settings.disable_llm_calls or session_id in self._in_progress:
+            return None
+        messages = session_manager.context_messages(session_id)
+        if messages is None:
+            return None
+        if context_window_manager.count_tokens(session_id, messages) < self.threshold_tokens:
+            return None
+        if not self._compactable(messages):
+            return None
+
+        self._in_progress.add(session_id)
+        self.scheduled += 1
+        task = asyncio.create_task(self.compact(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def compact(self, session_id: str) -> bool:
+        """Summarize the older turns of a session and swap the summary in."""
+        try:
+            messages = session_manager.context_messages(session_id)
+            if messages is None:
+                return False
+            compacted = self._compactable(messages)
+            if not compacted:
+                return False
+            try:
+                summary = await self._summarize(compacted)
+            except Exception as e:
+                self.failed += 1
+                log_session_event(session_id, {"event": "history_compaction_failed", "error": str(e)})
+                return False
+            summary_message = {"role": "user", "content": SUMMARY_PREFIX + summary}
+            if session_manager.compact_history(session_id, compacted, summary_message):
+                self.compacted += 1
+                return True
+            # The history was replaced while summarizing; try again after the next turn
+            self.skipped += 1
+            return False
+        finally:
+            self._in_progress.discard(session_id)
+
+    async def stop(self):
+        """Cancel compactions still running."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "llm_name": self.llm_name,
+            "in_progress": len(self._in_progress),
+            "scheduled": self.scheduled,
+            "compacted": self.compacted,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+    def _compactable(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The messages after the system message that would be summarized (empty if too few)."""
+        if not messages or messages[0].get("role") != "system":
+            return []
+        cut = len(messages) - self.keep_recent_messages
+        # Keep the recent part starting on a user turn
+        while 1 < cut < len(messages) and messages[cut].get("role") != "user":
+            cut += 1
+        return messages[1:cut] if 3 <= cut < len(messages) else []
+
+    async def _summarize(self, messages: List[Dict[str, Any]]) -> str:
+        transcript = "\n\n".join(
+            f"{message.get('role', 'unknown').capitalize()}: {message.get('content', '')}" for message in messages
+        )
+        response = await llm_client.achat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": transcript},
+            ],
+            llm_name=self.llm_name,
+        )
+        summary = response.json()["choices"][0]["message"]["content"].strip()
+        if not summary:
+            raise ValueError("Empty summary")
+        return summary
+
+
+# Global instance
+history_compactor = HistoryCompactor(
+    llm_name=settings.compaction_llm_name,
+    threshold_tokens=settings.compaction_threshold_tokens,
+    keep_recent_messages=settings.compaction_keep_recent_messages,
+    enabled=settings.compaction_enabled,
+)
@@ -0,0 +1,91 @@
+"""
+Shared HTTP connection pools for outbound LLM provider traffic.
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Tuple
+import httpx
+from app.config import settings
+
+
+class HTTPClientPool:
+    """Keeps one size-bounded keep-alive connection pool per provider base URL."""
+
+    def __init__(self,
+                 max_connections: int = 200,
+                 max_keepalive_connections: int = 50,
+                 keepalive_expiry: float = 30.0):
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._lock = threading.Lock()
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        # Async pools are bound to the event loop that opened their connections
+        self._async_clients: Dict[str, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self.retired_async_pools = 0
+
+    def get_client(self, base_url: str) -> httpx.Client:
+        """Get the pooled synchronous client for a base URL."""
+        with self._lock:
+            client = self._sync_clients.get(base_url)
+            if client is None:
+                client = httpx.Client(limits=self._limits, timeout=None)
+                self._sync_clients[base_url] = client
+            return client
+
+    def get_async_client(self, base_url: str) -> httpx.AsyncClient:
+        """Get the pooled async client for a base URL on the running event loop."""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(base_url)
+        if entry is None or entry[0] is not loop:
+            if entry is not None:
+                self._retire(*entry)
+            client = httpx.AsyncClient(limits=self._limits, timeout=None)
+            self._async_clients[base_url] = (loop, client)
+            return client
+        return entry[1]
+
+    def _retire(self, owner: asyncio.AbstractEventLoop, client: httpx.AsyncClient):
+        """Close a pool replaced by one for another event loop."""
+        self.retired_async_pools += 1
+        if owner.is_closed():
+            # Its loop can't run aclose() any more; the sockets close when the client is collected
+            return
+        # Connections belong to the old loop, so they are closed there (once it runs again)
+        asyncio.run_coroutine_threadsafe(client.aclose(), owner)
+
+    async def aclose(self):
+        """Close all pools owned by the running event loop."""
+        loop = asyncio.get_running_loop()
+        for base_url, (owner, client) in list(self._async_clients.items()):
+            if owner is loop:
+                await client.aclose()
+                del self._async_clients[base_url]
+        self.close()
+
+    def close(self):
+        """Close all synchronous pools."""
+        with self._lock:
+            for client in self._sync_clients.values():
+                client.close()
+            self._sync_clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool counts and limits."""
+        return {
+            "sync_pools": len(self._sync_clients),
+            "async_pools": len(self._async_clients),
+            "retired_async_pools": self.retired_async_pools,
+            "max_connections": self._limits.max_connections,
+            "max_keepalive_connections": self._limits.max_keepalive_connections,
+        }
+
+
+# Global instance
+http_pool = HTTPClientPool(
+    max_connections=settings.llm_pool_max_connections,
+    max_keepalive_connections=settings.llm_pool_max_keepalive,
+    keepalive_expiry=settings.llm_pool_keepalive_expiry,
+)
@@ -1,153 +1,791 @@
-import requests
-import json
-from app.config import settings
-from app.services.tool_manager import tool_manager
-from app.services.llm_config_manager import LLMConfigManager
-
-class LLMClient:
-    def __init__(self):
-        self.llm_config_manager = LLMConfigManager(settings.llm_config_file)
-        self.current_llm_name = "Claude 3.5 Sonnet" # Default LLM
-        self._set_current_llm_config()
-
-    def _set_current_llm_config(self):
-        config = self.llm_config_manager.get_llm_config(self.current_llm_name)
-        self.provider = config.provider.lower()
-        self.base_url = config.base_url or "https://api.anthropic.com/v1"  # fallback
-        self.api_key = config.api_key
-        self.model_name = config.model
-
-    def set_llm(self, llm_name: str):
-        if llm_name not in self.llm_config_manager.get_all_llm_names():
-            raise ValueError(f"LLM '{llm_name}' not found in configuration.")
-        self.current_llm_name = llm_name
-        self._set_current_llm_config()
-
-    def get_available_llms(self):
-        return self.llm_config_manager.get_all_llm_names()
-
-    def chat_completion(self, messages: list, stream: bool = False, tools: list = None):
-        if self.provider == "anthropic":
-            return self._anthropic_chat_completion(messages, stream, tools)
-        elif self.provider == "openai":
-            return self._openai_chat_completion(messages, stream, tools)
-        else:
-            raise ValueError(f"Unsupported LLM provider: {self.provider}")
-
-    def _openai_chat_completion(self, messages: list, stream: bool = False, tools: list = None):
-        """OpenAI API implementation"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "stream": stream
-        }
-        if tools:
-            payload["tools"] = tools
-
-        try:
-            response = requests.post(f"{self.base_url}/chat/completions", headers=headers, json=payload, stream=stream)
-            response.raise_for_status()
-            if stream:
-                return response.iter_lines()
-            return response
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"OpenAI API request failed: {e}")
-
-    def _anthropic_chat_completion(self, messages: list, stream: bool = False, tools: list = None):
-        """Anthropic API implementation"""
-        # Convert OpenAI format messages to Anthropic format
-        anthropic_messages = []
-        system_message = None
-        
-        for msg in messages:
-            if msg["role"] == "system":
-                system_message = msg["content"]
-            elif msg["role"] == "user":
-                anthropic_messages.append({
-                    "role": "user",
-                    "content": msg["content"]
-                })
-            elif msg["role"] == "assistant":
-                anthropic_messages.append({
-                    "role": "assistant", 
-                    "content": msg.get("content", "")
-                })
-            elif msg["role"] == "tool":
-                # For tool responses, we'll append to the last assistant message
-                if anthropic_messages and anthropic_messages[-1]["role"] == "assistant":
-                    anthropic_messages[-1]["content"] += f"\n\nTool result: {msg['content']}"
-
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01"
-        }
-        
-        payload = {
-            "model": self.model_name,
-            "messages": anthropic_messages,
-            "max_tokens": 1000,
-            "stream": stream
-        }
-        
-        if system_message:
-            payload["system"] = system_message
-
-        try:
-            response = requests.post(f"{self.base_url}/messages", headers=headers, json=payload, stream=stream)
-            response.raise_for_status()
-            
-            if stream:
-                return self._anthropic_stream_wrapper(response.iter_lines())
-            else:
-                # Convert Anthropic response format to OpenAI-like format for compatibility
-                anthropic_response = response.json()
-                openai_format = {
-                    "choices": [{
-                        "message": {
-                            "role": "assistant",
-                            "content": anthropic_response.get("content", [{}])[0].get("text", "")
-                        }
-                    }]
-                }
-                
-                # Create a mock response object with json() method
-                class MockResponse:
-                    def __init__(self, data):
-                        self.data = data
-                    def json(self):
-                        return self.data
-                
-                return MockResponse(openai_format)
-                
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Anthropic API request failed: {e}")
-
-    def _anthropic_stream_wrapper(self, stream):
-        """Convert Anthropic streaming format to OpenAI-like format"""
-        for line in stream:
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    try:
-                        data = json.loads(line[6:])
-                        if data.get('type') == 'content_block_delta':
-                            # Convert to OpenAI-like streaming format
-                            openai_chunk = {
-                                "choices": [{
-                                    "delta": {
-                                        "content": data.get('delta', {}).get('text', '')
-                                    }
-                                }]
-                            }
-                            yield f"data: {json.dumps(openai_chunk)}\n\n".encode('utf-8')
-                        elif data.get('type') == 'message_stop':
-                            yield b"data: [DONE]\n\n"
-                    except json.JSONDecodeError:
-                        continue
-
-llm_client = LLMClient()
+import asyncio
+import httpx
+import time
+from contextlib import aclosing, closing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+from app.config import settings
+from app.services.tool_manager import tool_manager
+from app.services.llm_config_manager import LLMConfigManager
+from app.services.http_pool import http_pool
+from app.services.response_cache import response_cache, cache_key
+from app.services.single_flight import single_flight
+from app.services.rate_limiter import Limits, Permit, QueueFull, rate_limiter
+from app.services.circuit_breaker import CircuitOpen, circuit_breakers
+from app.services.hedging import hedger
+from app.services.token_counter import token_counter
+from app.services.request_policy import RETRYABLE_STATUS, DeadlineExceeded, parse_retry_after, request_policy
+from app.services.stream_events import DONE, StreamDelta, anthropic_usage, openai_usage, status_event, stream_parser
+
+# Characters per event when a cached response is replayed as a stream
+REPLAY_CHUNK_CHARS = 32
+
+
+class CompletionResponse:
+    """Response wrapper exposing a json() method like the provider responses."""
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@dataclass(frozen=True)
+class ProviderHandle:
+    """Immutable, resolved view of one configured LLM, safe to share across requests."""
+    name: str
+    provider: str
+    base_url: str
+    api_key: Optional[str]
+    model: str
+    prompt_caching: bool = False
+    context_budget_tokens: Optional[int] = None
+    limits: Limits = Limits()
+    provider_limits: Limits = Limits()
+    fallbacks: Tuple[str, ...] = ()
+    hedge_with: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return "Anthropic" if self.provider == "anthropic" else "OpenAI"
+
+
+class LLMClient:
+    def __init__(self):
+        self.llm_config_manager = LLMConfigManager(settings.llm_config_file)
+        self.current_llm_name = "Claude 3.5 Sonnet" # Default LLM
+        self._providers: Dict[str, ProviderHandle] = {}
+        # Token usage totals per LLM name, including prompt cache reads and writes
+        self.usage_totals: Dict[str, Dict[str, int]] = {}
+        self.response_cache = response_cache
+        self.single_flight = single_flight
+        self.rate_limiter = rate_limiter
+        self.request_policy = request_policy
+        # Retried attempts per LLM name
+        self.retry_totals: Dict[str, int] = {}
+        self.circuit_breakers = circuit_breakers
+        # Calls served by a fallback, per "requested -> used" pair
+        self.fallback_totals: Dict[str, int] = {}
+        self.hedger = hedger
+
+    def get_provider(self, llm_name: Optional[str] = None) -> ProviderHandle:
+        """
+        Resolve an LLM name to its cached provider handle.
+
+        Handles are built once per name and never mutated, so concurrent
+        requests for different models share no state. None selects the default LLM.
+        """
+        llm_name = llm_name or self.current_llm_name
+        handle = self._providers.get(llm_name)
+        if handle is None:
+            if llm_name not in self.llm_config_manager.llm_configs:
+                raise ValueError(f"LLM '{llm_name}' not found in configuration.")
+            config = self.llm_config_manager.get_llm_config(llm_name)
+            provider_limits = self.llm_config_manager.get_provider_limits(config.provider)
+            handle = ProviderHandle(
+                name=config.name,
+                provider=config.provider.lower(),
+                base_url=config.base_url or "https://api.anthropic.com/v1",  # fallback
+                api_key=config.api_key,
+                model=config.model,
+                prompt_caching=config.prompt_caching,
+                context_budget_tokens=config.context_budget_tokens,
+                limits=Limits(config.max_concurrency, config.requests_per_minute, config.tokens_per_minute),
+                provider_limits=Limits(provider_limits.max_concurrency, provider_limits.requests_per_minute,
+                                       provider_limits.tokens_per_minute),
+                fallbacks=tuple(config.fallbacks),
+                hedge_with=config.hedge_with,
+            )
+            self._providers[llm_name] = handle
+        return handle
+
+    def set_llm(self, llm_name: str):
+        """Change the default LLM used when a caller does not name one."""
+        self.get_provider(llm_name)
+        self.current_llm_name = llm_name
+
+    def get_available_llms(self):
+        return self.llm_config_manager.get_all_llm_names()
+
+    def chat_completion(self, messages: list, stream: bool = False, tools: list = None,
+                        llm_name: Optional[str] = None):
+        """Synchronous chat completion, kept for startup checks and scripts."""
+        llm = self.get_provider(llm_name)
+        key = self._response_cache_key(llm, messages, tools)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return iter(_replay_events(cached)) if stream else _cached_completion_response(cached)
+
+        url, headers, payload = self._prepare_request(llm, messages, stream, tools)
+        client = http_pool.get_client(llm.base_url)
+        timeout = self.request_policy.timeout(self.request_policy.new_deadline())
+        try:
+            request = client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+            response = client.send(request, stream=stream)
+            try:
+                response.raise_for_status()
+            except httpx.HTTPError:
+                response.close()
+                raise
+        except httpx.HTTPError as e:
+            raise Exception(f"{llm.label} API request failed: {e}")
+
+        if stream:
+            events = self._iter_stream_events(llm, response)
+            return self._record_stream(key, events) if key else events
+        return self._store_completion(key, self._to_completion_response(llm, response))
+
+    async def achat_completion(self, messages: list, stream: bool = False, tools: list = None,
+                               llm_name: Optional[str] = None, deadline: Optional[float] = None):
+        """
+        Async chat completion over the shared per-provider connection pool.
+
+        Returns a response object with a json() method, or an async iterator of
+        StreamDelta events when streaming. Connection and HTTP status errors
+        are raised here, before the first event is yielded. llm_name binds the
+        call to one configured model without touching the client's default.
+
+        With the response cache enabled, an identical earlier request is
+        answered from the cache, replayed as a synthetic stream when streaming.
+        Identical requests already in flight share one upstream call. When
+        the model's circuit is open, or it fails before its first token, the
+        next model in its fallback chain answers instead.
+
+        deadline is a time.monotonic() timestamp bounding the whole call,
+        including queueing and retries; without one the default applies.
+        """
+        llm = self.get_provider(llm_name)
+        if deadline is None:
+            deadline = self.request_policy.new_deadline()
+        key = self._response_cache_key(llm, messages, tools)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return _areplay(cached) if stream else _cached_completion_response(cached)
+
+        send = lambda: self._afailover(llm, messages, stream, tools, key, deadline)
+        if not self.single_flight.enabled:
+            return await send()
+        flight_key = key or self._request_key(llm, messages, tools)
+        if stream:
+            return await self.single_flight.stream(flight_key, send)
+        return await self.single_flight.call(flight_key, send)
+
+    async def _afailover(self, llm: ProviderHandle, messages: list, stream: bool, tools: list, key: Optional[str],
+                         deadline: Optional[float]):
+        """
+        Call llm, or the first model of its fallback chain that is available.
+
+        Models whose circuit is open are skipped without a call. If every
+        model fails, the requested model's error is raised. A stream served
+        by a fallback starts with a status event naming the model used.
+        """
+        first_error = None
+        for candidate in self._candidates(llm):
+            scopes = _circuit_scopes(candidate)
+            if not self.circuit_breakers.allow(scopes):
+                continue
+            try:
+                # Responses are only cached under the model that was asked for
+                result = await self._asend(candidate, messages, stream, tools, key if candidate is llm else None,
+                                           deadline, scopes)
+            except (_ClientError, QueueFull, DeadlineExceeded):
+                raise
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if candidate is not llm:
+                pair = f"{llm.name} -> {candidate.name}"
+                self.fallback_totals[pair] = self.fallback_totals.get(pair, 0) + 1
+                if stream:
+                    result = _aprepend(_fallback_status(llm, candidate), result)
+            return result
+        if first_error is not None:
+            raise first_error
+        raise CircuitOpen(f"{llm.name} is unavailable (circuit open) and no fallback model is available")
+
+    async def _asend(self, llm: ProviderHandle, messages: list, stream: bool, tools: list, key: Optional[str],
+                     deadline: Optional[float], scopes: Optional[list] = None):
+        """
+        Send one request upstream, recording the response in the cache when key is set.
+
+        Waits for the provider's and model's concurrency and rate limits first;
+        a stream starts with a status event when the request had to queue.
+        The outcome and time to first token are recorded in the circuit
+        breakers of scopes, which the caller has checked.
+        """
+        scopes = scopes or []
+        if stream:
+            opened, permit = await self._alimited(llm, messages, deadline, scopes,
+                                                  lambda: self._aopen_stream(llm, messages, tools, deadline))
+            first, events, used, hedge_permit = opened
+            if hedge_permit is not None:
+                # The hedge answered under its own permit; the primary request's slot is free again
+                permit.release()
+                permit = hedge_permit
+            events = self._ahold_permit(used, permit, self._astream_rest(used, first, events, deadline))
+            if used is not llm:
+                # Answered by the hedge_with model: say so, and don't cache it as this model's answer
+                return _aprepend(_hedge_status(llm, used), events)
+            return self._arecord_stream(key, events) if key else events
+        opened, permit = await self._alimited(llm, messages, deadline, scopes,
+                                              lambda: self._aopen(llm, messages, stream, tools, deadline))
+        try:
+            return self._store_completion(key, self._to_completion_response(llm, opened))
+        finally:
+            permit.release()
+
+    async def _alimited(self, llm: ProviderHandle, messages: list, deadline: Optional[float], scopes: list,
+                        open_request: Callable[[], Awaitable[Any]], permit: Optional[Permit] = None):
+        """
+        Wait for llm's provider and model limits (unless permit already holds them), then call open_request.
+
+        The outcome and latency are recorded in the circuit breakers of
+        scopes, which the caller has checked. Returns the result and the
+        rate limiter permit, which the caller releases.
+        """
+        if permit is None:
+            try:
+                permit = await self.rate_limiter.acquire(
+                    _limit_scopes(llm), tokens=self._estimate_tokens(llm, messages), deadline=deadline)
+            except BaseException:
+                self.circuit_breakers.abandon(scopes)
+                raise
+        started = time.monotonic()
+        try:
+            opened = await open_request()
+        except (_ClientError, DeadlineExceeded):
+            # The provider answered, or we ran out of time; neither says the provider is unhealthy
+            permit.release()
+            self.circuit_breakers.abandon(scopes)
+            raise
+        except Exception:
+            permit.release()
+            self.circuit_breakers.record(scopes, success=False)
+            raise
+        except BaseException:
+            permit.release()
+            self.circuit_breakers.abandon(scopes)
+            raise
+        self.circuit_breakers.record(scopes, success=True, latency=time.monotonic() - started)
+        return opened, permit
+
+    async def _aopen(self, llm: ProviderHandle, messages: list, stream: bool, tools: list, deadline: Optional[float]):
+        """
+        Send the request, retrying transient failures until the first token arrives.
+
+        Returns the response, or for a stream its first event (None if the
+        stream was empty) and the iterator over the remaining events.
+        """
+        url, headers, payload = self._prepare_request(llm, messages, stream, tools)
+        attempt = 0
+        while True:
+            try:
+                return await self._aattempt(llm, url, headers, payload, stream, deadline)
+            except _RetryableError as e:
+                delay = self.request_policy.backoff(attempt, e.retry_after)
+                if not self.request_policy.should_retry(attempt, delay, deadline):
+                    raise Exception(f"{llm.label} API request failed: {e}")
+                self.retry_totals[llm.name] = self.retry_totals.get(llm.name, 0) + 1
+                print(f"{llm.name} request failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _aopen_stream(self, llm: ProviderHandle, messages: list, tools: list, deadline: Optional[float]):
+        """
+        Open a stream up to its first event, hedging a slow start when hedging is on.
+
+        If the first event takes longer than the hedge delay, a second request
+        goes to llm's hedge_with model (or llm again); the first stream to
+        start wins and the other request is cancelled. The hedge goes through
+        its model's circuit breakers and rate limits like any request, and is
+        skipped when they have no room for it right away. Returns the first
+        event, the remaining events, the model that answered and, if the
+        hedge answered, its permit.
+        """
+        started = time.monotonic()
+        if not self.hedger.enabled:
+            first, events = await self._aopen(llm, messages, True, tools, deadline)
+            self.hedger.record(llm.name, time.monotonic() - started)
+            return first, events, llm, None
+
+        primary = asyncio.ensure_future(self._aopen(llm, messages, True, tools, deadline))
+        racers = {primary: llm}
+        pending = {primary}
+        winner = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedger.delay_for(llm.name))
+            if not done:
+                hedge_llm = self._hedge_target(llm)
+                hedge = await self._astart_hedge(hedge_llm, messages, tools, deadline)
+                if hedge is not None:
+                    racers[hedge] = hedge_llm
+                    pending.add(hedge)
+                    self.hedger.hedged += 1
+            while winner is None:
+                for task in sorted(done, key=lambda task: task is not primary):
+                    if task.exception() is not None:
+                        continue
+                    if task is primary:
+                        self.hedger.record(llm.name, time.monotonic() - started)
+                    if winner is None:
+                        winner = task
+                    else:
+                        # Both started at once; drop the spare stream
+                        _, spare, *held = task.result()
+                        await spare.aclose()
+                        for permit in held:
+                            permit.release()
+                if winner is not None or not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # The loser is cancelled as soon as there is a winner, so its tokens aren't paid for
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            raise primary.exception()
+        if primary in pending:
+            # The primary hadn't started when the hedge won: its time to first token is at least this
+            self.hedger.record(llm.name, time.monotonic() - started)
+        if len(racers) > 1:
+            if winner is primary:
+                self.hedger.primary_wins += 1
+            else:
+                self.hedger.hedge_wins += 1
+        first, events, *held = winner.result()
+        return first, events, racers[winner], held[0] if held else None
+
+    async def _astart_hedge(self, hedge_llm: ProviderHandle, messages: list, tools: list,
+                            deadline: Optional[float]) -> Optional[asyncio.Future]:
+        """
+        Start the hedge request to hedge_llm, or return None if its circuit is
+        open or its concurrency or rate limits have no room for it right now.
+        """
+        scopes = _circuit_scopes(hedge_llm)
+        if not self.circuit_breakers.allow(scopes):
+            return None
+        permit = await self.rate_limiter.try_acquire(_limit_scopes(hedge_llm),
+                                                     tokens=self._estimate_tokens(hedge_llm, messages))
+        if permit is None:
+            self.circuit_breakers.abandon(scopes)
+            return None
+        hedge = asyncio.ensure_future(self._aopen_hedge(hedge_llm, messages, tools, deadline, scopes, permit))
+
+        def release_if_cancelled(task: asyncio.Future):
+            # Cancelled before it ran, the request never got to release them itself
+            if task.cancelled():
+                permit.release()
+                self.circuit_breakers.abandon(scopes)
+
+        hedge.add_done_callback(release_if_cancelled)
+        return hedge
+
+    async def _aopen_hedge(self, hedge_llm: ProviderHandle, messages: list, tools: list, deadline: Optional[float],
+                           scopes: list, permit: Permit):
+        """Open the hedge under its permit; returns the first event, the rest and the permit."""
+        opened, permit = await self._alimited(hedge_llm, messages, deadline, scopes,
+                                              lambda: self._aopen(hedge_llm, messages, True, tools, deadline),
+                                              permit=permit)
+        first, events = opened
+        return first, events, permit
+
+    def _hedge_target(self, llm: ProviderHandle) -> ProviderHandle:
+        if llm.hedge_with:
+            try:
+                return self.get_provider(llm.hedge_with)
+            except ValueError:
+                print(f"Unknown hedge_with model '{llm.hedge_with}' for {llm.name}, hedging with the same model")
+        return llm
+
+    async def _aattempt(self, llm: ProviderHandle, url: str, headers: dict, payload: dict, stream: bool,
+                        deadline: Optional[float]):
+        client = http_pool.get_async_client(llm.base_url)
+        timeout = self.request_policy.timeout(deadline)
+        try:
+            request = client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            raise _RetryableError(_describe(e))
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            await response.aclose()
+            if response.status_code in RETRYABLE_STATUS:
+                raise _RetryableError(str(e), parse_retry_after(response.headers))
+            raise _ClientError(f"{llm.label} API request failed: {e}")
+        if not stream:
+            return response
+
+        events = self._aiter_stream_events(llm, response)
+        first_token_timeout = self.request_policy.first_token_timeout(deadline)
+        try:
+            first = await asyncio.wait_for(anext(events, None), first_token_timeout)
+        except asyncio.TimeoutError:
+            await events.aclose()
+            raise _RetryableError(f"no response within {first_token_timeout:g}s")
+        except httpx.TransportError as e:
+            await events.aclose()
+            raise _RetryableError(_describe(e))
+        return first, events
+
+    async def _astream_rest(self, llm: ProviderHandle, first: Optional[StreamDelta], events: AsyncIterator[StreamDelta],
+                            deadline: Optional[float]) -> AsyncIterator[StreamDelta]:
+        """Yield the first event and the rest of the stream; a stall or the deadline ends it with an error."""
+        async with aclosing(events):
+            if first is None:
+                return
+            yield first
+            try:
+                while True:
+                    wait = self.request_policy.idle_wait(deadline)
+                    try:
+                        async with asyncio.timeout(wait):
+                            event = await anext(events)
+                    except StopAsyncIteration:
+                        return
+                    except TimeoutError:
+                        if wait < self.request_policy.idle_timeout:
+                            raise DeadlineExceeded(f"{llm.label} response passed the request deadline")
+                        raise Exception(f"{llm.label} stream stalled: no data for {wait:g}s")
+                    yield event
+            except httpx.TransportError as e:
+                raise Exception(f"{llm.label} stream failed: {_describe(e)}")
+
+    def fallback_stats(self) -> Dict[str, int]:
+        """Get calls served by a fallback model, per requested -> used pair."""
+        return dict(self.fallback_totals)
+
+    def retry_stats(self) -> Dict[str, int]:
+        """Get retried attempts per LLM."""
+        return dict(self.retry_totals)
+
+    def usage_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get token usage totals per LLM, including prompt cache reads and writes."""
+        return {name: dict(totals) for name, totals in self.usage_totals.items()}
+
+    async def aclose(self):
+        """Release pooled provider connections."""
+        await http_pool.aclose()
+
+    def _candidates(self, llm: ProviderHandle) -> list:
+        candidates = [llm]
+        for name in llm.fallbacks:
+            try:
+                fallback = self.get_provider(name)
+            except ValueError:
+                print(f"Skipping unknown fallback '{name}' of {llm.name}")
+                continue
+            if fallback not in candidates:
+                candidates.append(fallback)
+        return candidates
+
+    def _estimate_tokens(self, llm: ProviderHandle, messages: list) -> int:
+        """Input tokens of a request, counted only when a token bucket applies."""
+        if not (llm.limits.tokens_per_minute or llm.provider_limits.tokens_per_minute):
+            return 0
+        return sum(token_counter.count_message(message, llm.provider) for message in messages)
+
+    async def _ahold_permit(self, llm: ProviderHandle, permit: Permit,
+                            events: AsyncIterator[StreamDelta]) -> AsyncIterator[StreamDelta]:
+        """Yield the stream events, holding the rate limiter permit until the stream ends."""
+        try:
+            if permit.queued:
+                yield _queued_status(llm, permit)
+            async with aclosing(events):
+                async for event in events:
+                    yield event
+        finally:
+            permit.release()
+
+    def _response_cache_key(self, llm: ProviderHandle, messages: list, tools: list) -> Optional[str]:
+        if not self.response_cache.enabled:
+            return None
+        return self._request_key(llm, messages, tools)
+
+    def _request_key(self, llm: ProviderHandle, messages: list, tools: list) -> str:
+        return cache_key(f"{llm.provider}:{llm.model}", messages, {"tools": _sorted_tools(tools) if tools else None})
+
+    def _store_completion(self, key: Optional[str], response):
+        if key:
+            data = response.json()
+            message = data["choices"][0]["message"]
+            content = message.get("content") or ""
+            # Only plain text answers are cached; tool calls must reach the model again
+            if content and not message.get("tool_calls"):
+                self.response_cache.put(key, {"content": content, "usage": data.get("usage")})
+        return response
+
+    def _record_stream(self, key: str, events: Iterator[StreamDelta]) -> Iterator[StreamDelta]:
+        """Pass stream events through, caching the response once it completes."""
+        recorder = _StreamRecorder()
+        with closing(events):
+            for event in events:
+                recorder.feed(event)
+                yield event
+        recorder.store(self.response_cache, key)
+
+    async def _arecord_stream(self, key: str, events: AsyncIterator[StreamDelta]) -> AsyncIterator[StreamDelta]:
+        """Async variant of _record_stream."""
+        recorder = _StreamRecorder()
+        async with aclosing(events):
+            async for event in events:
+                recorder.feed(event)
+                yield event
+        recorder.store(self.response_cache, key)
+
+    def _prepare_request(self, llm: ProviderHandle, messages: list, stream: bool, tools: list) -> Tuple[str, dict, dict]:
+        if llm.provider == "anthropic":
+            return self._anthropic_request(llm, messages, stream, tools)
+        elif llm.provider == "openai":
+            return self._openai_request(llm, messages, stream, tools)
+        else:
+            raise ValueError(f"Unsupported LLM provider: {llm.provider}")
+
+    def _openai_request(self, llm: ProviderHandle, messages: list, stream: bool = False, tools: list = None) -> Tuple[str, dict, dict]:
+        """OpenAI API request"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {llm.api_key}"
+        }
+        payload = {
+            "model": llm.model,
+            "messages": messages,
+            "stream": stream
+        }
+        if tools:
+            payload["tools"] = _sorted_tools(tools)
+        if stream and llm.prompt_caching:
+            # OpenAI caches prompt prefixes automatically; ask for usage so cached tokens are reported
+            payload["stream_options"] = {"include_usage": True}
+        return f"{llm.base_url}/chat/completions", headers, payload
+
+    def _anthropic_request(self, llm: ProviderHandle, messages: list, stream: bool = False, tools: list = None) -> Tuple[str, dict, dict]:
+        """Anthropic API request"""
+        # Convert OpenAI format messages to Anthropic format
+        anthropic_messages = []
+        system_message = None
+
+        for msg in messages:
+            if msg["role"] == "system":
+                system_message = msg["content"]
+            elif msg["role"] == "user":
+                anthropic_messages.append({
+                    "role": "user",
+                    "content": msg["content"]
+                })
+            elif msg["role"] == "assistant":
+                anthropic_messages.append({
+                    "role": "assistant",
+                    "content": msg.get("content", "")
+                })
+            elif msg["role"] == "tool":
+                # For tool responses, we'll append to the last assistant message
+                if anthropic_messages and anthropic_messages[-1]["role"] == "assistant":
+                    anthropic_messages[-1]["content"] += f"\n\nTool result: {msg['content']}"
+
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": llm.api_key,
+            "anthropic-version": "2023-06-01"
+        }
+
+        payload = {
+            "model": llm.model,
+            "messages": anthropic_messages,
+            "max_tokens": 1000,
+            "stream": stream
+        }
+
+        if llm.prompt_caching:
+            # Breakpoints on the system block and at the end of the history: this turn
+            # writes the conversation prefix to the cache and the next turn reads it
+            if system_message:
+                system_message = [{"type": "text", "text": system_message, "cache_control": {"type": "ephemeral"}}]
+            if anthropic_messages and anthropic_messages[-1]["content"]:
+                last = anthropic_messages[-1]
+                anthropic_messages[-1] = {
+                    "role": last["role"],
+                    "content": [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}],
+                }
+
+        if system_message:
+            payload["system"] = system_message
+
+        return f"{llm.base_url}/messages", headers, payload
+
+    def _to_completion_response(self, llm: ProviderHandle, response):
+        if llm.provider != "anthropic":
+            usage = response.json().get("usage")
+            if usage:
+                self._record_usage(llm, openai_usage(usage))
+            return response
+        # Convert Anthropic response format to OpenAI-like format for compatibility
+        anthropic_response = response.json()
+        openai_format = {
+            "choices": [{
+                "message": {
+                    "role": "assistant",
+                    "content": anthropic_response.get("content", [{}])[0].get("text", "")
+                }
+            }]
+        }
+        if anthropic_response.get("usage"):
+            openai_format["usage"] = anthropic_usage(anthropic_response["usage"])
+            self._record_usage(llm, openai_format["usage"])
+        return CompletionResponse(openai_format)
+
+    def _iter_stream_events(self, llm: ProviderHandle, response) -> Iterator[StreamDelta]:
+        """Yield the StreamDelta events of a streaming response, then release it."""
+        parser = stream_parser(llm.provider)
+        try:
+            for line in response.iter_lines():
+                event = parser.feed(line)
+                if event is not None:
+                    if event.usage:
+                        self._record_usage(llm, event.usage)
+                    yield event
+        finally:
+            response.close()
+
+    async def _aiter_stream_events(self, llm: ProviderHandle, response) -> AsyncIterator[StreamDelta]:
+        """Async variant of _iter_stream_events."""
+        parser = stream_parser(llm.provider)
+        try:
+            async for line in response.aiter_lines():
+                event = parser.feed(line)
+                if event is not None:
+                    if event.usage:
+                        self._record_usage(llm, event.usage)
+                    yield event
+        finally:
+            await response.aclose()
+
+    def _record_usage(self, llm: ProviderHandle, usage: dict):
+        totals = self.usage_totals.setdefault(llm.name, {
+            "responses": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cache_read_tokens": 0, "cache_write_tokens": 0,
+        })
+        totals["responses"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "cache_read_tokens", "cache_write_tokens"):
+            totals[key] += usage.get(key) or 0
+
+
+class _ClientError(Exception):
+    """The provider rejected the request itself (4xx other than rate limits); retrying or failing over won't help."""
+
+
+class _RetryableError(Exception):
+    """A failed attempt worth retrying, with the provider's Retry-After if it sent one."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _describe(error: Exception) -> str:
+    # httpx timeouts often carry no message
+    return str(error) or type(error).__name__
+
+
+class _StreamRecorder:
+    """Collects content and usage from stream events for the response cache."""
+
+    def __init__(self):
+        self.parts = []
+        self.usage = None
+        self.complete = False
+        self.tool_calls = False
+
+    def feed(self, event: StreamDelta):
+        if event.done:
+            self.complete = True
+        if event.usage:
+            self.usage = event.usage
+        if event.tool_calls:
+            self.tool_calls = True
+        if event.content:
+            self.parts.append(event.content)
+
+    def store(self, cache, key: str):
+        # Only complete responses are cached; cut-off streams would replay truncated
+        if self.complete and self.parts and not self.tool_calls:
+            cache.put(key, {"content": "".join(self.parts), "usage": self.usage})
+
+
+def _circuit_scopes(llm: ProviderHandle) -> list:
+    return [f"provider:{llm.provider}", f"model:{llm.name}"]
+
+
+def _limit_scopes(llm: ProviderHandle) -> list:
+    # Provider before model, the order the rate limiter requires
+    return [(f"provider:{llm.provider}", llm.provider_limits), (f"model:{llm.name}", llm.limits)]
+
+
+def _fallback_status(requested: ProviderHandle, used: ProviderHandle) -> StreamDelta:
+    """Status event naming the model that answered in place of the requested one."""
+    return status_event({
+        "status": "fallback",
+        "llm_name": used.name,
+        "requested_llm_name": requested.name,
+        "message": f"{requested.name} is unavailable, answering with {used.name}",
+    })
+
+
+def _hedge_status(requested: ProviderHandle, used: ProviderHandle) -> StreamDelta:
+    """Status event naming the equivalent model whose hedged stream started first."""
+    return status_event({
+        "status": "hedged",
+        "llm_name": used.name,
+        "requested_llm_name": requested.name,
+        "message": f"Answering with {used.name}, which responded before {requested.name}",
+    })
+
+
+async def _aprepend(event: StreamDelta, events: AsyncIterator[StreamDelta]) -> AsyncIterator[StreamDelta]:
+    yield event
+    async with aclosing(events):
+        async for rest in events:
+            yield rest
+
+
+def _queued_status(llm: ProviderHandle, permit: Permit) -> StreamDelta:
+    """Status event telling the client how long the request waited in the queue."""
+    return status_event({
+        "status": "queued",
+        "queue_wait_ms": int(permit.waited_seconds * 1000),
+        "message": f"Waited {permit.waited_seconds:.1f}s for {llm.name} capacity",
+    })
+
+
+def _replay_events(entry: dict) -> list:
+    """Stream events replaying a cached response."""
+    content = entry["content"]
+    events = [StreamDelta(content=content[i:i + REPLAY_CHUNK_CHARS]) for i in range(0, len(content), REPLAY_CHUNK_CHARS)]
+    # Nothing was sent to the provider, so no tokens were spent
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0,
+             "response_cache_hit": True}
+    events.append(StreamDelta(usage=usage))
+    events.append(DONE)
+    return events
+
+
+async def _areplay(entry: dict) -> AsyncIterator[StreamDelta]:
+    for event in _replay_events(entry):
+        yield event
+
+
+def _cached_completion_response(entry: dict) -> CompletionResponse:
+    return CompletionResponse({
+        "choices": [{"message": {"role": "assistant", "content": entry["content"]}}],
+        "usage": entry.get("usage"),
+        "response_cache_hit": True,
+    })
+
+
+def _sorted_tools(tools: list) -> list:
+    """Order tool definitions by name so the request prefix stays byte-stable."""
+    return sorted(tools, key=lambda tool: tool.get("function", {}).get("name") or tool.get("name", ""))
+
+
+llm_client = LLMClient()
@@ -3,6 +3,11 @@ import yaml
 import os
 from pydantic import BaseModel, Field
 
+class RateLimitConfig(BaseModel):
+    max_concurrency: Optional[int] = None  # Concurrent upstream calls
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None  # Estimated input tokens
+
 class LLMConfig(BaseModel):
     name: str
     provider: str
@@ -10,6 +15,13 @@ class LLMConfig(BaseModel):
     api_key_env: str
     base_url: Optional[str] = None
     description: Optional[str] = None
+    prompt_caching: bool = False  # Opt-in provider prompt-prefix caching
+    context_budget_tokens: Optional[int] = None  # Input token budget for conversation history
+    max_concurrency: Optional[int] = None  # Per-model limits, on top of the provider's
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    fallbacks: List[str] = Field(default_factory=list)  # Models tried, in order, when this one is unavailable
+    hedge_with: Optional[str] = None  # Equivalent model for hedged requests (default: the same model)
     api_key: Optional[str] = None  # Resolved at runtime
 
 class LLMConfigPublic(BaseModel):
@@ -22,6 +34,7 @@ class LLMConfigManager:
     def __init__(self, config_file: str):
         self.config_file = config_file
         self.llm_configs: Dict[str, LLMConfig] = {}
+        self.provider_limits: Dict[str, RateLimitConfig] = {}
         self._load_configs()
 
     def _load_configs(self):
@@ -41,6 +54,12 @@ class LLMConfigManager:
             print(f"Invalid LLM configuration format in {self.config_file}: 'llms' key missing or not a list")
             return
 
+        for provider, limits in (data.get('providers') or {}).items():
+            try:
+                self.provider_limits[provider.lower()] = RateLimitConfig(**(limits or {}))
+            except Exception as e:
+                print(f"Error loading limits for provider {provider}: {e}")
+
         for config_data in data['llms']:
             try:
                 # Validate required fields
@@ -69,6 +88,10 @@ class LLMConfigManager:
             raise ValueError(f"LLM configuration '{name}' not found.")
         return self.llm_configs[name]
 
+    def get_provider_limits(self, provider: str) -> RateLimitConfig:
+        """Get the shared limits of a provider (unlimited if not configured)."""
+        return self.provider_limits.get(provider.lower(), RateLimitConfig())
+
     def get_all_llm_names(self) -> List[str]:
         """Get list of all LLM names."""
         return list(self.llm_configs.keys())
@@ -88,4 +111,5 @@ class LLMConfigManager:
     def reload_configs(self):
         """Reload configurations from file."""
         self.llm_configs.clear()
+        self.provider_limits.clear()
         self._load_configs()
@@ -0,0 +1,125 @@
+"""
+Prompt fragment registry backed by a directory of templates.
+
+Fragments live in <directory>/<kind>/<id>.md, for example
+prompts/tools/calculator.md or prompts/data_sources/data-test.md, and the
+base prompt in system_prompt.md. Each file is compiled into a
+string.Template once; changed files are picked up by comparing mtimes,
+checked at most once per check_interval.
+"""
+import os
+import threading
+import time
+from string import Template
+from typing import Any, Callable, Dict, Optional, Tuple
+from app.config import settings
+
+FRAGMENT_SUFFIX = ".md"
+
+# (mtime_ns, size, compiled template)
+_Entry = Tuple[int, int, Template]
+
+
+class PromptRegistry:
+    def __init__(self,
+                 directory: str = "prompts",
+                 base_prompt_path: str = "system_prompt.md",
+                 check_interval: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.directory = directory
+        self.base_prompt_path = base_prompt_path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._fragments: Dict[Tuple[str, str], _Entry] = {}
+        self._base_prompt: Optional[_Entry] = None
+        self._last_check: Optional[float] = None
+        # Bumped whenever any fragment is added, changed or removed
+        self.version = 0
+        self.checks = 0
+        self.reloads = 0
+
+    def get(self, kind: str, fragment_id: str, **context: Any) -> Optional[str]:
+        """Render a fragment, or None if there is no file for it."""
+        self.refresh()
+        entry = self._fragments.get((kind, fragment_id))
+        if entry is None:
+            return None
+        return entry[2].safe_substitute(id=fragment_id, **context)
+
+    def base_prompt(self) -> Optional[str]:
+        """Get the base prompt file's content, or None if it does not exist."""
+        self.refresh()
+        return self._base_prompt[2].template if self._base_prompt else None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload changed files if the check interval has passed; returns True if anything changed."""
+        now = self._clock()
+        if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+            return False
+        with self._lock:
+            if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+            self.checks += 1
+            fragments, fragments_changed = self._scan_fragments()
+            base_prompt, base_changed = self._reload_file(self.base_prompt_path, self._base_prompt)
+            if fragments_changed or base_changed:
+                self._fragments = fragments
+                self._base_prompt = base_prompt
+                self.version += 1
+                return True
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fragments": len(self._fragments),
+            "version": self.version,
+            "checks": self.checks,
+            "reloads": self.reloads,
+            "check_interval": self.check_interval,
+        }
+
+    def _scan_fragments(self) -> Tuple[Dict[Tuple[str, str], _Entry], bool]:
+        fragments: Dict[Tuple[str, str], _Entry] = {}
+        changed = False
+        try:
+            kinds = [entry for entry in os.scandir(self.directory) if entry.is_dir()]
+        except FileNotFoundError:
+            kinds = []
+        for kind_entry in kinds:
+            for file_entry in os.scandir(kind_entry.path):
+                if not file_entry.is_file() or not file_entry.name.endswith(FRAGMENT_SUFFIX):
+                    continue
+                key = (kind_entry.name, file_entry.name[:-len(FRAGMENT_SUFFIX)])
+                entry, entry_changed = self._reload_file(file_entry.path, self._fragments.get(key))
+                if entry is not None:
+                    fragments[key] = entry
+                changed = changed or entry_changed
+        # Removed files
+        changed = changed or fragments.keys() != self._fragments.keys()
+        return fragments, changed
+
+    def _reload_file(self, path: str, current: Optional[_Entry]) -> Tuple[Optional[_Entry], bool]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, current is not None
+        if current is not None and (current[0], current[1]) == (stat.st_mtime_ns, stat.st_size):
+            return current, False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read().rstrip("\n")
+        except OSError as e:
+            print(f"Failed to load prompt fragment {path}: {e}")
+            return current, False
+        self.reloads += 1
+        return (stat.st_mtime_ns, stat.st_size, Template(text)), True
+
+
+# Global instance
+prompt_registry = PromptRegistry(
+    directory=settings.prompt_fragments_dir,
+    base_prompt_path=settings.system_prompt_file,
+    check_interval=settings.prompt_reload_interval_seconds,
+)
@@ -0,0 +1,267 @@
+"""
+Cross-process publish/subscribe for session invalidation and WebSocket fan-out.
+
+Each worker process owns one PubSub participant identified by a random origin
+id. Messages are delivered to every participant except the one that
+published them, so the publisher always handles its own side locally.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set
+from app.config import settings
+
+Handler = Callable[[str, Dict[str, Any]], None]
+
+
+class PubSub(ABC):
+    """Base participant; subclasses implement transport in publish/start/stop."""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: List[Handler] = []
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, handler: Handler):
+        """Register a handler called as handler(channel, message) on the event loop."""
+        self._handlers.append(handler)
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]):
+        """Deliver message on channel to every other participant."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "published": self.published, "received": self.received}
+
+    def _dispatch(self, channel: str, message: Dict[str, Any], origin: str):
+        if origin == self.origin:
+            return
+        self.received += 1
+        for handler in self._handlers:
+            try:
+                handler(channel, message)
+            except Exception as e:
+                print(f"PubSub handler error on channel {channel}: {e}")
+
+
+class InProcessBroker:
+    """Fan-out hub shared by InProcessPubSub participants in one process."""
+
+    def __init__(self):
+        self.participants: List["InProcessPubSub"] = []
+
+
+class InProcessPubSub(PubSub):
+    """
+    Single-process stand-in. Participants joined to the same broker behave
+    like separate workers, which is what the tests use.
+    """
+
+    def __init__(self, broker: Optional[InProcessBroker] = None):
+        super().__init__()
+        self.broker = broker or InProcessBroker()
+        self.broker.participants.append(self)
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.published += 1
+        for participant in list(self.broker.participants):
+            participant._dispatch(channel, message, self.origin)
+
+
+class SQLitePubSub(PubSub):
+    """
+    Pub/sub over a shared SQLite table, for several workers on one host.
+
+    Publishing is a single insert; each participant polls for rows newer than
+    the last one it saw. Old rows are pruned after retention_seconds.
+    """
+
+    def __init__(self, db_path: str, poll_interval: float = 0.05, retention_seconds: float = 60.0):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pubsub_messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+            "payload TEXT NOT NULL, origin TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._last_id = self._max_id()
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = time.time()
+
+    def _max_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM pubsub_messages").fetchone()[0]
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.published += 1
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO pubsub_messages (channel, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+                (channel, json.dumps(message), self.origin, time.time()),
+            )
+
+    def poll(self) -> int:
+        """Deliver messages published since the last poll; returns how many were read."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, channel, payload, origin FROM pubsub_messages WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+        for row_id, channel, payload, origin in rows:
+            self._last_id = row_id
+            self._dispatch(channel, json.loads(payload), origin)
+        now = time.time()
+        if now - self._last_prune > self.retention_seconds:
+            self._last_prune = now
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM pubsub_messages WHERE created_at < ?", (now - self.retention_seconds,)
+                )
+        return len(rows)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                self.poll()
+            except sqlite3.Error as e:
+                print(f"SQLite pub/sub poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+class RedisPubSub(PubSub):
+    """
+    Pub/sub over Redis channels; requires the optional redis package.
+
+    Publishing from the event loop goes through the asyncio client so a slow
+    Redis never blocks request handlers. The listener reconnects with
+    exponential backoff when the connection drops.
+    """
+
+    CHANNEL_PREFIX = "chatui:"
+
+    def __init__(self, url: str, max_backoff_seconds: float = 30.0):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImportError("RedisPubSub requires the 'redis' package: pip install redis")
+        self._sync_client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+        self.max_backoff_seconds = max_backoff_seconds
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.published += 1
+        envelope = json.dumps({"origin": self.origin, "message": message})
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (startup scripts, sync tests): a blocking publish is fine here
+            self._sync_client.publish(f"{self.CHANNEL_PREFIX}{channel}", envelope)
+            return
+        task = loop.create_task(self._async_client.publish(f"{self.CHANNEL_PREFIX}{channel}", envelope))
+        self._pending.add(task)
+        task.add_done_callback(self._publish_done)
+
+    def _publish_done(self, task: asyncio.Task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Redis pub/sub publish failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["reconnects"] = self.reconnects
+        stats["pending_publishes"] = len(self._pending)
+        return stats
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self._async_client.aclose()
+
+    async def _listen(self):
+        backoff = 0.5
+        while True:
+            pubsub = self._async_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+                backoff = 0.5
+                async for item in pubsub.listen():
+                    if item.get("type") != "pmessage":
+                        continue
+                    channel = item["channel"].decode()[len(self.CHANNEL_PREFIX):]
+                    envelope = json.loads(item["data"])
+                    self._dispatch(channel, envelope["message"], envelope["origin"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Redis pub/sub listener failed, reconnecting in {backoff:.1f}s: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
+
+
+def create_pubsub() -> PubSub:
+    """Create the pub/sub participant selected by settings.pubsub_backend."""
+    if settings.pubsub_backend == "memory":
+        return InProcessPubSub()
+    elif settings.pubsub_backend == "sqlite":
+        return SQLitePubSub(settings.pubsub_db_path, poll_interval=settings.pubsub_poll_interval_seconds)
+    elif settings.pubsub_backend == "redis":
+        if not settings.redis_url:
+            raise ValueError("pubsub_backend 'redis' requires redis_url")
+        return RedisPubSub(settings.redis_url)
+    else:
+        raise ValueError(f"Unsupported pub/sub backend: {settings.pubsub_backend}")
@@ -0,0 +1,231 @@
+"""
+Concurrency limits and rate shaping for upstream LLM calls.
+
+Each request takes a slot in its provider scope and its model scope. A
+scope can cap concurrent calls with a semaphore and shape traffic with
+request and token buckets refilled per minute. Requests over the limits
+wait in a bounded queue instead of running into provider 429s.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Limits for one scope; None means unlimited."""
+    max_concurrency: Optional[int] = None
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_concurrency is None and self.requests_per_minute is None and self.tokens_per_minute is None
+
+
+class QueueFull(Exception):
+    """Raised when a request can't be queued, or waited longer than the queue timeout."""
+
+
+class TokenBucket:
+    """Bucket refilled continuously at per_minute / 60 per second, holding at most per_minute."""
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount now, going into debt if needed; returns the seconds until the debt is repaid."""
+        self._refill()
+        # A single request larger than the bucket would never fit; let it through once full
+        self.level -= min(amount, self.capacity)
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class _Scope:
+    def __init__(self, limits: Limits, clock: Callable[[], float]):
+        self.limits = limits
+        self.semaphore = asyncio.Semaphore(limits.max_concurrency) if limits.max_concurrency else None
+        self.requests = TokenBucket(limits.requests_per_minute, clock) if limits.requests_per_minute else None
+        self.tokens = TokenBucket(limits.tokens_per_minute, clock) if limits.tokens_per_minute else None
+        self.active = 0
+        self.waiting = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+
+class Permit:
+    """Slots held by one request; release() gives them back (safe to call more than once)."""
+
+    def __init__(self, scopes: List[_Scope], waited_seconds: float, queued: bool):
+        self.waited_seconds = waited_seconds
+        self.queued = queued
+        self._scopes = scopes
+
+    def release(self):
+        scopes, self._scopes = self._scopes, []
+        for scope in scopes:
+            scope.active -= 1
+            if scope.semaphore is not None:
+                scope.semaphore.release()
+
+
+class RateLimiter:
+    def __init__(self,
+                 max_waiting: int = 100,
+                 queue_timeout_seconds: float = 120.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_waiting = max_waiting
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._clock = clock
+        self._scopes: Dict[str, _Scope] = {}
+
+    async def acquire(self, scopes: List[Tuple[str, Limits]], tokens: int = 0,
+                      deadline: Optional[float] = None) -> Permit:
+        """
+        Wait for a slot in every scope, then for the scopes' request and token buckets.
+
+        Scopes are taken in the order given, so callers must always list them
+        in the same order (provider before model). Raises QueueFull when a
+        scope's queue is full or the wait would pass the queue timeout or
+        the request's deadline (a time.monotonic() timestamp).
+        """
+        resolved = [self._scope(name, limits) for name, limits in scopes if not limits.unlimited]
+        for name, scope in resolved:
+            if scope.semaphore is not None and scope.semaphore.locked() and scope.waiting >= self.max_waiting:
+                scope.rejected += 1
+                raise QueueFull(f"Too many requests waiting for {name}")
+
+        started = self._clock()
+        queue_deadline = started + self.queue_timeout_seconds
+        deadline = queue_deadline if deadline is None else min(deadline, queue_deadline)
+        queued = False
+        held: List[_Scope] = []
+        try:
+            for name, scope in resolved:
+                if scope.semaphore is None:
+                    held.append(scope)
+                    continue
+                if scope.semaphore.locked():
+                    queued = True
+                    scope.queued += 1
+                scope.waiting += 1
+                try:
+                    await asyncio.wait_for(scope.semaphore.acquire(), max(0.0, deadline - self._clock()))
+                except asyncio.TimeoutError:
+                    scope.rejected += 1
+                    raise QueueFull(f"Timed out after {self._clock() - started:.1f}s waiting for {name}")
+                finally:
+                    scope.waiting -= 1
+                held.append(scope)
+
+            delay = await self._reserve(resolved, tokens, deadline)
+            if delay > 0:
+                queued = True
+        except BaseException:
+            for scope in held:
+                if scope.semaphore is not None:
+                    scope.semaphore.release()
+            raise
+
+        for scope in held:
+            scope.active += 1
+        waited = self._clock() - started
+        for _, scope in resolved:
+            scope.wait_seconds += waited
+        return Permit(held, waited, queued)
+
+    async def try_acquire(self, scopes: List[Tuple[str, Limits]], tokens: int = 0) -> Optional[Permit]:
+        """
+        Take a slot in every scope only if that needs no waiting: every
+        semaphore has room and no bucket would delay the request. Returns
+        None, holding nothing, otherwise.
+        """
+        resolved = [self._scope(name, limits) for name, limits in scopes if not limits.unlimited]
+        if any(scope.semaphore is not None and scope.semaphore.locked() for _, scope in resolved):
+            return None
+        reservations = []
+        delay = 0.0
+        for _, scope in resolved:
+            for bucket, amount in ((scope.requests, 1), (scope.tokens, tokens)):
+                if bucket is not None and amount:
+                    delay = max(delay, bucket.reserve(amount))
+                    reservations.append((bucket, amount))
+        if delay > 0:
+            for bucket, amount in reservations:
+                bucket.refund(amount)
+            return None
+        held = []
+        for _, scope in resolved:
+            if scope.semaphore is not None:
+                # Not locked, so this returns without suspending
+                await scope.semaphore.acquire()
+            scope.active += 1
+            held.append(scope)
+        return Permit(held, 0.0, False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "max_concurrency": scope.limits.max_concurrency,
+                "requests_per_minute": scope.limits.requests_per_minute,
+                "tokens_per_minute": scope.limits.tokens_per_minute,
+                "active": scope.active,
+                "waiting": scope.waiting,
+                "queued": scope.queued,
+                "rejected": scope.rejected,
+                "wait_seconds": round(scope.wait_seconds, 3),
+            }
+            for name, scope in self._scopes.items()
+        }
+
+    def _scope(self, name: str, limits: Limits) -> Tuple[str, _Scope]:
+        scope = self._scopes.get(name)
+        # Limits changed for this name: start a fresh scope, in-flight permits release to the old one
+        if scope is None or scope.limits != limits:
+            scope = _Scope(limits, self._clock)
+            self._scopes[name] = scope
+        return name, scope
+
+    async def _reserve(self, resolved: List[Tuple[str, _Scope]], tokens: int, deadline: float) -> float:
+        """Reserve one request and the tokens in every bucket, sleeping until all are repaid."""
+        reservations = []
+        delay = 0.0
+        for _, scope in resolved:
+            for bucket, amount in ((scope.requests, 1), (scope.tokens, tokens)):
+                if bucket is not None and amount:
+                    delay = max(delay, bucket.reserve(amount))
+                    reservations.append((bucket, amount))
+        try:
+            if delay > 0:
+                if self._clock() + delay > deadline:
+                    for name, scope in resolved:
+                        scope.rejected += 1
+                    raise QueueFull(f"Rate limit would delay the request by {delay:.1f}s")
+                await asyncio.sleep(delay)
+        except BaseException:
+            for bucket, amount in reservations:
+                bucket.refund(amount)
+            raise
+        return delay
+
+
+# Global instance
+rate_limiter = RateLimiter(
+    max_waiting=settings.llm_queue_max_waiting,
+    queue_timeout_seconds=settings.llm_queue_timeout_seconds,
+)
@@ -0,0 +1,131 @@
+"""
+Timeouts, deadlines and retry backoff for upstream LLM calls.
+
+Every call carries a deadline (a time.monotonic() timestamp) that caps its
+timeouts, queue wait and retries. Retries only happen before the first
+token reaches the caller, with full-jitter exponential backoff that defers
+to the provider's Retry-After when it sends one.
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+import httpx
+from app.config import settings
+
+# Rate limited, overloaded (Anthropic's 529) or transient server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before the provider call finishes."""
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Deadline seconds from now, or None for no deadline."""
+    return time.monotonic() + seconds if seconds else None
+
+
+def time_left(deadline: Optional[float]) -> Optional[float]:
+    """Seconds until the deadline (never negative), or None without one."""
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def parse_retry_after(headers: httpx.Headers, now: Callable[[], float] = time.time) -> Optional[float]:
+    """Seconds to wait from Retry-After (delta seconds or HTTP date) or OpenAI's retry-after-ms."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestPolicy:
+    def __init__(self,
+                 connect_timeout: float = 10.0,
+                 first_byte_timeout: float = 60.0,
+                 idle_timeout: float = 30.0,
+                 deadline_seconds: Optional[float] = 300.0,
+                 max_retries: int = 2,
+                 base_delay: float = 0.5,
+                 max_delay: float = 8.0,
+                 rng: Callable[[], float] = random.random):
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng
+
+    def new_deadline(self) -> Optional[float]:
+        return deadline_after(self.deadline_seconds)
+
+    def timeout(self, deadline: Optional[float]) -> httpx.Timeout:
+        """
+        httpx timeouts for one attempt, capped by the time left before the deadline.
+
+        The read timeout bounds each wait for data until the response (or for
+        a stream, its first event) is in: the first byte timeout. Once a stream
+        is running, the caller bounds the wait for each event with idle_wait().
+        """
+        left = time_left(deadline)
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("Request deadline passed before the provider call")
+        if left is not None:
+            return httpx.Timeout(min(self.first_byte_timeout, left), connect=min(self.connect_timeout, left))
+        return httpx.Timeout(self.first_byte_timeout, connect=self.connect_timeout)
+
+    def first_token_timeout(self, deadline: Optional[float]) -> float:
+        left = time_left(deadline)
+        return self.first_byte_timeout if left is None else min(self.first_byte_timeout, left)
+
+    def idle_wait(self, deadline: Optional[float]) -> float:
+        """Longest wait for the next event of a running stream: the idle timeout, capped by the deadline."""
+        left = time_left(deadline)
+        return self.idle_timeout if left is None else min(self.idle_timeout, left)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number attempt + 1: full jitter, or at least the provider's Retry-After."""
+        delay = self._rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def should_retry(self, attempt: int, delay: float, deadline: Optional[float]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        left = time_left(deadline)
+        return left is None or delay < left
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connect_timeout": self.connect_timeout,
+            "first_byte_timeout": self.first_byte_timeout,
+            "idle_timeout": self.idle_timeout,
+            "deadline_seconds": self.deadline_seconds,
+            "max_retries": self.max_retries,
+        }
+
+
+# Global instance
+request_policy = RequestPolicy(
+    connect_timeout=settings.llm_connect_timeout_seconds,
+    first_byte_timeout=settings.llm_first_byte_timeout_seconds,
+    idle_timeout=settings.llm_stream_idle_timeout_seconds,
+    deadline_seconds=settings.llm_request_deadline_seconds,
+    max_retries=settings.llm_max_retries,
+    base_delay=settings.llm_retry_base_delay_seconds,
+    max_delay=settings.llm_retry_max_delay_seconds,
+)
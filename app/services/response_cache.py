@@ -0,0 +1,184 @@
+"""
+Exact-match cache of LLM responses.
+
+Responses are keyed by a hash of the model, the normalized messages and
+the request parameters. A bounded in-memory LRU sits in front of an
+optional SQLite tier shared by workers on the same host; both expire
+entries after ttl_seconds.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from app.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+"""
+
+# The disk tier is pruned to its bounds once per this many stores
+DISK_PRUNE_EVERY = 100
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Hash of the model, the messages (role and content only) and the request parameters."""
+    normalized = [{"role": message.get("role"), "content": message.get("content") or ""} for message in messages]
+    blob = json.dumps({"model": model, "messages": normalized, "params": params},
+                      sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self,
+                 enabled: bool = False,
+                 max_entries: int = 1000,
+                 ttl_seconds: float = 3600.0,
+                 db_path: Optional[str] = None,
+                 max_disk_entries: int = 10000,
+                 clock: Callable[[], float] = time.time):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (created_at, entry)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts_since_prune = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached entry ({"content": ..., "usage": ...}) if present and fresh."""
+        now = self._clock()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                if now - cached[0] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return cached[1]
+                del self._memory[key]
+
+            entry = self._disk_get(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, entry[0], entry[1])
+            return entry[1]
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry in both tiers."""
+        now = self._clock()
+        with self._lock:
+            self.stores += 1
+            self._memory_put(key, now, entry)
+            self._disk_put(key, now, entry)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def _memory_put(self, key: str, created_at: float, entry: Dict[str, Any]):
+        self._memory[key] = (created_at, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        conn = self._connection()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute("SELECT created_at, entry FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] >= self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0], json.loads(row[1])
+        except sqlite3.Error as e:
+            print(f"Response cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, now: float, entry: Dict[str, Any]):
+        conn = self._connection()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, created_at, accessed_at, entry) VALUES (?, ?, ?, ?)",
+                (key, now, now, json.dumps(entry)),
+            )
+            self._puts_since_prune += 1
+            if self._puts_since_prune < DISK_PRUNE_EVERY:
+                return
+            self._puts_since_prune = 0
+            # Drop expired rows, then the least recently used beyond the disk bound
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+        except sqlite3.Error as e:
+            print(f"Response cache write failed: {e}")
+
+
+# Global instance
+response_cache = ResponseCache(
+    enabled=settings.response_cache_enabled,
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    db_path=settings.response_cache_db_path,
+    max_disk_entries=settings.response_cache_max_disk_entries,
+)
@@ -1,54 +1,230 @@
 
+import asyncio
 import uuid
 from typing import Dict, Any, Optional
 from fastapi import WebSocket
-from app.utils.session_logger import log_session_event
+from app.config import settings
+from app.utils.session_logger import log_session_event, store_prompt_blob
+from app.services.session_store import SessionBackend, SessionStore, JSONFileSessionBackend
+from app.services.sqlite_session_backend import SQLiteSessionBackend
+from app.services.pubsub import PubSub, create_pubsub
+from app.services.generation_tracker import GenerationTracker, generation_tracker
+from app.services.context_window import context_window_manager
+from app.services.token_counter import token_counter
+
+SESSION_CHANNEL = "session"
+WEBSOCKET_CHANNEL = "websocket"
+GENERATION_CHANNEL = "generation"
+
+def create_session_backend() -> SessionBackend:
+    """Create the persistence backend selected by settings.session_backend."""
+    if settings.session_backend == "sqlite":
+        return SQLiteSessionBackend(settings.session_db_path)
+    elif settings.session_backend == "json":
+        return JSONFileSessionBackend(settings.session_spill_dir)
+    else:
+        raise ValueError(f"Unsupported session backend: {settings.session_backend}")
 
 class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
-        self.user_sessions: Dict[str, str] = {}  # Maps user_email to session_id
+    """
+    Session state shared across worker processes.
+
+    The backend is the source of truth; each worker keeps a hot set in
+    memory and drops entries when another worker announces a change over
+    pub/sub. WebSocket messages for sockets held by other workers, and
+    requests to cancel a session's generations, go over the same pub/sub.
+    """
+
+    def __init__(self, backend: Optional[SessionBackend] = None, pubsub: Optional[PubSub] = None,
+                 generations: Optional[GenerationTracker] = None):
+        self.backend = backend or create_session_backend()
+        # Sessions load lazily from the backend on first access
+        self.sessions = SessionStore(
+            max_resident=settings.session_max_resident,
+            idle_ttl_seconds=settings.session_idle_ttl_seconds,
+            backend=self.backend,
+            on_evict=self._release,
+        )
+        # Maps user_email to session_id for resident sessions; others are found through the backend
+        self.user_sessions: Dict[str, str] = {}
         self.active_websockets: Dict[str, WebSocket] = {}
+        self.generations = generations or generation_tracker
+        self.pubsub = pubsub or create_pubsub()
+        self.pubsub.subscribe(self._on_pubsub_message)
+
+    async def start(self):
+        """Start receiving cross-worker notifications."""
+        await self.pubsub.start()
+
+    async def stop(self):
+        await self.pubsub.stop()
+
+    def _release(self, session_id: str, session: Dict[str, Any]):
+        """Drop everything kept in memory for a session that left the hot set."""
+        user_email = session.get("user_email")
+        if user_email and self.user_sessions.get(user_email) == session_id:
+            del self.user_sessions[user_email]
+        context_window_manager.forget(session_id)
+        messages = list(session.get("messages", []))
+        if session.get("history_summary"):
+            messages.append(session["history_summary"]["message"])
+        token_counter.forget_messages(messages)
+
+    def _publish_change(self, session_id: str, user_email: Optional[str] = None, deleted: bool = False):
+        self.pubsub.publish(SESSION_CHANNEL, {"session_id": session_id, "user_email": user_email, "deleted": deleted})
+
+    def _on_pubsub_message(self, channel: str, message: Dict[str, Any]):
+        if channel == SESSION_CHANNEL:
+            session_id = message["session_id"]
+            self.sessions.delete(session_id)
+            user_email = message.get("user_email")
+            if user_email and message.get("deleted") and self.user_sessions.get(user_email) == session_id:
+                del self.user_sessions[user_email]
+        elif channel == WEBSOCKET_CHANNEL:
+            session_id = message["session_id"]
+            if session_id in self.active_websockets:
+                asyncio.get_running_loop().create_task(
+                    self._send_local_websocket_message(session_id, message["message"])
+                )
+        elif channel == GENERATION_CHANNEL:
+            self.generations.cancel(message["session_id"], message["reason"])
 
     def create_session(self, user_email: str) -> str:
         # Check if user already has an active session
-        if user_email in self.user_sessions:
-            session_id = self.user_sessions[user_email]
+        session_id = self.user_sessions.get(user_email) or self.backend.find_session_by_user(user_email)
+        if session_id and self.sessions.get(session_id) is not None:
+            self.user_sessions[user_email] = session_id
             log_session_event(session_id, {"event": "session_reconnected", "user_email": user_email})
             return session_id
 
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {"user_email": user_email, "messages": [], "selected_tools": [], "selected_data_sources": []}
+        session = {"user_email": user_email, "messages": [], "selected_tools": [], "selected_data_sources": [], "llm_name": None,
+                   "history_summary": None}
+        self.backend.create(session_id, session)
+        self.sessions.put(session_id, session)
+        self._publish_change(session_id)
         self.user_sessions[user_email] = session_id
         log_session_event(session_id, {"event": "session_created", "user_email": user_email})
         return session_id
 
     def update_session_tools(self, session_id: str, tools: list):
-        if session_id in self.sessions:
-            self.sessions[session_id]["selected_tools"] = tools
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["selected_tools"] = tools
+            self.backend.update_fields(session_id, {"selected_tools": tools})
+            self._publish_change(session_id)
             log_session_event(session_id, {"event": "tools_updated", "tools": tools})
 
     def update_session_data_sources(self, session_id: str, data_sources: list):
-        if session_id in self.sessions:
-            self.sessions[session_id]["selected_data_sources"] = data_sources
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["selected_data_sources"] = data_sources
+            self.backend.update_fields(session_id, {"selected_data_sources": data_sources})
+            self._publish_change(session_id)
             log_session_event(session_id, {"event": "data_sources_updated", "data_sources": data_sources})
 
+    def update_session_llm(self, session_id: str, llm_name: str):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["llm_name"] = llm_name
+            self.backend.update_fields(session_id, {"llm_name": llm_name})
+            self._publish_change(session_id)
+            log_session_event(session_id, {"event": "llm_changed", "llm_name": llm_name})
+
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         return self.sessions.get(session_id)
 
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        """Append one message; persisted as a single new row."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["messages"].append(message)
+            self.backend.append_message(session_id, message)
+            self._publish_change(session_id)
+            log_session_event(session_id, _message_added_event(message))
+
+    def set_system_prompt(self, session_id: str, system_prompt: str):
+        """Set the leading system message, replacing it rather than mutating it in place."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        system_message = {"role": "system", "content": system_prompt}
+        messages = session["messages"]
+        if messages and messages[0]["role"] == "system":
+            if messages[0]["content"] != system_prompt:
+                messages[0] = system_message
+                self.backend.update_message(session_id, 0, system_message)
+                self._publish_change(session_id)
+        elif not messages:
+            self.append_message(session_id, system_message)
+
     def update_session_messages(self, session_id: str, messages: list):
-        if session_id in self.sessions:
-            self.sessions[session_id]["messages"] = messages
+        """Replace the whole message list; a history summary no longer applies to it."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["messages"] = messages
+            self.backend.replace_messages(session_id, messages)
+            if session.get("history_summary") is not None:
+                session["history_summary"] = None
+                self.backend.update_fields(session_id, {"history_summary": None})
+            self._publish_change(session_id)
             if messages:
-                log_session_event(session_id, {"event": "message_added", "message": messages[-1]})
+                log_session_event(session_id, _message_added_event(messages[-1]))
+
+    def context_messages(self, session_id: str) -> Optional[list]:
+        """
+        The messages to send the model: the stored history with its summarized
+        part (if any) replaced by the summary message. The stored history
+        itself is never rewritten, so downloads keep the original turns.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        messages = session["messages"]
+        summary = session.get("history_summary")
+        if not summary or not messages:
+            return messages
+        return [messages[0], summary["message"]] + messages[1 + summary["covers"]:]
+
+    def compact_history(self, session_id: str, compacted: list, summary_message: Dict[str, Any]) -> bool:
+        """
+        Summarize the compacted context messages (those after the system message).
+
+        The summary is stored next to the history and covers the original
+        messages it stands for; context_messages() puts it in their place.
+        It is skipped if the context changed underneath since the summary was
+        started, i.e. compacted is no longer context_messages()[1:n].
+        """
+        context = self.context_messages(session_id)
+        if context is None:
+            return False
+        end = len(compacted) + 1
+        if len(context) < end or any(a is not b for a, b in zip(context[1:end], compacted)):
+            return False
+        session = self.sessions.get(session_id)
+        previous = session.get("history_summary")
+        # A previous summary among the compacted messages is folded into the new one
+        covers = previous["covers"] + len(compacted) - 1 if previous else len(compacted)
+        summary = {"message": summary_message, "covers": covers}
+        session["history_summary"] = summary
+        self.backend.update_fields(session_id, {"history_summary": summary})
+        self._publish_change(session_id)
+        log_session_event(session_id, {
+            "event": "history_compacted",
+            "messages_compacted": len(compacted),
+            "messages_remaining": len(context) - len(compacted) + 1,
+        })
+        return True
 
     def delete_session(self, session_id: str):
-        if session_id in self.sessions:
-            user_email = self.sessions[session_id]["user_email"]
+        session = self.sessions.get(session_id)
+        if session is not None:
+            user_email = session["user_email"]
             log_session_event(session_id, {"event": "session_deleted", "user_email": user_email})
-            del self.sessions[session_id]
-            if user_email in self.user_sessions and self.user_sessions[user_email] == session_id:
-                del self.user_sessions[user_email]
+            self.sessions.delete(session_id)
+            self.backend.delete(session_id)
+            self._publish_change(session_id, user_email=user_email, deleted=True)
+            self._release(session_id, session)
 
     def register_websocket(self, session_id: str, websocket: WebSocket):
         self.active_websockets[session_id] = websocket
@@ -58,12 +234,33 @@ class SessionManager:
             del self.active_websockets[session_id]
 
     async def send_websocket_message(self, session_id: str, message: Dict[str, Any]):
+        """Send to the session's WebSocket, wherever in the worker pool it is connected."""
         if session_id in self.active_websockets:
-            websocket = self.active_websockets[session_id]
+            await self._send_local_websocket_message(session_id, message)
+        else:
+            self.pubsub.publish(WEBSOCKET_CHANNEL, {"session_id": session_id, "message": message})
+
+    def cancel_generations(self, session_id: str, reason: str) -> int:
+        """Cancel the session's generations on every worker; returns how many this worker cancelled."""
+        self.pubsub.publish(GENERATION_CHANNEL, {"session_id": session_id, "reason": reason})
+        return self.generations.cancel(session_id, reason)
+
+    async def _send_local_websocket_message(self, session_id: str, message: Dict[str, Any]):
+        websocket = self.active_websockets.get(session_id)
+        if websocket is not None:
             try:
                 await websocket.send_json(message)
             except Exception as e:
                 print(f"Error sending WebSocket message to {session_id}: {e}")
                 self.unregister_websocket(session_id)
 
+
+def _message_added_event(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Log event for a new message; system prompts are logged by digest, their text is in the blob store."""
+    if message.get("role") == "system":
+        return {"event": "message_added", "role": "system",
+                "system_prompt_sha256": store_prompt_blob(message.get("content", ""))}
+    return {"event": "message_added", "message": message}
+
+
 session_manager = SessionManager()
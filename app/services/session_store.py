@@ -0,0 +1,244 @@
+"""
+Bounded-memory session store with idle TTL expiry and an LRU hot set.
+
+Sessions that leave memory are dropped from the hot set only; the
+persistence backend already holds them and they are loaded back
+transparently on the next access.
+"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SessionBackend(ABC):
+    """
+    Persistence interface for sessions.
+
+    Backends are written through on every change, so a session that leaves
+    memory can always be loaded back.
+    """
+
+    @abstractmethod
+    def create(self, session_id: str, session: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def find_session_by_user(self, user_email: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def update_fields(self, session_id: str, fields: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def update_message(self, session_id: str, index: int, message: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def replace_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        ...
+
+
+class JSONFileSessionBackend(SessionBackend):
+    """Stores each session as a JSON document in a directory, rewritten on change."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def _write(self, session_id: str, session: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(session_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, path)
+
+    def _modify(self, session_id: str, change: Callable[[Dict[str, Any]], None]):
+        session = self.load(session_id)
+        if session is not None:
+            change(session)
+            self._write(session_id, session)
+
+    def create(self, session_id: str, session: Dict[str, Any]):
+        self._write(session_id, session)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def delete(self, session_id: str):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def find_session_by_user(self, user_email: str) -> Optional[str]:
+        # Full scan; the JSON backend is meant for small or single-user setups
+        if not os.path.isdir(self.directory):
+            return None
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".json"):
+                session_id = file_name[:-len(".json")]
+                session = self.load(session_id)
+                if session and session.get("user_email") == user_email:
+                    return session_id
+        return None
+
+    def update_fields(self, session_id: str, fields: Dict[str, Any]):
+        self._modify(session_id, lambda session: session.update(fields))
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        self._modify(session_id, lambda session: session["messages"].append(message))
+
+    def update_message(self, session_id: str, index: int, message: Dict[str, Any]):
+        def change(session):
+            session["messages"][index] = message
+        self._modify(session_id, change)
+
+    def replace_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        self.update_fields(session_id, {"messages": messages})
+
+
+class SessionStore:
+    """
+    Keeps at most max_resident sessions in memory.
+
+    Entries are ordered by last access, so the least recently used session is
+    evicted first and idle-TTL expiry only has to look at the front of the order.
+    on_evict(session_id, session) is called for every LRU or idle eviction, so
+    caches keyed by session can let go of it too.
+    """
+
+    def __init__(self,
+                 max_resident: int = 1000,
+                 idle_ttl_seconds: float = 1800.0,
+                 backend: Optional[SessionBackend] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_evict: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.max_resident = max_resident
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.backend = backend
+        self.on_evict = on_evict
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.recoveries = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session, recovering it from the backend if it was evicted."""
+        with self._lock:
+            now = self._clock()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self.hits += 1
+                self._touch(session_id, now)
+                self._expire_idle(now)
+                return session
+
+            self.misses += 1
+            if self.backend is None:
+                return None
+            session = self.backend.load(session_id)
+            if session is None:
+                return None
+            self.recoveries += 1
+            self._admit(session_id, session, now)
+            return session
+
+    def put(self, session_id: str, session: Dict[str, Any]):
+        """Insert or refresh a resident session."""
+        with self._lock:
+            self._admit(session_id, session, self._clock())
+
+    def delete(self, session_id: str):
+        """Remove a session from memory."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._last_access.pop(session_id, None)
+
+    def evict_expired(self) -> int:
+        """Evict every session idle for longer than the TTL; returns the count."""
+        with self._lock:
+            return self._expire_idle(self._clock())
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get residency and hit/miss/eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            "resident": len(self._sessions),
+            "max_resident": self.max_resident,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "recoveries": self.recoveries,
+        }
+
+    def _touch(self, session_id: str, now: float):
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = now
+
+    def _admit(self, session_id: str, session: Dict[str, Any], now: float):
+        self._sessions[session_id] = session
+        self._touch(session_id, now)
+        self._expire_idle(now)
+        while len(self._sessions) > self.max_resident:
+            oldest_id = next(iter(self._sessions))
+            self._evict(oldest_id)
+            self.evictions += 1
+
+    def _expire_idle(self, now: float) -> int:
+        expired = 0
+        deadline = now - self.idle_ttl_seconds
+        while self._sessions:
+            oldest_id = next(iter(self._sessions))
+            if self._last_access[oldest_id] > deadline:
+                break
+            self._evict(oldest_id)
+            expired += 1
+        self.expirations += expired
+        return expired
+
+    def _evict(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._last_access.pop(session_id, None)
+        if self.on_evict is not None:
+            try:
+                self.on_evict(session_id, session)
+            except Exception as e:
+                print(f"Session eviction hook failed for {session_id}: {e}")
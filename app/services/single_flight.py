@@ -0,0 +1,168 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+Concurrent requests with the same key share one upstream call. Stream events
+are buffered as they arrive and each subscriber reads them through its own
+cursor, so a late joiner first gets the events already buffered and then the
+live tail. A flight is forgotten once it finishes; later requests start a
+new one.
+"""
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.config import settings
+from app.services.stream_events import StreamDelta
+
+
+class StreamAbandoned(Exception):
+    """Raised to subscribers still attached when a shared stream was cancelled."""
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.events: List[StreamDelta] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.open_error: Optional[Exception] = None
+        self.opened = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, event: StreamDelta):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self.opened.set()
+        self._notify()
+
+    async def wait(self):
+        await self._changed.wait()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and hand out a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.flights = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def stream(self, key: str,
+                     open_stream: Callable[[], Awaitable[AsyncIterator[StreamDelta]]]) -> AsyncIterator[StreamDelta]:
+        """
+        Join the in-flight stream for key, or start one with open_stream.
+
+        Errors opening the upstream stream are raised here, to every caller
+        sharing the flight, before any event is yielded.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            self.flights += 1
+            flight.task = asyncio.create_task(self._pump(key, flight, open_stream))
+        else:
+            self.coalesced += 1
+        # Counted from here so a caller waiting for the open, or not reading yet, keeps the flight alive
+        flight.subscribers += 1
+        try:
+            await flight.opened.wait()
+            if flight.open_error is not None:
+                raise flight.open_error
+        except BaseException:
+            # Cancelled before the stream opened, or the open failed
+            self._leave(key, flight)
+            raise
+        return self._subscribe(key, flight)
+
+    async def call(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Share the result of one non-streaming call among concurrent identical callers."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            self.flights += 1
+            future.add_done_callback(lambda done: self._forget_call(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller going away doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight_streams": len(self._streams),
+            "in_flight_calls": len(self._calls),
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+    async def _pump(self, key: str, flight: _StreamFlight, open_stream):
+        """Read the upstream stream into the flight's buffer."""
+        try:
+            try:
+                events = await open_stream()
+            except Exception as e:
+                flight.open_error = e
+                flight.finish(e)
+                return
+            flight.opened.set()
+            async with aclosing(events):
+                async for event in events:
+                    flight.append(event)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(StreamAbandoned("Upstream stream was cancelled"))
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            self._forget_stream(key, flight)
+
+    async def _subscribe(self, key: str, flight: _StreamFlight) -> AsyncIterator[StreamDelta]:
+        cursor = 0
+        try:
+            while True:
+                if cursor < len(flight.events):
+                    event = flight.events[cursor]
+                    cursor += 1
+                    yield event
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.wait()
+        finally:
+            self._leave(key, flight)
+
+    def _leave(self, key: str, flight: _StreamFlight):
+        flight.subscribers -= 1
+        # Nobody is waiting or reading any more: stop the upstream call instead of paying for it
+        if flight.subscribers == 0 and not flight.done and flight.task is not None:
+            self.abandoned += 1
+            self._forget_stream(key, flight)
+            flight.task.cancel()
+
+    def _forget_stream(self, key: str, flight: _StreamFlight):
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+
+    def _forget_call(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+
+# Global instance
+single_flight = SingleFlight(enabled=settings.single_flight_enabled)
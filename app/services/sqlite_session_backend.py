@@ -0,0 +1,195 @@
+"""
+SQLite session persistence backend.
+
+Sessions live in a single database in WAL mode. Every message is stored as
+its own appended row, so adding a message never rewrites the history.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.services.session_store import SessionBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    selected_tools TEXT NOT NULL DEFAULT '[]',
+    selected_data_sources TEXT NOT NULL DEFAULT '[]',
+    llm_name TEXT,
+    history_summary TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_email, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Session fields stored as columns; lists are stored as JSON text
+FIELD_COLUMNS = {
+    "user_email": False,
+    "selected_tools": True,
+    "selected_data_sources": True,
+    "llm_name": False,
+    "history_summary": True,
+}
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Session backend over a local SQLite database with append-only message rows."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        # Databases created before history summaries were kept
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "history_summary" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN history_summary TEXT")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(self, session_id: str, session: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, user_email, selected_tools, "
+                    "selected_data_sources, llm_name, history_summary, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        session_id,
+                        session["user_email"],
+                        json.dumps(session.get("selected_tools", [])),
+                        json.dumps(session.get("selected_data_sources", [])),
+                        session.get("llm_name"),
+                        json.dumps(session.get("history_summary")),
+                        now,
+                        now,
+                    ),
+                )
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._insert_messages(session_id, session.get("messages", []), now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_email, selected_tools, selected_data_sources, llm_name, history_summary "
+                "FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            messages = [
+                json.loads(message)
+                for (message,) in self._conn.execute(
+                    "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+                )
+            ]
+        return {
+            "user_email": row[0],
+            "messages": messages,
+            "selected_tools": json.loads(row[1]),
+            "selected_data_sources": json.loads(row[2]),
+            "llm_name": row[3],
+            "history_summary": json.loads(row[4]) if row[4] else None,
+        }
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def find_session_by_user(self, user_email: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT session_id FROM sessions WHERE user_email = ? ORDER BY updated_at DESC LIMIT 1",
+            (user_email,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def update_fields(self, session_id: str, fields: Dict[str, Any]):
+        if "messages" in fields:
+            fields = dict(fields)
+            self.replace_messages(session_id, fields.pop("messages"))
+        assignments = []
+        params = []
+        for name, value in fields.items():
+            if name not in FIELD_COLUMNS:
+                raise ValueError(f"Unknown session field: {name}")
+            assignments.append(f"{name} = ?")
+            params.append(json.dumps(value) if FIELD_COLUMNS[name] else value)
+        if not assignments:
+            return
+        params.extend([time.time(), session_id])
+        self._execute(
+            f"UPDATE sessions SET {', '.join(assignments)}, updated_at = ? WHERE session_id = ?",
+            tuple(params),
+        )
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, message, created_at) VALUES "
+                "(?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?), ?, ?)",
+                (session_id, session_id, json.dumps(message), now),
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+
+    def update_message(self, session_id: str, index: int, message: Dict[str, Any]):
+        # Rows are ordered by seq; index counts from the first remaining row
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET message = ? WHERE session_id = ? AND seq = "
+                "(SELECT seq FROM messages WHERE session_id = ? ORDER BY seq LIMIT 1 OFFSET ?)",
+                (json.dumps(message), session_id, session_id, index),
+            )
+
+    def replace_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._insert_messages(session_id, messages, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _insert_messages(self, session_id: str, messages: List[Dict[str, Any]], now: float):
+        self._conn.executemany(
+            "INSERT INTO messages (session_id, seq, message, created_at) VALUES (?, ?, ?, ?)",
+            [(session_id, seq, json.dumps(message), now) for seq, message in enumerate(messages)],
+        )
@@ -0,0 +1,71 @@
+"""
+Time-window coalescing of streamed content deltas.
+
+Some models send a delta per character, and each delta costs the client a
+frame, a JSON encode, a socket write and a re-render. The coalescer sits
+between the provider stream and the output channel (SSE response or
+WebSocket) and merges content deltas into one event per window or per
+max_bytes of buffered content, whichever comes first.
+
+The first delta after a quiet period goes out at once, so a slow stream,
+and the first token of every stream, is not delayed. Only deltas that
+follow within the window are buffered. Any other event (usage, status,
+tool calls, end of stream) flushes the buffer and is passed on in order.
+"""
+import asyncio
+from typing import Callable, List, Optional
+from app.services.stream_events import StreamDelta
+
+
+class StreamCoalescer:
+    def __init__(self, emit: Callable[[StreamDelta], None], window_seconds: float = 0.025, max_bytes: int = 1024):
+        self._emit = emit
+        self.window_seconds = window_seconds
+        self.max_bytes = max_bytes
+        self._loop = asyncio.get_running_loop()
+        self._parts: List[str] = []
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_sent = float("-inf")
+        self.received = 0
+        self.sent = 0
+
+    def push(self, event: StreamDelta):
+        if not _content_only(event) or self.window_seconds <= 0:
+            self.flush()
+            self._send(event)
+            return
+        self.received += 1
+        now = self._loop.time()
+        if not self._parts and now - self._last_sent >= self.window_seconds:
+            # Leading edge: nothing sent for a whole window, so this can't add to a burst
+            self.sent += 1
+            self._send(event)
+            return
+        self._parts.append(event.content)
+        self._size += len(event.content.encode("utf-8"))
+        if self._size >= self.max_bytes:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_at(self._last_sent + self.window_seconds, self.flush)
+
+    def flush(self):
+        """Send the buffered content now, as one delta."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._parts:
+            content = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            self.sent += 1
+            self._send(StreamDelta(content=content))
+
+    def _send(self, event: StreamDelta):
+        self._last_sent = self._loop.time()
+        self._emit(event)
+
+
+def _content_only(event: StreamDelta) -> bool:
+    return bool(event.content) and event.usage is None and not event.tool_calls \
+        and event.status is None and not event.done
@@ -0,0 +1,135 @@
+"""
+Normalized events of a streamed completion.
+
+Each provider's SSE stream is parsed once, line by line, by that
+provider's parser into StreamDelta events. The events pass through the
+client's layers (retries, fallbacks, caching, shared flights) as they are,
+and are serialized once, as the SSE frame sent to the browser.
+"""
+import json
+from typing import Any, Dict, Optional
+
+
+class StreamDelta:
+    """One event of a streamed completion, whatever the provider."""
+    __slots__ = ("content", "usage", "tool_calls", "status", "done")
+
+    def __init__(self, content: Optional[str] = None, usage: Optional[Dict[str, Any]] = None,
+                 tool_calls: Optional[list] = None, status: Optional[Dict[str, Any]] = None, done: bool = False):
+        self.content = content
+        # Token counts in OpenAI terms, with cache_read_tokens and cache_write_tokens
+        self.usage = usage
+        self.tool_calls = tool_calls
+        # Client-facing status event ({"type": "status", ...}), not model output
+        self.status = status
+        self.done = done
+
+    def sse(self) -> bytes:
+        """The event as the SSE frame sent to the browser."""
+        if self.status is not None:
+            return b"data: " + json.dumps(self.status).encode("utf-8") + b"\n\n"
+        if self.done:
+            return b"data: [DONE]\n\n"
+        # Same bytes as json.dumps({"content": ...}) without building the dict
+        return b'data: {"content": ' + json.dumps(self.content or "").encode("utf-8") + b"}\n\n"
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name))
+        return f"StreamDelta({fields})"
+
+
+DONE = StreamDelta(done=True)
+
+
+def status_event(status: Dict[str, Any]) -> StreamDelta:
+    return StreamDelta(status={"type": "status", **status})
+
+
+class OpenAIStreamParser:
+    """Parses an OpenAI-compatible chat completion stream, one SSE line at a time."""
+
+    def feed(self, line: str) -> Optional[StreamDelta]:
+        if not line.startswith("data:"):
+            return None
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return DONE
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+        choices = data.get("choices")
+        delta = (choices[0].get("delta") or {}) if choices else {}
+        content = delta.get("content")
+        tool_calls = delta.get("tool_calls")
+        usage = data.get("usage")
+        if not (content or tool_calls or usage):
+            return None
+        return StreamDelta(content=content or None, usage=openai_usage(usage) if usage else None,
+                           tool_calls=tool_calls)
+
+
+class AnthropicStreamParser:
+    """Parses an Anthropic messages stream, one SSE line at a time."""
+
+    def __init__(self):
+        self._usage: Dict[str, Any] = {}
+
+    def feed(self, line: str) -> Optional[StreamDelta]:
+        if not line.startswith("data:"):
+            return None
+        try:
+            data = json.loads(line[5:])
+        except json.JSONDecodeError:
+            return None
+        kind = data.get("type")
+        if kind == "content_block_delta":
+            text = data.get("delta", {}).get("text")
+            return StreamDelta(content=text) if text else None
+        if kind == "message_start":
+            # Input and cache token counts arrive first; output tokens with message_delta
+            self._usage = data.get("message", {}).get("usage", {})
+        elif kind == "message_delta" and data.get("usage"):
+            return StreamDelta(usage=anthropic_usage({**self._usage, **data["usage"]}))
+        elif kind == "message_stop":
+            return DONE
+        return None
+
+
+PARSERS = {
+    "openai": OpenAIStreamParser,
+    "anthropic": AnthropicStreamParser,
+}
+
+
+def stream_parser(provider: str):
+    """A new parser for one stream from provider."""
+    try:
+        return PARSERS[provider]()
+    except KeyError:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def openai_usage(usage: dict) -> dict:
+    """OpenAI usage with cache counts under the same keys used for Anthropic."""
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        **usage,
+        "cache_read_tokens": details.get("cached_tokens", 0),
+        "cache_write_tokens": 0,
+    }
+
+
+def anthropic_usage(usage: dict) -> dict:
+    """
+    Anthropic usage in OpenAI terms. Anthropic's input_tokens exclude cached
+    tokens, so prompt_tokens adds the cache reads and writes back in.
+    """
+    cache_read = usage.get("cache_read_input_tokens") or 0
+    cache_write = usage.get("cache_creation_input_tokens") or 0
+    return {
+        "prompt_tokens": (usage.get("input_tokens") or 0) + cache_read + cache_write,
+        "completion_tokens": usage.get("output_tokens") or 0,
+        "cache_read_tokens": cache_read,
+        "cache_write_tokens": cache_write,
+    }
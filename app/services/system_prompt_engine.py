@@ -1,50 +1,95 @@
 """
 System Prompt Engine for dynamic prompt generation based on tool and data source selections.
 """
-import os
-from typing import List, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 from app.config import settings
 from app.services.data_source_manager import data_source_manager
+from app.services.prompt_registry import prompt_registry
+from app.services.token_counter import token_counter
 
 
 class SystemPromptEngine:
-    def __init__(self):
-        self.base_prompt = None  # Load lazily to avoid circular imports
-        
-    def _load_base_prompt(self) -> str:
-        """Load base system prompt from various sources with fallback."""
-        # Priority 1: Environment override
+    def __init__(self, max_cache_entries: int = 256):
+        self.base_prompt = None  # Pinned base prompt; None follows settings and the prompt file
+        # Bumped whenever the base prompt changes, so cached prompts are rebuilt
+        self.base_prompt_version = 0
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _get_base_prompt(self) -> str:
+        """Get the base prompt: explicitly set, environment override, prompt file, then default."""
+        if self.base_prompt is not None:
+            return self.base_prompt
         if settings.system_prompt_override:
             return settings.system_prompt_override
-            
-        # Priority 2: Global loaded content (avoid circular import)
-        try:
-            import app.main
-            if hasattr(app.main, 'SYSTEM_PROMPT_CONTENT') and app.main.SYSTEM_PROMPT_CONTENT:
-                return app.main.SYSTEM_PROMPT_CONTENT
-        except ImportError:
-            pass
-            
-        # Priority 3: Read from file
-        try:
-            with open("system_prompt.md", "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            pass
-            
-        # Priority 4: Default fallback
-        return "You are a helpful AI assistant."
-    
-    def _get_base_prompt(self) -> str:
-        """Get base prompt, loading lazily if needed."""
-        if self.base_prompt is None:
-            self.base_prompt = self._load_base_prompt()
-        return self.base_prompt
-    
+        return prompt_registry.base_prompt() or "You are a helpful AI assistant."
+
+    def set_base_prompt(self, base_prompt: Optional[str]):
+        """Pin the base prompt (None follows the prompt file again) and invalidate cached prompts."""
+        with self._cache_lock:
+            self.base_prompt = base_prompt
+            self.base_prompt_version += 1
+            self._cache.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get prompt cache size and hit/miss counters."""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_cache_entries,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "base_prompt_version": self.base_prompt_version,
+            "prompt_registry_version": prompt_registry.version,
+            "data_source_version": data_source_manager.version,
+        }
+
     def generate_system_prompt(self, 
                              selected_tools: Optional[List[str]] = None, 
                              selected_data_sources: Optional[List[str]] = None) -> str:
-        """Generate complete system prompt based on selections."""
+        """
+        Generate complete system prompt based on selections.
+
+        Selections are normalized (sorted, deduplicated), so the same set in any
+        order gives the same prompt, and composed prompts are memoized per set.
+        """
+        tools = tuple(sorted(set(selected_tools or ())))
+        data_sources = tuple(sorted(set(selected_data_sources or ())))
+        prompt_registry.refresh()
+        key = (self.base_prompt_version, prompt_registry.version, data_source_manager.version,
+               settings.system_prompt_override, tools, data_sources)
+        with self._cache_lock:
+            prompt = self._cache.get(key)
+            if prompt is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return prompt
+            self.cache_misses += 1
+
+        prompt = self._compose_system_prompt(list(tools), list(data_sources))
+        with self._cache_lock:
+            # Skip storing if the base prompt or data sources changed while composing
+            if key[:3] == (self.base_prompt_version, prompt_registry.version, data_source_manager.version):
+                self._cache[key] = prompt
+                while len(self._cache) > self.max_cache_entries:
+                    self._cache.popitem(last=False)
+        return prompt
+
+    def data_source_tokens(self, selected_data_sources: Optional[List[str]],
+                           provider: str = "openai") -> Dict[str, int]:
+        """Token count of each selected data source's block."""
+        return {
+            data_source: token_counter.count_text(data_source_manager.get_data_source_content([data_source]), provider)
+            for data_source in sorted(set(selected_data_sources or ()))
+        }
+
+    def _compose_system_prompt(self, selected_tools: List[str], selected_data_sources: List[str]) -> str:
         prompt_parts = [self._get_base_prompt()]
         
         # Add data sources context
@@ -76,37 +121,13 @@ class SystemPromptEngine:
         return "You have access to the following data sources: " + ", ".join(data_sources)
     
     def _generate_tools_context(self, tools: List[str]) -> str:
-        """Generate context for selected tools."""
+        """Generate context for selected tools from their prompt fragments."""
         if not tools:
             return ""
-            
-        tool_contexts = []
-        
-        for tool in tools:
-            if tool == "calculator":
-                tool_contexts.append(
-                    "You have access to a calculator and should use it for any mathematical "
-                    "calculations. Frame your thinking process around calculations and show "
-                    "your mathematical reasoning clearly."
-                )
-            elif tool == "code_execution":
-                tool_contexts.append(
-                    "You have access to code execution capabilities. You can discuss code "
-                    "examples and programming concepts with confidence."
-                )
-            elif tool == "user_lookup":
-                tool_contexts.append(
-                    "You have access to user lookup capabilities for organizational "
-                    "information and staff directories."
-                )
-            elif tool == "sql_query":
-                tool_contexts.append(
-                    "You have access to database query capabilities for retrieving "
-                    "structured data and generating reports."
-                )
-        
+
+        tool_contexts = [fragment for fragment in (prompt_registry.get("tools", tool) for tool in tools) if fragment]
         return "\n".join(tool_contexts) if tool_contexts else ""
 
 
 # Global instance
-system_prompt_engine = SystemPromptEngine()
\ No newline at end of file
+system_prompt_engine = SystemPromptEngine(max_cache_entries=settings.prompt_cache_max_entries)
@@ -0,0 +1,126 @@
+"""
+Local token counting for prompts, messages and data-source blocks.
+
+Counts are fast approximations per provider family, tuned to land close
+to the providers' tokenizers for English prose and code. OpenAI counts are
+exact when the optional tiktoken package is installed. Text counts are
+cached by string, and message counts by message object, so a turn only
+pays for what is new.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Average characters per token for each provider family's tokenizer
+CHARS_PER_TOKEN = {
+    "openai": 4.0,
+    "anthropic": 3.5,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Per-message framing overhead (role, separators) added by chat formats
+MESSAGE_OVERHEAD_TOKENS = {
+    "openai": 4,
+    "anthropic": 3,
+}
+DEFAULT_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _tiktoken_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+class TokenCounter:
+    def __init__(self, max_cached_texts: int = 4096, max_cached_messages: int = 20000):
+        self.max_cached_texts = max_cached_texts
+        self.max_cached_messages = max_cached_messages
+        self._lock = threading.Lock()
+        self._texts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        # id(message) -> (message, provider, content, count); the message is held so its id isn't reused
+        self._messages: "OrderedDict[int, Tuple[Dict[str, Any], str, Any, int]]" = OrderedDict()
+        self._encoding = None
+        self._encoding_loaded = False
+        self.text_hits = 0
+        self.text_misses = 0
+        self.message_hits = 0
+        self.message_misses = 0
+
+    def count_text(self, text: Optional[str], provider: str = "openai") -> int:
+        """Approximate token count of a text block, cached by (provider, text)."""
+        if not text:
+            return 0
+        key = (provider, text)
+        with self._lock:
+            count = self._texts.get(key)
+            if count is not None:
+                self._texts.move_to_end(key)
+                self.text_hits += 1
+                return count
+            self.text_misses += 1
+        count = self._count(text, provider)
+        with self._lock:
+            self._texts[key] = count
+            while len(self._texts) > self.max_cached_texts:
+                self._texts.popitem(last=False)
+        return count
+
+    def count_message(self, message: Dict[str, Any], provider: str = "openai") -> int:
+        """Token count of one chat message including framing, cached per message object."""
+        content = message.get("content") or ""
+        with self._lock:
+            cached = self._messages.get(id(message))
+            if cached is not None and cached[0] is message and cached[1] == provider and cached[2] is content:
+                self._messages.move_to_end(id(message))
+                self.message_hits += 1
+                return cached[3]
+            self.message_misses += 1
+        # Large repeated blocks (system prompts) hit the text cache; one-off messages skip it
+        if len(content) > 2048:
+            count = self.count_text(content, provider)
+        else:
+            count = self._count(content, provider) if content else 0
+        count += MESSAGE_OVERHEAD_TOKENS.get(provider, DEFAULT_MESSAGE_OVERHEAD_TOKENS)
+        with self._lock:
+            self._messages[id(message)] = (message, provider, content, count)
+            while len(self._messages) > self.max_cached_messages:
+                self._messages.popitem(last=False)
+        return count
+
+    def forget_messages(self, messages: List[Dict[str, Any]]):
+        """Drop cached counts for these message objects, e.g. when their session leaves memory."""
+        with self._lock:
+            for message in messages:
+                cached = self._messages.get(id(message))
+                if cached is not None and cached[0] is message:
+                    del self._messages[id(message)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_texts": len(self._texts),
+            "cached_messages": len(self._messages),
+            "text_hits": self.text_hits,
+            "text_misses": self.text_misses,
+            "message_hits": self.message_hits,
+            "message_misses": self.message_misses,
+            "exact_openai": self._encoding is not None,
+        }
+
+    def _count(self, text: str, provider: str) -> int:
+        if provider == "openai":
+            if not self._encoding_loaded:
+                self._encoding = _tiktoken_encoding()
+                self._encoding_loaded = True
+            if self._encoding is not None:
+                return len(self._encoding.encode(text, disallowed_special=()))
+        chars_per_token = CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN)
+        # Non-ASCII text tokenizes much denser; count each extra UTF-8 byte as more text
+        weighted_length = len(text) if text.isascii() else len(text.encode("utf-8"))
+        return max(1, int(weighted_length / chars_per_token + 0.5))
+
+
+# Global instance
+token_counter = TokenCounter()
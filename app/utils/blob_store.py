@@ -0,0 +1,99 @@
+"""
+Content-addressed blob store for large, repeated log payloads.
+
+Each distinct text is written once under its SHA-256 digest; log events
+carry the digest instead of the text. A blob's mtime is refreshed while it
+is still being used (at most once per touch_interval), so pruning by mtime
+only removes blobs no recent log event refers to.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class BlobStore:
+    def __init__(self, directory: str, max_known: int = 10000, touch_interval: float = 3600.0):
+        self.directory = directory
+        self.max_known = max_known
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        # Digests already on disk -> when their mtime was last refreshed, so repeated puts skip the filesystem
+        self._known: "OrderedDict[str, float]" = OrderedDict()
+        self.writes = 0
+        self.dedup_hits = 0
+        self.pruned = 0
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.txt")
+
+    def put(self, text: str) -> str:
+        """Store text if it is new and return its digest."""
+        digest = self.digest(text)
+        now = time.time()
+        with self._lock:
+            touched = self._known.get(digest)
+            if touched is not None:
+                self._known.move_to_end(digest)
+        if touched is not None and now - touched < self.touch_interval:
+            self.dedup_hits += 1
+            return digest
+
+        path = self.path_for(digest)
+        try:
+            # Still in use: keep it out of the next prune
+            os.utime(path)
+            self.dedup_hits += 1
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            self.writes += 1
+
+        with self._lock:
+            self._known[digest] = now
+            self._known.move_to_end(digest)
+            while len(self._known) > self.max_known:
+                self._known.popitem(last=False)
+        return digest
+
+    def get(self, digest: str) -> Optional[str]:
+        """Get the text for a digest, or None if it is not stored."""
+        try:
+            with open(self.path_for(digest), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def prune(self, older_than: float) -> int:
+        """Remove blobs not written or used since older_than (a time.time() timestamp); returns how many."""
+        removed = 0
+        for root, _, files in os.walk(self.directory, topdown=False):
+            for file_name in files:
+                if not file_name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    if os.stat(path).st_mtime >= older_than:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    self._known.pop(file_name[:-len(".txt")], None)
+                removed += 1
+            if root != self.directory:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass  # Not empty
+        self.pruned += removed
+        return removed
@@ -0,0 +1,243 @@
+"""
+Background housekeeping for the logs/ directory.
+
+Session logs are rotated into logs/archive/<date>/ when they grow past a
+size limit or their first event is older than an age limit. Writers in
+other worker processes notice the rename and reopen the log before their
+next write. Rotated segments are compressed once they have been left
+untouched for settle_seconds, so a write racing the rename isn't lost.
+Archived segments, leftover download files and prompt blobs no longer in
+use are removed once they pass their retention period. All file work runs
+in a worker thread so request handling never waits on it.
+"""
+import asyncio
+import gzip
+import os
+import shutil
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Optional
+from app.config import settings
+from app.utils.session_logger import LOGS_DIR, prompt_blob_store, session_event_writer
+
+ARCHIVE_DIR = os.path.join(LOGS_DIR, "archive")
+DOWNLOAD_PREFIX = "chat_session_"
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class LogHousekeeper:
+    def __init__(self,
+                 logs_dir: str = LOGS_DIR,
+                 archive_dir: str = ARCHIVE_DIR,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 max_age_seconds: float = 86400.0,
+                 compression: str = "gzip",
+                 retention_seconds: float = 30 * 86400.0,
+                 download_retention_seconds: float = 3600.0,
+                 blob_retention_seconds: float = 30 * 86400.0,
+                 interval_seconds: float = 300.0,
+                 settle_seconds: float = 10.0,
+                 writer=session_event_writer,
+                 blob_store=prompt_blob_store,
+                 clock=time.time):
+        self.logs_dir = logs_dir
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.compression = compression
+        self.retention_seconds = retention_seconds
+        self.download_retention_seconds = download_retention_seconds
+        self.blob_retention_seconds = blob_retention_seconds
+        self.interval_seconds = interval_seconds
+        self.settle_seconds = settle_seconds
+        self.writer = writer
+        self.blob_store = blob_store
+        self._clock = clock
+        self._task: Optional[asyncio.Task] = None
+        # inode -> first event time, so each segment's first line is read once
+        self._segment_starts: Dict[int, float] = {}
+        if compression == "zstd" and _zstandard() is None:
+            print("log_compression 'zstd' requires the 'zstandard' package; using gzip")
+            self.compression = "gzip"
+        self.runs = 0
+        self.rotated = 0
+        self.compressed = 0
+        self.deleted = 0
+        self.errors = 0
+        self.last_run_seconds = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def run_once(self):
+        """Rotate, compress and prune once. Blocking; call from a worker thread."""
+        started = time.monotonic()
+        now = self._clock()
+        self._rotate_session_logs(now)
+        self._compress_pending(now)
+        self._prune_archive(now)
+        self._prune_downloads(now)
+        self._prune_blobs(now)
+        self.runs += 1
+        self.last_run_seconds = time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "rotated": self.rotated,
+            "compressed": self.compressed,
+            "deleted": self.deleted,
+            "errors": self.errors,
+            "last_run_seconds": self.last_run_seconds,
+            "compression": self.compression,
+        }
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.errors += 1
+                print(f"Log housekeeping failed: {e}")
+
+    def _rotate_session_logs(self, now: float):
+        try:
+            entries = list(os.scandir(self.logs_dir))
+        except FileNotFoundError:
+            return
+        known_starts, self._segment_starts = self._segment_starts, {}
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(".jsonl"):
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_size == 0:
+                    continue
+                started = known_starts.get(stat.st_ino)
+                if started is None:
+                    started = self._segment_started(entry.path, stat.st_mtime)
+                if stat.st_size >= self.max_bytes or now - started >= self.max_age_seconds:
+                    self._rotate(entry.path, entry.name, now)
+                else:
+                    self._segment_starts[stat.st_ino] = started
+            except OSError as e:
+                self.errors += 1
+                print(f"Failed to rotate session log {entry.path}: {e}")
+
+    def _rotate(self, path: str, name: str, now: float):
+        rotated_at = datetime.fromtimestamp(now, UTC)
+        day_dir = os.path.join(self.archive_dir, rotated_at.strftime("%Y-%m-%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        stem = name[:-len(".jsonl")]
+        segment = os.path.join(day_dir, f"{stem}.{rotated_at.strftime('%H%M%S%f')}.jsonl")
+        self.writer.detach(path, segment)
+        self.rotated += 1
+
+    def _segment_started(self, path: str, mtime: float) -> float:
+        # The first event's timestamp marks when this segment was started
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                first_line = f.readline()
+            timestamp = first_line.split('"timestamp": "', 1)[1].split('"', 1)[0]
+            return datetime.fromisoformat(timestamp).timestamp()
+        except (IndexError, ValueError, OSError):
+            return mtime
+
+    def _compress_pending(self, now: float):
+        if self.compression == "none":
+            return
+        settled = now - self.settle_seconds
+        for root, _, files in os.walk(self.archive_dir):
+            for file_name in files:
+                if file_name.endswith(".jsonl"):
+                    path = os.path.join(root, file_name)
+                    try:
+                        if os.path.getmtime(path) > settled:
+                            # Rotated just now; another worker may still be finishing a write to it
+                            continue
+                        self._compress(path)
+                        self.compressed += 1
+                    except OSError as e:
+                        self.errors += 1
+                        print(f"Failed to compress log segment {path}: {e}")
+
+    def _compress(self, path: str):
+        if self.compression == "zstd":
+            target = f"{path}.zst"
+            with open(path, "rb") as src, open(f"{target}.tmp", "wb") as dst:
+                _zstandard().ZstdCompressor().copy_stream(src, dst)
+        else:
+            target = f"{path}.gz"
+            with open(path, "rb") as src, gzip.open(f"{target}.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        os.replace(f"{target}.tmp", target)
+        os.remove(path)
+
+    def _prune_archive(self, now: float):
+        deadline = now - self.retention_seconds
+        for root, dirs, files in os.walk(self.archive_dir, topdown=False):
+            for file_name in files:
+                self._remove_if_older(os.path.join(root, file_name), deadline)
+            if root != self.archive_dir:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass  # Not empty
+
+    def _prune_downloads(self, now: float):
+        deadline = now - self.download_retention_seconds
+        try:
+            entries = list(os.scandir(self.logs_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_file() and entry.name.startswith(DOWNLOAD_PREFIX) and entry.name.endswith(".txt"):
+                self._remove_if_older(entry.path, deadline)
+
+    def _prune_blobs(self, now: float):
+        try:
+            self.deleted += self.blob_store.prune(now - self.blob_retention_seconds)
+        except OSError as e:
+            self.errors += 1
+            print(f"Failed to prune prompt blobs: {e}")
+
+    def _remove_if_older(self, path: str, deadline: float):
+        try:
+            if os.stat(path).st_mtime < deadline:
+                os.remove(path)
+                self.deleted += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.errors += 1
+            print(f"Failed to remove old log file {path}: {e}")
+
+
+# Global instance
+log_housekeeper = LogHousekeeper(
+    max_bytes=settings.log_rotate_max_bytes,
+    max_age_seconds=settings.log_rotate_max_age_seconds,
+    compression=settings.log_compression,
+    retention_seconds=settings.log_retention_days * 86400.0,
+    download_retention_seconds=settings.log_download_retention_seconds,
+    blob_retention_seconds=settings.log_blob_retention_days * 86400.0,
+    interval_seconds=settings.log_housekeeping_interval_seconds,
+)
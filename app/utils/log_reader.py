@@ -0,0 +1,75 @@
+"""
+Reader for session event logs.
+
+Re-inflates content-addressed references (such as system_prompt_sha256)
+back into full events for export and debugging.
+
+Usage:
+    python -m app.utils.log_reader logs/<session_id>.jsonl [more.jsonl ...]
+
+Rotated segments compressed with gzip (.gz) or zstd (.zst) are read as well.
+"""
+import gzip
+import io
+import json
+import sys
+from typing import Any, Dict, Iterator, Optional
+from app.utils.blob_store import BlobStore
+from app.utils.session_logger import prompt_blob_store
+
+USAGE = "Usage: python -m app.utils.log_reader logs/<session_id>.jsonl [more.jsonl ...]"
+
+# Event field holding a digest -> field the inflated text is restored to
+BLOB_FIELDS = {"system_prompt_sha256": "system_prompt"}
+
+
+def inflate_event(event: Dict[str, Any], blob_store: Optional[BlobStore] = None) -> Dict[str, Any]:
+    """Return a copy of the event with blob references replaced by their text."""
+    blob_store = blob_store or prompt_blob_store
+    inflated = dict(event)
+    for digest_field, text_field in BLOB_FIELDS.items():
+        digest = inflated.get(digest_field)
+        if digest and text_field not in inflated:
+            inflated[text_field] = blob_store.get(digest)
+    return inflated
+
+
+def open_log(path: str):
+    """Open a session log or rotated segment for reading text."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst log segments requires the 'zstandard' package: pip install zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_session_events(path: str, inflate: bool = True,
+                        blob_store: Optional[BlobStore] = None) -> Iterator[Dict[str, Any]]:
+    """Iterate over the events of one session log file."""
+    with open_log(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            yield inflate_event(event, blob_store) if inflate else event
+
+
+def main(argv=None):
+    paths = (argv if argv is not None else sys.argv[1:])
+    if not paths:
+        print(USAGE, file=sys.stderr)
+        return 1
+    for path in paths:
+        for event in iter_session_events(path):
+            sys.stdout.write(json.dumps(event) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
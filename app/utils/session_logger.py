@@ -1,26 +1,253 @@
-
-
-import json
-import os
-from datetime import datetime, UTC
-from app.config import settings
-
-LOGS_DIR = "logs"
-
-def log_session_event(session_id: str, event: dict):
-    """
-    Logs a session event to a .jsonl file.
-
-    Args:
-        session_id: The ID of the session.
-        event: The event to log.
-    """
-    if not os.path.exists(LOGS_DIR):
-        os.makedirs(LOGS_DIR)
-
-    # Prepend "test_" to log file name when running in test mode
-    filename = f"test_{session_id}.jsonl" if settings.test_mode else f"{session_id}.jsonl"
-    log_file = os.path.join(LOGS_DIR, filename)
-    with open(log_file, "a") as f:
-        event["timestamp"] = datetime.now(UTC).isoformat()
-        f.write(json.dumps(event) + "\n")
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.utils.blob_store import BlobStore
+
+LOGS_DIR = "logs"
+BLOBS_DIR = os.path.join(LOGS_DIR, "blobs")
+
+_STOP = object()
+
+
+class SessionEventWriter:
+    """
+    Background writer for session event logs.
+
+    Events are queued by log_session_event and written by a single thread in
+    per-file batches, flushed when a batch reaches batch_max_events or when
+    flush_interval seconds have passed. Open file handles are kept in a
+    bounded LRU so busy sessions don't reopen their log on every event.
+    Like logging.handlers.WatchedFileHandler, a cached handle is reopened
+    when its path now names another file, i.e. the log was rotated by
+    housekeeping in another worker process.
+    """
+
+    def __init__(self,
+                 max_queue: int = 10000,
+                 batch_max_events: int = 256,
+                 flush_interval: float = 0.25,
+                 max_open_files: int = 128):
+        self.max_queue = max_queue
+        self.batch_max_events = batch_max_events
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._handles: "OrderedDict[str, Any]" = OrderedDict()
+        self._handles_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.write_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the writer thread; until then events are written synchronously."""
+        if self.running:
+            return
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                        name="session-event-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush everything queued, close file handles and stop the thread."""
+        events_queue, self._queue = self._queue, None
+        if events_queue is None:
+            return
+        events_queue.put(_STOP, timeout=timeout)
+        self._thread.join(timeout)
+        self._thread = None
+        self.close_handles()
+
+    def submit(self, log_file: str, event: Dict[str, Any]):
+        """Queue an event, or write it immediately when the writer is not running."""
+        events_queue = self._queue
+        if events_queue is None:
+            self._write_unbuffered(log_file, event)
+            return
+        try:
+            events_queue.put_nowait((log_file, event))
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far has been written."""
+        events_queue = self._queue
+        if events_queue is None:
+            return True
+        done = threading.Event()
+        events_queue.put(done, timeout=timeout)
+        return done.wait(timeout)
+
+    def close_handles(self, paths: Optional[List[str]] = None):
+        """Close cached handles (all, or only the given paths)."""
+        with self._handles_lock:
+            for path in list(paths if paths is not None else self._handles.keys()):
+                handle = self._handles.pop(path, None)
+                if handle is not None:
+                    handle.close()
+
+    def detach(self, log_file: str, new_path: str):
+        """
+        Close the handle for a log file and rename it, so the next event
+        starts a fresh file. Holding the handle lock keeps the writer thread
+        from appending to the old file while it is being moved.
+        """
+        with self._handles_lock:
+            handle = self._handles.pop(log_file, None)
+            if handle is not None:
+                handle.close()
+            os.replace(log_file, new_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "write_errors": self.write_errors,
+            "open_files": len(self._handles),
+        }
+
+    def _run(self, events_queue: queue.Queue):
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        pending_count = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = events_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write_pending(pending)
+                return
+            if isinstance(item, threading.Event):
+                self._write_pending(pending)
+                pending, pending_count, last_flush = {}, 0, time.monotonic()
+                item.set()
+                continue
+            if item is not None:
+                log_file, event = item
+                pending.setdefault(log_file, []).append(event)
+                pending_count += 1
+
+            if pending_count >= self.batch_max_events or time.monotonic() - last_flush >= self.flush_interval:
+                self._write_pending(pending)
+                pending, pending_count, last_flush = {}, 0, time.monotonic()
+
+    def _write_pending(self, pending: Dict[str, List[Dict[str, Any]]]):
+        if not pending:
+            return
+        self.flushes += 1
+        for log_file, events in pending.items():
+            lines = []
+            for event in events:
+                try:
+                    lines.append(json.dumps(event) + "\n")
+                except (TypeError, ValueError) as e:
+                    # One bad event must not take the writer thread down with it
+                    self.write_errors += 1
+                    print(f"Dropping unserializable event for {log_file}: {e}")
+            if not lines:
+                continue
+            data = "".join(lines)
+            try:
+                with self._handles_lock:
+                    handle = self._get_handle(log_file)
+                    handle.write(data)
+                    handle.flush()
+                self.written += len(lines)
+            except OSError as e:
+                self.write_errors += 1
+                print(f"Failed to write session log {log_file}: {e}")
+
+    def _get_handle(self, log_file: str):
+        handle = self._handles.get(log_file)
+        if handle is not None:
+            if _same_file(handle, log_file):
+                self._handles.move_to_end(log_file)
+                return handle
+            del self._handles[log_file]
+            handle.close()
+        handle = _open_for_append(log_file)
+        self._handles[log_file] = handle
+        while len(self._handles) > self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        return handle
+
+    def _write_unbuffered(self, log_file: str, event: Dict[str, Any]):
+        with _open_for_append(log_file) as f:
+            f.write(json.dumps(event) + "\n")
+
+
+def _open_for_append(log_file: str):
+    # Only create the directory when it is missing, instead of checking every time
+    try:
+        return open(log_file, "a")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        return open(log_file, "a")
+
+
+def _same_file(handle, log_file: str) -> bool:
+    """Whether log_file still names the file the handle has open."""
+    try:
+        path_stat = os.stat(log_file)
+    except FileNotFoundError:
+        return False
+    handle_stat = os.fstat(handle.fileno())
+    return (path_stat.st_dev, path_stat.st_ino) == (handle_stat.st_dev, handle_stat.st_ino)
+
+
+# Global instance
+session_event_writer = SessionEventWriter(
+    max_queue=settings.log_queue_max_events,
+    batch_max_events=settings.log_batch_max_events,
+    flush_interval=settings.log_flush_interval_seconds,
+    max_open_files=settings.log_max_open_files,
+)
+
+# Distinct system prompts, referenced from log events by digest
+prompt_blob_store = BlobStore(BLOBS_DIR)
+
+
+def log_session_event(session_id: str, event: dict):
+    """
+    Logs a session event to a .jsonl file.
+
+    The event is timestamped now and handed to the background writer, so
+    the caller never waits on file I/O once the writer has been started.
+    Events must not be mutated after they are logged.
+
+    Args:
+        session_id: The ID of the session.
+        event: The event to log.
+    """
+    # Prepend "test_" to log file name when running in test mode
+    filename = f"test_{session_id}.jsonl" if settings.test_mode else f"{session_id}.jsonl"
+    log_file = os.path.join(LOGS_DIR, filename)
+    event["timestamp"] = datetime.now(UTC).isoformat()
+    session_event_writer.submit(log_file, event)
+
+
+def store_prompt_blob(text: str) -> str:
+    """Store a prompt once in the blob store and return its digest for log events."""
+    return prompt_blob_store.put(text)
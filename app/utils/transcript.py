@@ -0,0 +1,68 @@
+"""
+Chat transcript rendering for downloads.
+
+Transcripts are produced piece by piece from generators, so a download
+never builds the whole document in memory or on disk.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+# format -> (media type, file extension)
+TRANSCRIPT_FORMATS = {
+    "txt": ("text/plain", "txt"),
+    "md": ("text/markdown", "md"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+def iter_transcript(session_id: str, session: Dict[str, Any], llm_name: str, fmt: str = "txt") -> Iterator[str]:
+    """Yield the transcript of a session in the given format, one chunk per message."""
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"Unsupported transcript format: {fmt}")
+    # Snapshot the list so messages appended while streaming don't change the download
+    messages = list(session.get("messages", []))
+    selected_tools = session.get("selected_tools", [])
+    selected_data_sources = session.get("selected_data_sources", [])
+    timestamp = datetime.now().isoformat()
+    renderer = {"txt": _iter_txt, "md": _iter_md, "jsonl": _iter_jsonl}[fmt]
+    return renderer(session_id, messages, llm_name, selected_tools, selected_data_sources, timestamp)
+
+
+def _iter_txt(session_id: str, messages: List[Dict[str, Any]], llm_name: str,
+              selected_tools: List[str], selected_data_sources: List[str], timestamp: str) -> Iterator[str]:
+    yield (
+        f"Chat Session ID: {session_id}\n"
+        f"Timestamp: {timestamp}\n"
+        f"Selected LLM: {llm_name}\n"
+        f"Selected Tools: {', '.join(selected_tools) if selected_tools else 'None'}\n"
+        f"Selected Data Sources: {', '.join(selected_data_sources) if selected_data_sources else 'None'}\n\n"
+    )
+    for msg in messages:
+        yield f"{msg.get('role', 'unknown').capitalize()}: {msg.get('content', '')}\n\n"
+
+
+def _iter_md(session_id: str, messages: List[Dict[str, Any]], llm_name: str,
+             selected_tools: List[str], selected_data_sources: List[str], timestamp: str) -> Iterator[str]:
+    yield (
+        f"# Chat Session {session_id}\n\n"
+        f"- **Timestamp:** {timestamp}\n"
+        f"- **Selected LLM:** {llm_name}\n"
+        f"- **Selected Tools:** {', '.join(selected_tools) if selected_tools else 'None'}\n"
+        f"- **Selected Data Sources:** {', '.join(selected_data_sources) if selected_data_sources else 'None'}\n\n"
+    )
+    for msg in messages:
+        yield f"## {msg.get('role', 'unknown').capitalize()}\n\n{msg.get('content', '')}\n\n"
+
+
+def _iter_jsonl(session_id: str, messages: List[Dict[str, Any]], llm_name: str,
+                selected_tools: List[str], selected_data_sources: List[str], timestamp: str) -> Iterator[str]:
+    yield json.dumps({
+        "session_id": session_id,
+        "timestamp": timestamp,
+        "llm_name": llm_name,
+        "selected_tools": selected_tools,
+        "selected_data_sources": selected_data_sources,
+    }) + "\n"
+    for msg in messages:
+        yield json.dumps(msg) + "\n"
@@ -0,0 +1,139 @@
+"""
+Benchmark: concurrent SSE chat streams sustained by a single worker.
+
+Compares the legacy sync-generator route (each stream iterated in the anyio
+threadpool, blocking a thread per token) against the async
+POST /chat/{session_id}/message pipeline. The provider is faked with a fixed
+per-token delay so the numbers reflect the serving path only.
+
+A concurrency level is "sustained" while the whole batch finishes within
+1.5x the time a single stream takes on its own.
+
+Usage:
+    python benchmarks/bench_concurrent_streams.py [--tokens 50] [--delay-ms 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.routers import chat
+from app.services.session_manager import session_manager
+from app.services.stream_events import DONE, StreamDelta
+from app.utils.session_logger import session_event_writer
+
+LEVELS = [10, 50, 100, 200, 400, 800]
+
+
+def _chunk(index: int) -> bytes:
+    return f'data: {{"choices": [{{"delta": {{"content": "tok{index} "}}}}]}}'.encode()
+
+
+def build_legacy_app(tokens: int, delay: float) -> FastAPI:
+    """Replica of the pre-async route: a sync generator over a blocking stream."""
+    app = FastAPI()
+
+    def blocking_stream():
+        for i in range(tokens):
+            time.sleep(delay)
+            yield _chunk(i)
+        yield b"data: [DONE]"
+
+    @app.post("/chat/{session_id}/message")
+    def legacy_message(session_id: str):
+        def generate_response():
+            for chunk in blocking_stream():
+                chunk = chunk[len(b"data:"):].strip()
+                if chunk == b"[DONE]":
+                    break
+                content = json.loads(chunk)["choices"][0]["delta"].get("content", "")
+                yield f"data: {json.dumps({'content': content})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate_response(), media_type="text/event-stream")
+
+    return app
+
+
+def build_async_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def fake_auth(request, call_next):
+        request.state.user_email = "bench@example.com"
+        return await call_next(request)
+
+    app.include_router(chat.router)
+    return app
+
+
+async def run_batch(app: FastAPI, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        session_ids = [session_manager.create_session(f"bench{i}@example.com") for i in range(concurrency)]
+
+        async def one(session_id):
+            response = await client.post(f"/chat/{session_id}/message", json={"content": "hi"})
+            assert response.text.endswith("data: [DONE]\n\n")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(s) for s in session_ids))
+        elapsed = time.perf_counter() - start
+
+        for session_id in session_ids:
+            session_manager.delete_session(session_id)
+        return elapsed
+
+
+def report(label: str, app: FastAPI, baseline: float):
+    print(f"\n{label}")
+    print(f"{'streams':>8} {'wall s':>8} {'x single':>9}  sustained")
+    sustained = 0
+    for level in LEVELS:
+        elapsed = asyncio.run(run_batch(app, level))
+        ratio = elapsed / baseline
+        ok = ratio <= 1.5
+        if ok:
+            sustained = level
+        print(f"{level:>8} {elapsed:>8.2f} {ratio:>9.1f}  {'yes' if ok else 'no'}")
+    print(f"=> sustains {sustained} concurrent streams")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    delay = args.delay_ms / 1000.0
+    settings.test_mode = True
+    session_event_writer.start()
+
+    async def fake_achat_completion(*_args, **_kwargs):
+        async def stream():
+            for i in range(args.tokens):
+                await asyncio.sleep(delay)
+                yield StreamDelta(content=f"tok{i} ")
+            yield DONE
+        return stream()
+
+    baseline = args.tokens * delay
+    print(f"{args.tokens} tokens/stream at {args.delay_ms:.0f} ms/token (single stream ~{baseline:.2f}s)")
+
+    report("legacy sync generator (threadpool)", build_legacy_app(args.tokens, delay), baseline)
+    with patch.object(chat.llm_client, "achat_completion", fake_achat_completion):
+        report("async pipeline", build_async_app(), baseline)
+    session_event_writer.stop()
+
+
+if __name__ == "__main__":
+    main()
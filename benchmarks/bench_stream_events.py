@@ -0,0 +1,128 @@
+"""
+Benchmark: per-token CPU cost of turning a provider stream into client SSE frames.
+
+Replays a recorded stream (synthesized once, 10k tokens by default) through
+the legacy conversion path and through the StreamDelta path, with no I/O,
+so the numbers are the parsing and serialization cost alone:
+
+- legacy: the client converted each Anthropic line to an OpenAI-shaped SSE
+  line (json.loads + json.dumps), then the route stripped "data:", parsed
+  it again and dumped the client frame (json.loads + json.dumps).
+  OpenAI lines were passed through and parsed once in the route.
+- events: one incremental parser per provider yields StreamDelta events,
+  serialized once with sse().
+
+Usage:
+    python benchmarks/bench_stream_events.py [--tokens 10000] [--repeats 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.stream_events import stream_parser
+
+WORDS = ["The", " quick", " brown", " fox", " jumps", " over", " the", " lazy", " dog", ".", "\n", " \"quoted\"", " naïve"]
+
+
+def record_stream(provider: str, tokens: int) -> list:
+    """SSE lines as the provider sends them, blank separators included."""
+    lines = []
+    if provider == "anthropic":
+        lines += ["event: message_start",
+                  'data: {"type": "message_start", "message": {"usage": {"input_tokens": 1200, "output_tokens": 1}}}',
+                  ""]
+        for i in range(tokens):
+            delta = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": WORDS[i % len(WORDS)]}}
+            lines += ["event: content_block_delta", f"data: {json.dumps(delta)}", ""]
+        lines += ["event: message_delta", f'data: {{"type": "message_delta", "usage": {{"output_tokens": {tokens}}}}}', "",
+                  "event: message_stop", 'data: {"type": "message_stop"}', ""]
+    else:
+        for i in range(tokens):
+            chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "model": "gpt-4",
+                     "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)]}, "finish_reason": None}]}
+            lines += [f"data: {json.dumps(chunk)}", ""]
+        lines += ["data: [DONE]", ""]
+    return lines
+
+
+def legacy_frames(provider: str, lines: list) -> list:
+    """Replica of the pre-StreamDelta path: client conversion, then the route's parse and dump."""
+    frames = []
+    for line in lines:
+        # LLMClient._convert_stream_line
+        if provider == "anthropic":
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[6:])
+            if data.get("type") == "content_block_delta":
+                converted = f"data: {json.dumps({'choices': [{'delta': {'content': data['delta'].get('text', '')}}]})}\n\n".encode()
+            elif data.get("type") == "message_stop":
+                converted = b"data: [DONE]\n\n"
+            else:
+                continue
+        else:
+            converted = line.encode()
+        # generate_response in the chat route
+        chunk = converted
+        if chunk.startswith(b"data:"):
+            chunk = chunk[len(b"data:"):].strip()
+        if chunk == b"[DONE]":
+            break
+        if chunk:
+            data = json.loads(chunk)
+            if not data.get("choices"):
+                continue
+            content = data["choices"][0]["delta"].get("content", "")
+            if content:
+                frames.append(f"data: {json.dumps({'content': content})}\n\n".encode())
+    return frames
+
+
+def event_frames(provider: str, lines: list) -> list:
+    """The current path: one parser per stream, one serialization per event."""
+    frames = []
+    parser = stream_parser(provider)
+    for line in lines:
+        event = parser.feed(line)
+        if event is None:
+            continue
+        if event.done:
+            break
+        if event.content:
+            frames.append(event.sse())
+    return frames
+
+
+def bench(fn, provider: str, lines: list, tokens: int, repeats: int) -> float:
+    """Best-of-repeats microseconds per token."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(provider, lines)
+        best = min(best, time.perf_counter() - started)
+    return best * 1e6 / tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=10000, help="tokens in the recorded stream")
+    parser.add_argument("--repeats", type=int, default=5, help="replays per path; the best is reported")
+    args = parser.parse_args()
+
+    print(f"recorded stream: {args.tokens} tokens, best of {args.repeats}")
+    print(f"{'provider':<10} {'legacy us/token':>16} {'events us/token':>16} {'speedup':>8}")
+    for provider in ("anthropic", "openai"):
+        lines = record_stream(provider, args.tokens)
+        # Both paths must send the browser the same bytes
+        assert legacy_frames(provider, lines) == event_frames(provider, lines)
+        legacy = bench(legacy_frames, provider, lines, args.tokens, args.repeats)
+        events = bench(event_frames, provider, lines, args.tokens, args.repeats)
+        print(f"{provider:<10} {legacy:>16.2f} {events:>16.2f} {legacy / events:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
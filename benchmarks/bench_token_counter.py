@@ -0,0 +1,82 @@
+"""
+Benchmark: token counting cost per chat turn.
+
+Simulates the counting done for one turn of a long session: the context
+window update (one new user message against a cached history), the system
+prompt and data-source block counts logged with system_prompt_generated,
+and the user and assistant message counts. Cold numbers include a session
+whose history has never been counted (for example after a restart).
+
+Usage:
+    python benchmarks/bench_token_counter.py [--messages 200] [--turns 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.context_window import ContextWindowManager
+from app.services.system_prompt_engine import SystemPromptEngine
+from app.services.token_counter import TokenCounter, token_counter
+
+DATA_SOURCES = ["data-test", "new-mexico-history"]
+
+
+def build_history(messages: int, system_prompt: str):
+    history = [{"role": "system", "content": system_prompt}]
+    for i in range(messages // 2):
+        history.append({"role": "user", "content": f"Question {i}: " + "tell me more about this topic " * 6})
+        history.append({"role": "assistant", "content": f"Answer {i}: " + "here is a detailed explanation " * 30})
+    return history
+
+
+def bench_turns(history, engine, provider: str, turns: int) -> float:
+    """Average milliseconds of counting per warm turn."""
+    manager = ContextWindowManager()
+    manager.build_context("bench", history, budget_tokens=100000, provider=provider)
+    started = time.perf_counter()
+    for i in range(turns):
+        user_message = {"role": "user", "content": f"Follow-up {i}: what about the next step?"}
+        history.append(user_message)
+        token_counter.count_text(history[0]["content"], provider)
+        engine.data_source_tokens(DATA_SOURCES, provider)
+        token_counter.count_message(user_message, provider)
+        manager.build_context("bench", history, budget_tokens=100000, provider=provider)
+        assistant_message = {"role": "assistant", "content": "Sure, the next step is " * 20}
+        history.append(assistant_message)
+        token_counter.count_message(assistant_message, provider)
+    return (time.perf_counter() - started) * 1000 / turns
+
+
+def bench_cold(history, provider: str, repeats: int = 20) -> float:
+    """Average milliseconds to count a whole history nobody has counted before."""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        counter = TokenCounter()
+        for message in history:
+            counter.count_message(dict(message), provider)
+    return (time.perf_counter() - started) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="history length before the measured turns")
+    parser.add_argument("--turns", type=int, default=500, help="turns to measure")
+    args = parser.parse_args()
+
+    engine = SystemPromptEngine()
+    engine.set_base_prompt("You are a helpful AI assistant. " * 100)
+    system_prompt = engine.generate_system_prompt(["calculator", "sql_query"], DATA_SOURCES)
+
+    print(f"history: {args.messages} messages, system prompt: {len(system_prompt)} chars")
+    print(f"{'provider':<10} {'warm ms/turn':>14} {'cold ms/history':>17}")
+    for provider in ("anthropic", "openai"):
+        warm = bench_turns(build_history(args.messages, system_prompt), engine, provider, args.turns)
+        cold = bench_cold(build_history(args.messages, system_prompt), provider)
+        print(f"{provider:<10} {warm:>14.4f} {cold:>17.4f}")
+
+
+if __name__ == "__main__":
+    main()
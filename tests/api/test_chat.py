@@ -1,9 +1,13 @@
+import asyncio
+import json
+import os
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import requests
 from app.main import app
 from app.config import settings
 from app.services.session_manager import session_manager
+from app.services.stream_events import DONE, StreamDelta, status_event
 
 client = TestClient(app)
 
@@ -68,4 +72,119 @@ def test_download_chat_session(mock_llm_client):
 
     # Clean up the session
     session_manager.delete_session(session_id)
-    assert session_manager.get_session(session_id) is None
\ No newline at end of file
+    assert session_manager.get_session(session_id) is None
+
+@patch('app.routers.chat.llm_client')
+def test_download_chat_session_formats(mock_llm_client):
+    mock_llm_client.current_llm_name = "Test LLM"
+    session_id = client.post("/chat", headers={"X-EMAIL-USER": "download_formats@example.com"}).json()["session_id"]
+    session_manager.update_session_messages(session_id, [
+        {"role": "user", "content": "Hello, AI!"},
+        {"role": "assistant", "content": "Hi there!"}
+    ])
+
+    md_response = client.get(f"/chat/{session_id}/download?format=md")
+    assert md_response.status_code == 200
+    assert "text/markdown" in md_response.headers["Content-Type"]
+    assert f"filename=\"chat_session_{session_id}.md\"" in md_response.headers["Content-Disposition"]
+    assert "## User\n\nHello, AI!" in md_response.text
+
+    jsonl_response = client.get(f"/chat/{session_id}/download?format=jsonl")
+    assert jsonl_response.status_code == 200
+    lines = [json.loads(line) for line in jsonl_response.text.splitlines()]
+    assert lines[0]["session_id"] == session_id
+    assert lines[0]["llm_name"] == "Test LLM"
+    assert lines[1:] == [
+        {"role": "user", "content": "Hello, AI!"},
+        {"role": "assistant", "content": "Hi there!"}
+    ]
+
+    assert client.get(f"/chat/{session_id}/download?format=pdf").status_code == 400
+    # Nothing is written to disk for a download
+    assert not os.path.exists(os.path.join("logs", f"chat_session_{session_id}.txt"))
+
+    session_manager.delete_session(session_id)
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+def test_llm_selection_is_bound_to_session(mock_achat_completion):
+    async def mock_stream():
+        yield StreamDelta(content="Hi")
+
+    mock_achat_completion.side_effect = lambda *args, **kwargs: mock_stream()
+
+    session_a = client.post("/chat", headers={"X-EMAIL-USER": "model_a@example.com"}).json()["session_id"]
+    session_b = client.post("/chat", headers={"X-EMAIL-USER": "model_b@example.com"}).json()["session_id"]
+
+    client.post(f"/chat/{session_a}/message", json={"content": "Hello", "llm_name": "GPT-3.5 Turbo"})
+    client.post(f"/chat/{session_b}/message", json={"content": "Hello", "llm_name": "Claude 3.5 Haiku"})
+    # A follow-up without llm_name keeps the session's own choice
+    client.post(f"/chat/{session_a}/message", json={"content": "Again"})
+
+    used = [call.kwargs["llm_name"] for call in mock_achat_completion.call_args_list]
+    assert used == ["GPT-3.5 Turbo", "Claude 3.5 Haiku", "GPT-3.5 Turbo"]
+
+    download = client.get(f"/chat/{session_b}/download")
+    assert "Selected LLM: Claude 3.5 Haiku" in download.text
+
+    session_manager.delete_session(session_a)
+    session_manager.delete_session(session_b)
+
+def test_invalid_llm_selection_rejected():
+    session_id = client.post("/chat", headers={"X-EMAIL-USER": "bad_llm@example.com"}).json()["session_id"]
+    response = client.post(f"/chat/{session_id}/message", json={"content": "Hello", "llm_name": "NoSuchModel"})
+    assert response.status_code == 400
+    session_manager.delete_session(session_id)
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+def test_queue_status_event_is_passed_through(mock_achat_completion):
+    async def mock_stream():
+        yield status_event({"status": "queued", "queue_wait_ms": 1500, "message": "Waited 1.5s"})
+        yield StreamDelta(content="Hi")
+        yield DONE
+
+    mock_achat_completion.side_effect = lambda *args, **kwargs: mock_stream()
+    session_id = client.post("/chat", headers={"X-EMAIL-USER": "queued@example.com"}).json()["session_id"]
+
+    response = client.post(f"/chat/{session_id}/message", json={"content": "Hello"})
+    events = [json.loads(line[len("data: "):]) for line in response.text.split("\n\n")
+              if line.startswith("data: {")]
+    assert events[0]["type"] == "status"
+    assert events[0]["queue_wait_ms"] == 1500
+    assert events[1] == {"content": "Hi"}
+    # Status events are not part of the stored answer
+    assert session_manager.get_session(session_id)["messages"][-1]["content"] == "Hi"
+
+    session_manager.delete_session(session_id)
+
+async def test_client_disconnect_cancels_generation_and_keeps_partial_answer():
+    from starlette.requests import Request
+    from app.routers.chat import chat_message
+
+    upstream_closed = asyncio.Event()
+    disconnected = asyncio.Event()
+
+    async def slow_stream():
+        try:
+            yield StreamDelta(content="Partial")
+            disconnected.set()
+            await asyncio.sleep(30)
+            yield StreamDelta(content=" never sent")
+        finally:
+            upstream_closed.set()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    session_id = session_manager.create_session("disconnect@example.com")
+    request = Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+    with patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock) as mock_achat:
+        mock_achat.side_effect = lambda *args, **kwargs: slow_stream()
+        response = await chat_message(session_id, request, {"content": "Hello"})
+        events = [event async for event in response.body_iterator]
+        await asyncio.wait_for(upstream_closed.wait(), 1)
+
+    assert events == [b'data: {"content": "Partial"}\n\n']
+    assert session_manager.get_session(session_id)["messages"][-1] == {"role": "assistant", "content": "Partial"}
+
+    session_manager.delete_session(session_id)
@@ -0,0 +1,12 @@
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+def test_metrics_endpoint_reports_session_store():
+    response = client.get("/api/metrics", headers={"X-EMAIL-USER": "test@example.com"})
+    assert response.status_code == 200
+    sessions = response.json()["sessions"]
+    assert "resident" in sessions
+    assert "evictions" in sessions
+    assert "hit_rate" in sessions
@@ -1,16 +1,17 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.main import app
+from app.services.stream_events import DONE, StreamDelta
 
 client = TestClient(app)
 
-@patch('app.services.llm_client.LLMClient.chat_completion')
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
 def test_calculator_tool_selection_and_logging(mock_chat_completion):
     """Test that selecting calculator tool modifies system prompt and logs tool selection."""
     # Mock streaming response
-    def mock_iter_lines():
-        yield b'data: {"choices": [{"delta": {"content": "I can help you with calculations using the calculator tool."}}]}'
-        yield b'data: [DONE]'
+    async def mock_iter_lines():
+        yield StreamDelta(content="I can help you with calculations using the calculator tool.")
+        yield DONE
     
     mock_chat_completion.return_value = mock_iter_lines()
     
@@ -47,12 +48,12 @@ def test_calculator_tool_selection_and_logging(mock_chat_completion):
     assert system_message["role"] == "system"
     assert "calculator" in system_message["content"].lower()
 
-@patch('app.services.llm_client.LLMClient.chat_completion')
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
 def test_tool_selection_streaming_without_execution(mock_chat_completion):
     """Test that tool selections are streamed to frontend without executing tools."""
-    def mock_iter_lines():
-        yield b'data: {"choices": [{"delta": {"content": "I have access to the calculator tool and can help with math."}}]}'
-        yield b'data: [DONE]'
+    async def mock_iter_lines():
+        yield StreamDelta(content="I have access to the calculator tool and can help with math.")
+        yield DONE
     
     mock_chat_completion.return_value = mock_iter_lines()
     
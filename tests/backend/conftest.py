@@ -1,8 +1,15 @@
+import asyncio
+import httpx
 import pytest
+from dataclasses import replace
 from fastapi.testclient import TestClient
 from app.main import app
 from unittest.mock import patch, AsyncMock
 from app.config import settings
+from app.services.circuit_breaker import CircuitBreakers
+from app.services.llm_client import LLMClient
+from app.services.rate_limiter import RateLimiter
+from app.services.single_flight import SingleFlight
 
 @pytest.fixture(scope="function", autouse=True)
 def setup_test_mode():
@@ -16,3 +23,60 @@ def setup_test_mode():
 def test_client():
     with TestClient(app) as client:
         yield client
+
+
+class FakeClock:
+    """Clock for services taking a clock callable; tests move it by setting now."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowStream(httpx.AsyncByteStream):
+    """Response body sent in one piece after a delay; records whether the client closed it."""
+
+    def __init__(self, delay: float, body: str):
+        self.delay = delay
+        self.body = body
+        self.closed = False
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.delay)
+        yield self.body.encode()
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def slow_stream():
+    """The SlowStream class, for building slow provider responses."""
+    return SlowStream
+
+
+@pytest.fixture
+def make_client():
+    """
+    Factory for an LLMClient on llm_name with its own circuit breakers and
+    rate limiter and single-flight off; handle_changes are applied to the
+    model's handle (e.g. fallbacks=()).
+    """
+    def make(llm_name: str = "GPT-4 Turbo", **handle_changes) -> LLMClient:
+        llm = LLMClient()
+        llm.set_llm(llm_name)
+        if handle_changes:
+            handle = replace(llm.get_provider(), **handle_changes)
+            llm._providers[handle.name] = handle
+        llm.single_flight = SingleFlight(enabled=False)
+        llm.circuit_breakers = CircuitBreakers(min_calls=1)
+        llm.rate_limiter = RateLimiter()
+        return llm
+    return make
@@ -0,0 +1,64 @@
+import json
+import os
+from app.utils.blob_store import BlobStore
+from app.utils.log_reader import USAGE, inflate_event, iter_session_events, main
+
+
+def test_put_stores_each_distinct_text_once(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    first = store.put("You are a helpful assistant." * 100)
+    second = store.put("You are a helpful assistant." * 100)
+    other = store.put("Another prompt")
+
+    assert first == second
+    assert first != other
+    assert store.writes == 2
+    assert store.dedup_hits == 1
+    assert os.path.exists(store.path_for(first))
+    assert store.get(first) == "You are a helpful assistant." * 100
+
+
+def test_put_skips_existing_blob_from_another_instance(tmp_path):
+    directory = str(tmp_path / "blobs")
+    digest = BlobStore(directory).put("shared prompt")
+
+    restarted = BlobStore(directory)
+    assert restarted.put("shared prompt") == digest
+    assert restarted.writes == 0
+    assert restarted.dedup_hits == 1
+
+
+def test_get_missing_digest_returns_none(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    assert store.get("0" * 64) is None
+
+
+def test_reader_reinflates_prompt_references(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    digest = store.put("System prompt with data sources")
+    log_file = tmp_path / "session.jsonl"
+    events = [
+        {"event": "system_prompt_generated", "system_prompt_sha256": digest},
+        {"event": "user_message", "content": "Hello"},
+    ]
+    log_file.write_text("".join(json.dumps(event) + "\n" for event in events))
+
+    inflated = list(iter_session_events(str(log_file), blob_store=store))
+    assert inflated[0]["system_prompt"] == "System prompt with data sources"
+    assert inflated[1] == events[1]
+
+    raw = list(iter_session_events(str(log_file), inflate=False, blob_store=store))
+    assert "system_prompt" not in raw[0]
+
+
+def test_inflate_event_does_not_modify_original(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    event = {"event": "system_prompt_generated", "system_prompt_sha256": store.put("prompt")}
+    inflated = inflate_event(event, store)
+    assert inflated["system_prompt"] == "prompt"
+    assert "system_prompt" not in event
+
+
+def test_log_reader_without_paths_prints_usage(capsys):
+    assert main([]) == 1
+    assert capsys.readouterr().err.strip() == USAGE
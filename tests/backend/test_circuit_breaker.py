@@ -0,0 +1,100 @@
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, CircuitOpen
+
+OPENAI_STREAM = (
+    'data: {"choices": [{"delta": {"content": "From GPT"}}]}\n\n'
+    'data: [DONE]\n\n'
+)
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_opens_when_failure_rate_passes_threshold():
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, min_calls=4)
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker(slow_call_seconds=1.0, slow_call_rate_threshold=0.5, min_calls=2)
+    breaker.record(True, latency=5.0)
+    breaker.record(True, latency=5.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_one_probe(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30, clock=clock)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record(False)
+    assert breaker.state == OPEN
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True, latency=0.1)
+    assert breaker.state == CLOSED
+
+
+def test_refused_scope_gives_back_probe(clock):
+    breakers = CircuitBreakers(min_calls=1, open_seconds=30, clock=clock)
+    breakers.record(["provider:anthropic"], False)
+    clock.now += 30
+    breakers.record(["model:m"], False)
+
+    # The provider's probe isn't spent on a call the model breaker refuses
+    assert not breakers.allow(["provider:anthropic", "model:m"])
+    assert breakers.get("provider:anthropic").allow()
+
+
+async def test_open_circuit_routes_to_fallback_at_once(make_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.host)
+        return httpx.Response(200, text=OPENAI_STREAM, headers={"content-type": "text/event-stream"})
+
+    llm = make_client()
+    llm.circuit_breakers.record(["provider:anthropic"], False)
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="Claude 3.5 Haiku")
+        events = [event async for event in stream]
+
+    assert calls == ["api.openai.com"]
+    status = events[0].status
+    assert status["type"] == "status"
+    assert status["llm_name"] == "GPT-3.5 Turbo"
+    assert status["requested_llm_name"] == "Claude 3.5 Haiku"
+    assert llm.fallback_stats() == {"Claude 3.5 Haiku -> GPT-3.5 Turbo": 1}
+
+
+async def test_failure_before_first_token_fails_over_and_opens_circuit(make_client):
+    def handler(request):
+        if request.url.host == "api.anthropic.com":
+            return httpx.Response(503)
+        return httpx.Response(200, text=OPENAI_STREAM, headers={"content-type": "text/event-stream"})
+
+    llm = make_client()
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="Claude 3.5 Haiku")
+        events = [event async for event in stream]
+
+    assert events[-2].content == "From GPT"
+    assert llm.circuit_breakers.get("model:Claude 3.5 Haiku").state == OPEN
+
+
+async def test_all_circuits_open_fails_fast(make_client):
+    llm = make_client()
+    llm.circuit_breakers.record(["provider:anthropic", "provider:openai"], False)
+    with pytest.raises(CircuitOpen):
+        await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="Claude 3.5 Haiku")
@@ -0,0 +1,75 @@
+from app.services.context_window import ContextWindowManager
+from app.services.token_counter import token_counter
+
+
+def estimate_tokens(message):
+    return token_counter.count_message(message, "openai")
+
+
+def conversation(turns, size=400):
+    messages = [{"role": "system", "content": "s" * 40}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "q" * size})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "a" * size})
+    return messages
+
+
+def test_short_conversation_is_sent_unchanged():
+    manager = ContextWindowManager()
+    messages = conversation(2)
+    window, context = manager.build_context("s1", messages, budget_tokens=10000)
+    assert window == messages
+    assert context["dropped"] == 0
+    assert context["tokens"] == sum(estimate_tokens(m) for m in messages)
+
+
+def test_long_conversation_keeps_system_and_latest_turns_within_budget():
+    manager = ContextWindowManager()
+    messages = conversation(20) + [{"role": "user", "content": "latest"}]
+    window, context = manager.build_context("s1", messages, budget_tokens=1000)
+
+    assert window[0] == messages[0]
+    assert window[-1] == {"role": "user", "content": "latest"}
+    assert window[1]["role"] == "user"
+    assert window[1:] == messages[len(messages) - len(window) + 1:]
+    assert context["tokens"] == sum(estimate_tokens(m) for m in window) <= 1000
+    assert context["dropped"] == len(messages) - len(window)
+
+
+def test_latest_message_is_kept_even_over_budget():
+    manager = ContextWindowManager()
+    messages = conversation(3) + [{"role": "user", "content": "x" * 10000}]
+    window, _ = manager.build_context("s1", messages, budget_tokens=100)
+    assert window == [messages[0], messages[-1]]
+
+
+def test_counts_are_updated_incrementally():
+    manager = ContextWindowManager()
+    messages = conversation(10)
+    manager.build_context("s1", messages, budget_tokens=1000)
+    assert manager.messages_counted == len(messages)
+
+    messages.append({"role": "user", "content": "next"})
+    manager.build_context("s1", messages, budget_tokens=1000)
+    assert manager.messages_counted == len(messages)
+
+    # A new system prompt only recounts the system message
+    messages[0] = {"role": "system", "content": "changed"}
+    manager.build_context("s1", messages, budget_tokens=1000)
+    assert manager.messages_counted == len(messages) + 1
+
+
+def test_session_cache_is_bounded():
+    manager = ContextWindowManager(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        manager.build_context(session_id, conversation(1), budget_tokens=1000)
+    assert manager.stats()["sessions"] == 2
+
+
+def test_switching_provider_recounts_with_its_tokenizer():
+    manager = ContextWindowManager()
+    messages = conversation(2)
+    _, openai_context = manager.build_context("s1", messages, budget_tokens=10000, provider="openai")
+    _, anthropic_context = manager.build_context("s1", messages, budget_tokens=10000, provider="anthropic")
+    assert anthropic_context["tokens"] == sum(token_counter.count_message(m, "anthropic") for m in messages)
+    assert anthropic_context["tokens"] != openai_context["tokens"]
@@ -0,0 +1,81 @@
+import asyncio
+from contextlib import aclosing
+from app.services.generation_tracker import GenerationTracker
+from app.services.stream_events import StreamDelta
+
+
+def endless_stream(closed: list):
+    async def stream():
+        try:
+            i = 0
+            while True:
+                yield StreamDelta(content=f"token {i}")
+                i += 1
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(True)
+
+    async def open_stream():
+        return stream()
+
+    return open_stream
+
+
+async def test_events_pass_through():
+    async def open_stream():
+        async def stream():
+            yield StreamDelta(content="a")
+            yield StreamDelta(content="b")
+        return stream()
+
+    tracker = GenerationTracker()
+    generation = tracker.start("s1", open_stream)
+    assert [event.content async for event in generation.events()] == ["a", "b"]
+    assert tracker.stats()["active"] == 0
+    assert generation.cancel_reason is None
+
+
+async def test_cancel_aborts_upstream_stream():
+    closed = []
+    tracker = GenerationTracker()
+    generation = tracker.start("s1", endless_stream(closed))
+    received = []
+    async with aclosing(generation.events()) as events:
+        async for event in events:
+            received.append(event)
+            if len(received) == 3:
+                assert tracker.cancel("s1", "stopped_by_user") == 1
+
+    await asyncio.sleep(0)
+    assert closed == [True]
+    assert generation.cancel_reason == "stopped_by_user"
+    assert tracker.stats()["cancelled"] == {"stopped_by_user": 1}
+    # Already cancelled
+    assert not generation.cancel("client_disconnected")
+
+
+async def test_reader_leaving_closes_upstream():
+    closed = []
+    tracker = GenerationTracker()
+    generation = tracker.start("s1", endless_stream(closed))
+    async with aclosing(generation.events()) as events:
+        async for _ in events:
+            break
+
+    await asyncio.sleep(0.01)
+    assert closed == [True]
+    assert tracker.stats()["active"] == 0
+
+
+async def test_upstream_error_reaches_reader():
+    async def open_stream():
+        raise RuntimeError("provider down")
+
+    tracker = GenerationTracker()
+    generation = tracker.start("s1", open_stream)
+    try:
+        [event async for event in generation.events()]
+    except RuntimeError as e:
+        assert str(e) == "provider down"
+    else:
+        raise AssertionError("expected the upstream error")
@@ -0,0 +1,198 @@
+import asyncio
+import time
+import httpx
+import pytest
+from dataclasses import replace
+from unittest.mock import patch
+from app.services.hedging import Hedger
+from app.services.rate_limiter import Limits
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def openai_stream(content: str) -> str:
+    return f'data: {{"choices": [{{"delta": {{"content": "{content}"}}}}]}}\n\ndata: [DONE]\n\n'
+
+
+def test_delay_uses_default_until_enough_samples():
+    hedger = Hedger(min_samples=3, default_delay=2.0, min_delay=0.0)
+    hedger.record("m", 0.1)
+    assert hedger.delay_for("m") == 2.0
+    hedger.record("m", 0.2)
+    hedger.record("m", 0.3)
+    assert hedger.delay_for("m") == 0.3
+
+
+def test_delay_is_percentile_clamped():
+    hedger = Hedger(percentile=90, min_samples=1, min_delay=0.5, max_delay=5.0)
+    for i in range(1, 11):
+        hedger.record("m", i * 0.1)
+    # Nearest rank: the 9th of 10 samples
+    assert hedger.delay_for("m") == 0.9
+    for _ in range(100):
+        hedger.record("slow", 60.0)
+        hedger.record("fast", 0.01)
+    assert hedger.delay_for("slow") == 5.0
+    assert hedger.delay_for("fast") == 0.5
+
+
+@pytest.fixture
+def make_hedging_client(make_client):
+    def make(hedge_with=None, **handle_changes):
+        llm = make_client(fallbacks=(), hedge_with=hedge_with, **handle_changes)
+        llm.hedger = Hedger(enabled=True, default_delay=0.02, min_delay=0.0)
+        return llm
+    return make
+
+
+def claude_stream(content: str) -> str:
+    return ('event: content_block_delta\n'
+            f'data: {{"type": "content_block_delta", "delta": {{"text": "{content}"}}}}\n\n'
+            'event: message_stop\n'
+            'data: {"type": "message_stop"}\n\n')
+
+
+async def test_slow_start_is_hedged_and_loser_cancelled(make_hedging_client, slow_stream):
+    streams = []
+
+    def handler(request):
+        # The first request stalls, the hedge answers at once
+        stream = slow_stream(5.0 if not streams else 0.0, openai_stream("hedge" if streams else "slow"))
+        streams.append(stream)
+        return httpx.Response(200, stream=stream, headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client()
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    started = time.monotonic()
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        events = [event async for event in stream]
+
+    assert time.monotonic() - started < 2
+    assert events[0].content == "hedge"
+    assert len(streams) == 2
+    # The cancelled request releases its connection
+    await asyncio.sleep(0.05)
+    assert streams[0].closed
+    assert llm.hedger.stats()["hedge_wins"] == 1
+
+
+async def test_fast_start_is_not_hedged(make_hedging_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, text=openai_stream("fast"), headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client()
+    llm.hedger.default_delay = 1.0
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        [line async for line in stream]
+
+    assert len(calls) == 1
+    assert llm.hedger.stats()["hedged"] == 0
+
+
+async def test_hedge_to_equivalent_model_is_reported(make_hedging_client, slow_stream):
+    def handler(request):
+        if request.url.host == "api.openai.com":
+            return httpx.Response(200, stream=slow_stream(5.0, openai_stream("slow")),
+                                  headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, text=claude_stream("claude"), headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client(hedge_with="Claude 3.5 Sonnet")
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        events = [event async for event in stream]
+
+    status = events[0].status
+    assert status["status"] == "hedged"
+    assert status["llm_name"] == "Claude 3.5 Sonnet"
+    assert events[1].content == "claude"
+    # The hedge went through the other model's breakers
+    assert llm.circuit_breakers.get("model:Claude 3.5 Sonnet").stats()["calls"] == 1
+    # The primary never started: its time to first token is recorded as at least the hedge delay
+    assert list(llm.hedger._samples["GPT-4 Turbo"]) >= [0.02]
+    assert "Claude 3.5 Sonnet" not in llm.hedger._samples
+
+
+async def test_hedge_to_model_with_open_circuit_is_skipped(make_hedging_client, slow_stream):
+    def handler(request):
+        assert request.url.host == "api.openai.com"
+        return httpx.Response(200, stream=slow_stream(0.1, openai_stream("slow")),
+                              headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client(hedge_with="Claude 3.5 Sonnet")
+    llm.circuit_breakers.record(["model:Claude 3.5 Sonnet"], success=False)
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        events = [event async for event in stream]
+
+    assert events[0].content == "slow"
+    assert llm.hedger.stats()["hedged"] == 0
+
+
+async def test_hedge_to_other_model_is_skipped_while_its_limits_are_full(make_hedging_client, slow_stream):
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        return httpx.Response(200, stream=slow_stream(0.1, openai_stream("slow")),
+                              headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client(hedge_with="Claude 3.5 Sonnet")
+    claude = replace(llm.get_provider("Claude 3.5 Sonnet"), limits=Limits(max_concurrency=1))
+    llm._providers[claude.name] = claude
+    # Claude is busy, so there is no room for the hedge
+    busy = await llm.rate_limiter.acquire([("model:Claude 3.5 Sonnet", claude.limits)])
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        events = [event async for event in stream]
+    busy.release()
+
+    assert events[0].content == "slow"
+    assert hosts == ["api.openai.com"]
+    assert llm.hedger.stats()["hedged"] == 0
+    # The primary's own time to first token
+    assert list(llm.hedger._samples["GPT-4 Turbo"]) >= [0.1]
+    # The skipped hedge left no outcome in Claude's breakers
+    assert llm.circuit_breakers.get("model:Claude 3.5 Sonnet").stats()["calls"] == 0
+
+
+async def test_same_model_hedge_respects_max_concurrency(make_hedging_client, slow_stream):
+    active = peak = 0
+
+    class CountedStream(httpx.AsyncByteStream):
+        def __init__(self, inner):
+            self.inner = inner
+
+        async def __aiter__(self):
+            async for chunk in self.inner:
+                yield chunk
+
+        async def aclose(self):
+            nonlocal active
+            active -= 1
+
+    def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        return httpx.Response(200, stream=CountedStream(slow_stream(0.1, openai_stream("slow"))),
+                              headers={"content-type": "text/event-stream"})
+
+    llm = make_hedging_client(limits=Limits(max_concurrency=1))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True, llm_name="GPT-4 Turbo")
+        events = [event async for event in stream]
+
+    assert events[0].content == "slow"
+    assert peak == 1
+    assert llm.hedger.stats()["hedged"] == 0
+    assert llm.rate_limiter.stats()["model:GPT-4 Turbo"]["active"] == 0
@@ -0,0 +1,127 @@
+from unittest.mock import patch, AsyncMock, MagicMock
+from app.services.history_compactor import HistoryCompactor, SUMMARY_PREFIX
+from app.services.session_manager import session_manager
+
+
+def summary_response(text):
+    response = MagicMock()
+    response.json.return_value = {"choices": [{"message": {"content": text}}]}
+    return response
+
+
+def make_session(user_email, turns=6, size=400):
+    session_id = session_manager.create_session(user_email)
+    messages = [{"role": "system", "content": "System prompt"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "q" * size})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "a" * size})
+    session_manager.update_session_messages(session_id, messages)
+    return session_id
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_compaction_swaps_old_turns_for_summary(mock_achat_completion):
+    mock_achat_completion.return_value = summary_response("They discussed questions 0 to 3.")
+    compactor = HistoryCompactor(llm_name="Claude 3.5 Haiku", threshold_tokens=500, keep_recent_messages=4)
+    session_id = make_session("compact_swap@example.com")
+    original = session_manager.get_session(session_id)["messages"]
+
+    task = compactor.maybe_schedule(session_id)
+    assert task is not None
+    assert await task is True
+
+    context = session_manager.context_messages(session_id)
+    assert context[0] == original[0]
+    assert context[1] == {"role": "user", "content": SUMMARY_PREFIX + "They discussed questions 0 to 3."}
+    assert context[2:] == original[-4:]
+    assert mock_achat_completion.call_args.kwargs["llm_name"] == "Claude 3.5 Haiku"
+    # The stored history keeps every original message
+    assert session_manager.get_session(session_id)["messages"] == original
+    # Persisted, so a reload sees the same summary and the same history
+    stored = session_manager.backend.load(session_id)
+    assert stored["messages"] == original
+    assert stored["history_summary"]["covers"] == len(original) - 5
+    session_manager.delete_session(session_id)
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_second_compaction_folds_in_the_first_summary(mock_achat_completion):
+    mock_achat_completion.return_value = summary_response("first")
+    compactor = HistoryCompactor(threshold_tokens=500, keep_recent_messages=4)
+    session_id = make_session("compact_twice@example.com")
+    assert await compactor.maybe_schedule(session_id) is True
+    for i in range(4):
+        session_manager.append_message(session_id, {"role": "user", "content": f"more {i} " + "m" * 400})
+        session_manager.append_message(session_id, {"role": "assistant", "content": f"reply {i} " + "r" * 400})
+
+    mock_achat_completion.return_value = summary_response("second")
+    assert await compactor.maybe_schedule(session_id) is True
+    # The earlier summary was part of what the second one summarized
+    transcript = mock_achat_completion.call_args.kwargs["messages"][1]["content"]
+    assert SUMMARY_PREFIX + "first" in transcript
+    messages = session_manager.get_session(session_id)["messages"]
+    context = session_manager.context_messages(session_id)
+    assert context[1]["content"] == SUMMARY_PREFIX + "second"
+    assert context[2:] == messages[-4:]
+    assert len(messages) == 21
+    session_manager.delete_session(session_id)
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_below_threshold_is_not_scheduled(mock_achat_completion):
+    compactor = HistoryCompactor(threshold_tokens=1_000_000)
+    session_id = make_session("compact_small@example.com")
+    assert compactor.maybe_schedule(session_id) is None
+    mock_achat_completion.assert_not_called()
+    session_manager.delete_session(session_id)
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_swap_is_skipped_when_history_replaced_meanwhile(mock_achat_completion):
+    compactor = HistoryCompactor(threshold_tokens=500, keep_recent_messages=4)
+    session_id = make_session("compact_race@example.com")
+    replacement = [{"role": "system", "content": "System prompt"}, {"role": "user", "content": "fresh start"}]
+
+    async def summarize_slowly(*args, **kwargs):
+        session_manager.update_session_messages(session_id, replacement)
+        return summary_response("stale summary")
+
+    mock_achat_completion.side_effect = summarize_slowly
+    assert await compactor.maybe_schedule(session_id) is False
+    assert session_manager.get_session(session_id)["messages"] == replacement
+    assert compactor.skipped == 1
+    assert session_manager.context_messages(session_id) == replacement
+    session_manager.delete_session(session_id)
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_new_turns_during_compaction_are_kept(mock_achat_completion):
+    compactor = HistoryCompactor(threshold_tokens=500, keep_recent_messages=4)
+    session_id = make_session("compact_append@example.com")
+    new_turn = {"role": "user", "content": "asked while summarizing"}
+
+    async def summarize_with_new_turn(*args, **kwargs):
+        session_manager.append_message(session_id, new_turn)
+        return summary_response("summary")
+
+    mock_achat_completion.side_effect = summarize_with_new_turn
+    assert await compactor.maybe_schedule(session_id) is True
+    assert session_manager.get_session(session_id)["messages"][-1] == new_turn
+    assert session_manager.context_messages(session_id)[-1] == new_turn
+    session_manager.delete_session(session_id)
+
+
+@patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+async def test_failed_summary_leaves_history_untouched(mock_achat_completion):
+    mock_achat_completion.side_effect = Exception("rate limited")
+    compactor = HistoryCompactor(threshold_tokens=500, keep_recent_messages=4)
+    session_id = make_session("compact_fail@example.com")
+    before = list(session_manager.get_session(session_id)["messages"])
+
+    assert await compactor.maybe_schedule(session_id) is False
+    assert session_manager.get_session(session_id)["messages"] == before
+    assert session_manager.context_messages(session_id) == before
+    assert compactor.failed == 1
+    # Not stuck as in progress
+    assert compactor.stats()["in_progress"] == 0
+    session_manager.delete_session(session_id)
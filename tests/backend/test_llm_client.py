@@ -0,0 +1,201 @@
+import asyncio
+import httpx
+import pytest
+from dataclasses import FrozenInstanceError, replace
+from unittest.mock import patch
+from app.services.llm_client import LLMClient
+from app.services.http_pool import HTTPClientPool
+
+ANTHROPIC_STREAM = (
+    'event: message_start\n'
+    'data: {"type": "message_start"}\n\n'
+    'event: content_block_delta\n'
+    'data: {"type": "content_block_delta", "delta": {"text": "Hello"}}\n\n'
+    'event: content_block_delta\n'
+    'data: {"type": "content_block_delta", "delta": {"text": " world"}}\n\n'
+    'event: message_stop\n'
+    'data: {"type": "message_stop"}\n\n'
+)
+
+
+def anthropic_handler(request: httpx.Request) -> httpx.Response:
+    assert request.url.path.endswith("/messages")
+    return httpx.Response(200, text=ANTHROPIC_STREAM, headers={"content-type": "text/event-stream"})
+
+
+@pytest.fixture
+def client():
+    llm = LLMClient()
+    llm.set_llm("Claude 3.5 Sonnet")
+    return llm
+
+
+def test_pool_reuses_client_per_base_url():
+    pool = HTTPClientPool(max_connections=4, max_keepalive_connections=2)
+    first = pool.get_client("https://api.example.com/v1")
+    assert pool.get_client("https://api.example.com/v1") is first
+    assert pool.get_client("https://other.example.com/v1") is not first
+    assert pool.stats()["sync_pools"] == 2
+    pool.close()
+    assert pool.stats()["sync_pools"] == 0
+
+
+async def test_async_pool_reuses_client_on_same_loop():
+    pool = HTTPClientPool()
+    first = pool.get_async_client("https://api.example.com/v1")
+    assert pool.get_async_client("https://api.example.com/v1") is first
+    await pool.aclose()
+    assert pool.stats()["async_pools"] == 0
+
+
+def test_async_pool_closes_client_of_replaced_loop():
+    pool = HTTPClientPool()
+    old_loop, new_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+
+    async def get_client():
+        return pool.get_async_client("https://api.example.com/v1")
+
+    try:
+        old = old_loop.run_until_complete(get_client())
+        current = new_loop.run_until_complete(get_client())
+        assert current is not old
+        # The old client is closed on its own loop the next time that loop runs
+        old_loop.run_until_complete(asyncio.sleep(0.01))
+        assert old.is_closed
+        assert pool.stats()["retired_async_pools"] == 1
+        new_loop.run_until_complete(pool.aclose())
+    finally:
+        old_loop.close()
+        new_loop.close()
+
+
+async def test_async_stream_parses_anthropic_events(client):
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(anthropic_handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await client.achat_completion(messages=[{"role": "user", "content": "hi"}], stream=True)
+        events = [event async for event in stream]
+
+    assert [event.content for event in events[:2]] == ["Hello", " world"]
+    assert events[-1].done
+    assert events[0].sse() == b'data: {"content": "Hello"}\n\n'
+
+
+async def test_async_stream_raises_before_first_line_on_http_error(client):
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(529)))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        with pytest.raises(Exception, match="Anthropic API request failed"):
+            await client.achat_completion(messages=[{"role": "user", "content": "hi"}], stream=True)
+
+
+def test_sync_wrapper_streams_through_pool(client):
+    mock_client = httpx.Client(transport=httpx.MockTransport(anthropic_handler))
+    with patch("app.services.llm_client.http_pool.get_client", return_value=mock_client):
+        events = list(client.chat_completion(messages=[{"role": "user", "content": "hi"}], stream=True))
+
+    assert len(events) == 3
+    assert events[-1].done
+
+
+def test_sync_wrapper_non_streaming_returns_openai_shape(client):
+    def handler(request):
+        return httpx.Response(200, json={"content": [{"type": "text", "text": "hi there"}]})
+
+    mock_client = httpx.Client(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_client", return_value=mock_client):
+        response = client.chat_completion(messages=[{"role": "user", "content": "hi"}])
+
+    assert response.json()["choices"][0]["message"]["content"] == "hi there"
+
+
+def test_provider_handles_are_cached_and_immutable(client):
+    sonnet = client.get_provider("Claude 3.5 Sonnet")
+    assert client.get_provider("Claude 3.5 Sonnet") is sonnet
+    assert client.get_provider("GPT-3.5 Turbo").provider == "openai"
+    with pytest.raises(FrozenInstanceError):
+        sonnet.model = "something-else"
+
+
+def test_get_provider_rejects_unknown_llm(client):
+    with pytest.raises(ValueError, match="not found"):
+        client.get_provider("NonExistentLLM")
+
+
+async def test_achat_completion_binds_requested_model_without_changing_default(client):
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        await client.achat_completion(messages=[{"role": "user", "content": "hi"}], llm_name="GPT-3.5 Turbo")
+
+    assert seen == ["/v1/chat/completions"]
+    assert client.current_llm_name == "Claude 3.5 Sonnet"
+
+
+def test_prompt_caching_adds_anthropic_cache_breakpoints(client):
+    messages = [
+        {"role": "system", "content": "System prompt"},
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "Hi"},
+        {"role": "user", "content": "Again"},
+    ]
+    # Caching is opt-in and the shipped config leaves it off
+    assert not client.get_provider("Claude 3.5 Sonnet").prompt_caching
+    caching = replace(client.get_provider("Claude 3.5 Sonnet"), prompt_caching=True)
+    _, _, payload = client._prepare_request(caching, messages, True, None)
+
+    assert payload["system"] == [{"type": "text", "text": "System prompt", "cache_control": {"type": "ephemeral"}}]
+    assert payload["messages"][-1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert payload["messages"][0] == {"role": "user", "content": "Hello"}
+
+    # Models that don't opt in keep the plain request shape
+    _, _, plain = client._prepare_request(client.get_provider("Claude 3.5 Haiku"), messages, True, None)
+    assert plain["system"] == "System prompt"
+    assert plain["messages"][-1] == {"role": "user", "content": "Again"}
+
+
+async def test_anthropic_stream_reports_cache_usage(client):
+    stream_with_usage = (
+        'data: {"type": "message_start", "message": {"usage": {"input_tokens": 10, '
+        '"cache_creation_input_tokens": 0, "cache_read_input_tokens": 2000, "output_tokens": 1}}}\n\n'
+        'data: {"type": "content_block_delta", "delta": {"text": "Hi"}}\n\n'
+        'data: {"type": "message_delta", "usage": {"output_tokens": 5}}\n\n'
+        'data: {"type": "message_stop"}\n\n'
+    )
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text=stream_with_usage)))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await client.achat_completion(messages=[{"role": "user", "content": "hi"}], stream=True)
+        events = [event async for event in stream]
+
+    assert events[1].usage == {
+        "prompt_tokens": 2010, "completion_tokens": 5, "cache_read_tokens": 2000, "cache_write_tokens": 0}
+    assert client.usage_stats()["Claude 3.5 Sonnet"]["cache_read_tokens"] == 2000
+
+
+async def test_openai_usage_reports_cached_tokens(client):
+    stream_with_usage = (
+        'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+        'data: {"choices": [], "usage": {"prompt_tokens": 1500, "completion_tokens": 20, '
+        '"prompt_tokens_details": {"cached_tokens": 1024}}}\n\n'
+        'data: [DONE]\n\n'
+    )
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text=stream_with_usage)))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await client.achat_completion(messages=[{"role": "user", "content": "hi"}], stream=True,
+                                               llm_name="GPT-3.5 Turbo")
+        events = [event async for event in stream]
+
+    assert events[1].usage["cache_read_tokens"] == 1024
+    assert events[1].usage["cache_write_tokens"] == 0
+    assert client.usage_stats()["GPT-3.5 Turbo"]["prompt_tokens"] == 1500
+
+
+def test_tools_are_ordered_by_name(client):
+    tools = [{"type": "function", "function": {"name": "zeta"}}, {"type": "function", "function": {"name": "alpha"}}]
+    _, _, payload = client._prepare_request(client.get_provider("GPT-3.5 Turbo"), [], False, tools)
+    assert [tool["function"]["name"] for tool in payload["tools"]] == ["alpha", "zeta"]
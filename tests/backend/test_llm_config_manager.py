@@ -85,3 +85,27 @@ def test_llm_config_manager_llm_not_found(mock_llm_config_file):
     manager = LLMConfigManager(mock_llm_config_file)
     with pytest.raises(ValueError, match="LLM configuration 'NonExistentLLM' not found."):
         manager.get_llm_config("NonExistentLLM")
+
+def test_llm_config_manager_loads_rate_limits(tmp_path):
+    config_file = tmp_path / "limits_llms.yml"
+    config_file.write_text("""
+providers:
+  Anthropic:
+    max_concurrency: 4
+    tokens_per_minute: 40000
+llms:
+  - name: "Limited Claude"
+    provider: "anthropic"
+    api_key_env: "ANTHROPIC_API_KEY"
+    model: "claude-test"
+    max_concurrency: 2
+    requests_per_minute: 50
+""")
+    manager = LLMConfigManager(str(config_file))
+    limits = manager.get_provider_limits("anthropic")
+    assert limits.max_concurrency == 4
+    assert limits.tokens_per_minute == 40000
+    assert manager.get_provider_limits("openai").max_concurrency is None
+    config = manager.get_llm_config("Limited Claude")
+    assert config.max_concurrency == 2
+    assert config.requests_per_minute == 50
@@ -0,0 +1,167 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime, UTC
+from app.utils.blob_store import BlobStore
+from app.utils.log_housekeeping import LogHousekeeper
+from app.utils.log_reader import iter_session_events
+from app.utils.session_logger import SessionEventWriter
+
+
+def make_housekeeper(tmp_path, **kwargs):
+    logs_dir = tmp_path / "logs"
+    logs_dir.mkdir(exist_ok=True)
+    options = dict(max_bytes=1024, max_age_seconds=3600.0, retention_seconds=86400.0,
+                   download_retention_seconds=60.0, blob_retention_seconds=86400.0, settle_seconds=0.0,
+                   writer=SessionEventWriter(),
+                   blob_store=BlobStore(str(logs_dir / "blobs")))
+    options.update(kwargs)
+    return LogHousekeeper(logs_dir=str(logs_dir), archive_dir=str(logs_dir / "archive"), **options)
+
+
+def write_events(path, count, timestamp=None):
+    timestamp = timestamp or datetime.now(UTC).isoformat()
+    with open(path, "a") as f:
+        for i in range(count):
+            f.write(json.dumps({"event": "user_message", "content": f"message {i}", "timestamp": timestamp}) + "\n")
+
+
+def archived_files(housekeeper):
+    return [os.path.join(root, name) for root, _, files in os.walk(housekeeper.archive_dir) for name in files]
+
+
+def test_rotates_and_compresses_large_log(tmp_path):
+    housekeeper = make_housekeeper(tmp_path)
+    log_file = os.path.join(housekeeper.logs_dir, "session-a.jsonl")
+    write_events(log_file, 50)
+
+    housekeeper.run_once()
+
+    assert not os.path.exists(log_file)
+    segments = archived_files(housekeeper)
+    assert len(segments) == 1 and segments[0].endswith(".jsonl.gz")
+    events = list(iter_session_events(segments[0], inflate=False))
+    assert len(events) == 50
+    assert housekeeper.rotated == 1
+    assert housekeeper.compressed == 1
+
+
+def test_keeps_small_recent_log(tmp_path):
+    housekeeper = make_housekeeper(tmp_path)
+    log_file = os.path.join(housekeeper.logs_dir, "session-b.jsonl")
+    write_events(log_file, 1)
+
+    housekeeper.run_once()
+
+    assert os.path.exists(log_file)
+    assert archived_files(housekeeper) == []
+
+
+def test_rotates_log_whose_first_event_is_too_old(tmp_path):
+    housekeeper = make_housekeeper(tmp_path)
+    log_file = os.path.join(housekeeper.logs_dir, "session-c.jsonl")
+    write_events(log_file, 1, timestamp=datetime.fromtimestamp(time.time() - 7200, UTC).isoformat())
+
+    housekeeper.run_once()
+
+    assert not os.path.exists(log_file)
+    assert len(archived_files(housekeeper)) == 1
+
+
+def test_no_compression_keeps_plain_segments(tmp_path):
+    housekeeper = make_housekeeper(tmp_path, compression="none")
+    write_events(os.path.join(housekeeper.logs_dir, "session-d.jsonl"), 50)
+
+    housekeeper.run_once()
+
+    segments = archived_files(housekeeper)
+    assert len(segments) == 1 and segments[0].endswith(".jsonl")
+
+
+def test_prunes_expired_segments_and_downloads(tmp_path):
+    housekeeper = make_housekeeper(tmp_path)
+    old = time.time() - 2 * 86400
+    day_dir = os.path.join(housekeeper.archive_dir, "2020-01-01")
+    os.makedirs(day_dir)
+    segment = os.path.join(day_dir, "session-e.000000000000.jsonl.gz")
+    with gzip.open(segment, "wt") as f:
+        f.write("{}\n")
+    os.utime(segment, (old, old))
+    download = os.path.join(housekeeper.logs_dir, "chat_session_e.txt")
+    with open(download, "w") as f:
+        f.write("transcript")
+    os.utime(download, (old, old))
+
+    housekeeper.run_once()
+
+    assert not os.path.exists(segment)
+    assert not os.path.exists(day_dir)
+    assert not os.path.exists(download)
+    assert housekeeper.deleted == 2
+
+
+def test_rotation_while_writer_running_starts_new_file(tmp_path):
+    writer = SessionEventWriter(flush_interval=0.01)
+    housekeeper = make_housekeeper(tmp_path, writer=writer)
+    log_file = os.path.join(housekeeper.logs_dir, "session-f.jsonl")
+    writer.start()
+    try:
+        for i in range(50):
+            writer.submit(log_file, {"event": "user_message", "content": f"message {i}"})
+        writer.flush()
+        housekeeper.run_once()
+        writer.submit(log_file, {"event": "user_message", "content": "after rotation"})
+        writer.flush()
+    finally:
+        writer.stop()
+
+    with open(log_file) as f:
+        assert [json.loads(line)["content"] for line in f] == ["after rotation"]
+    assert len(list(iter_session_events(archived_files(housekeeper)[0], inflate=False))) == 50
+
+
+def test_writer_in_another_process_reopens_rotated_log(tmp_path):
+    # Two workers' writers, each with its own cached handle; housekeeping runs beside the first
+    writer_a, writer_b = SessionEventWriter(), SessionEventWriter()
+    housekeeper = make_housekeeper(tmp_path, writer=writer_a, settle_seconds=3600.0)
+    log_file = os.path.join(housekeeper.logs_dir, "session-g.jsonl")
+    writer_a._write_pending({log_file: [{"n": 0, "pad": "x" * 1024}]})
+    writer_b._write_pending({log_file: [{"n": 1}]})
+
+    housekeeper.run_once()
+    assert housekeeper.rotated == 1
+    # Just rotated: not compressed until it has settled
+    assert housekeeper.compressed == 0
+    writer_b._write_pending({log_file: [{"n": 2}]})
+
+    with open(log_file) as f:
+        assert [json.loads(line)["n"] for line in f] == [2]
+    housekeeper.settle_seconds = 0.0
+    housekeeper.run_once()
+    segment, = archived_files(housekeeper)
+    assert [event["n"] for event in iter_session_events(segment, inflate=False)] == [0, 1]
+    writer_a.close_handles()
+    writer_b.close_handles()
+
+
+def test_prunes_unused_prompt_blobs(tmp_path):
+    housekeeper = make_housekeeper(tmp_path)
+    store = housekeeper.blob_store
+    old = store.put("old system prompt")
+    reused = store.put("reused system prompt")
+    two_days_ago = time.time() - 2 * 86400
+    for digest in (old, reused):
+        os.utime(store.path_for(digest), (two_days_ago, two_days_ago))
+    # Still in use: the next put refreshes its mtime
+    store.touch_interval = 0
+    store.put("reused system prompt")
+
+    housekeeper.run_once()
+
+    assert not os.path.exists(store.path_for(old))
+    assert store.get(reused) == "reused system prompt"
+    assert housekeeper.stats()["deleted"] == 1
+    # A pruned prompt is written again when it comes back
+    store.put("old system prompt")
+    assert store.get(old) == "old system prompt"
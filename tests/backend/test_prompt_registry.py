@@ -0,0 +1,75 @@
+import os
+from app.services.prompt_registry import PromptRegistry
+from app.services.system_prompt_engine import SystemPromptEngine
+
+
+def write(path, text, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def make_registry(tmp_path, clock):
+    return PromptRegistry(directory=str(tmp_path / "prompts"),
+                          base_prompt_path=str(tmp_path / "system_prompt.md"),
+                          check_interval=5.0, clock=clock)
+
+
+def test_loads_fragments_by_kind_and_id(tmp_path, clock):
+    write(tmp_path / "prompts" / "tools" / "calculator.md", "Use the $id tool.\n")
+    write(tmp_path / "prompts" / "data_sources" / "docs.md", "Docs content")
+    write(tmp_path / "system_prompt.md", "Base prompt.")
+    registry = make_registry(tmp_path, clock)
+
+    assert registry.get("tools", "calculator") == "Use the calculator tool."
+    assert registry.get("data_sources", "docs") == "Docs content"
+    assert registry.get("tools", "missing") is None
+    assert registry.base_prompt() == "Base prompt."
+
+
+def test_reloads_changed_files_at_most_once_per_interval(tmp_path, clock):
+    fragment = tmp_path / "prompts" / "tools" / "calculator.md"
+    write(fragment, "Old text", mtime=1000)
+    registry = make_registry(tmp_path, clock)
+    assert registry.get("tools", "calculator") == "Old text"
+    version = registry.version
+
+    write(fragment, "New text", mtime=2000)
+    clock.now = 1.0
+    assert registry.get("tools", "calculator") == "Old text"
+    assert registry.checks == 1
+
+    clock.now = 6.0
+    assert registry.get("tools", "calculator") == "New text"
+    assert registry.version == version + 1
+
+
+def test_unchanged_files_are_not_reread(tmp_path, clock):
+    write(tmp_path / "prompts" / "tools" / "calculator.md", "Text")
+    registry = make_registry(tmp_path, clock)
+    registry.refresh()
+    reloads = registry.reloads
+
+    clock.now = 10.0
+    assert registry.refresh() is False
+    assert registry.reloads == reloads
+
+
+def test_removed_fragment_disappears(tmp_path, clock):
+    fragment = tmp_path / "prompts" / "tools" / "calculator.md"
+    write(fragment, "Text")
+    registry = make_registry(tmp_path, clock)
+    assert registry.get("tools", "calculator") == "Text"
+
+    fragment.unlink()
+    assert registry.refresh(force=True) is True
+    assert registry.get("tools", "calculator") is None
+
+
+def test_engine_uses_tool_fragments():
+    engine = SystemPromptEngine()
+    engine.set_base_prompt("Base prompt.")
+    prompt = engine.generate_system_prompt(["calculator", "unknown_tool"])
+    assert prompt.startswith("Base prompt.\n\n")
+    assert "You have access to a calculator" in prompt
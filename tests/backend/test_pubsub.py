@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import AsyncMock
+from app.services.generation_tracker import GenerationTracker
+from app.services.pubsub import InProcessBroker, InProcessPubSub, SQLitePubSub
+from app.services.session_manager import SessionManager
+from app.services.sqlite_session_backend import SQLiteSessionBackend
+from app.services.stream_events import StreamDelta
+
+
+def make_workers(tmp_path):
+    """Two session managers sharing one database and one broker, like two uvicorn workers."""
+    db_path = str(tmp_path / "sessions.db")
+    broker = InProcessBroker()
+    worker_a = SessionManager(backend=SQLiteSessionBackend(db_path), pubsub=InProcessPubSub(broker),
+                              generations=GenerationTracker())
+    worker_b = SessionManager(backend=SQLiteSessionBackend(db_path), pubsub=InProcessPubSub(broker),
+                              generations=GenerationTracker())
+    return worker_a, worker_b
+
+
+def test_session_created_on_one_worker_is_visible_on_another(tmp_path):
+    worker_a, worker_b = make_workers(tmp_path)
+    session_id = worker_a.create_session("shared@example.com")
+
+    assert worker_b.get_session(session_id)["user_email"] == "shared@example.com"
+    assert worker_b.create_session("shared@example.com") == session_id
+
+
+def test_changes_invalidate_other_workers_hot_set(tmp_path):
+    worker_a, worker_b = make_workers(tmp_path)
+    session_id = worker_a.create_session("invalidate@example.com")
+    assert worker_b.get_session(session_id)["messages"] == []
+
+    worker_a.append_message(session_id, {"role": "user", "content": "from worker a"})
+    worker_a.update_session_tools(session_id, ["calculator"])
+
+    session = worker_b.get_session(session_id)
+    assert session["messages"] == [{"role": "user", "content": "from worker a"}]
+    assert session["selected_tools"] == ["calculator"]
+
+    worker_a.delete_session(session_id)
+    assert worker_b.get_session(session_id) is None
+    assert "invalidate@example.com" not in worker_b.user_sessions
+
+
+async def test_websocket_message_forwarded_to_owning_worker(tmp_path):
+    worker_a, worker_b = make_workers(tmp_path)
+    session_id = worker_a.create_session("ws@example.com")
+    websocket = AsyncMock()
+    worker_b.register_websocket(session_id, websocket)
+
+    await worker_a.send_websocket_message(session_id, {"type": "session_id", "session_id": session_id})
+    await asyncio.sleep(0)
+
+    websocket.send_json.assert_awaited_once_with({"type": "session_id", "session_id": session_id})
+
+
+async def test_stop_cancels_generation_running_on_another_worker(tmp_path):
+    worker_a, worker_b = make_workers(tmp_path)
+    session_id = worker_a.create_session("stop@example.com")
+
+    async def open_stream():
+        async def stream():
+            while True:
+                yield StreamDelta(content="token")
+                await asyncio.sleep(0.01)
+        return stream()
+
+    # The chat request landed on worker b, the WebSocket that sends stop is on worker a
+    generation = worker_b.generations.start(session_id, open_stream)
+    events = generation.events()
+    await events.__anext__()
+
+    assert worker_a.cancel_generations(session_id, "stopped_by_user") == 0
+    assert generation.cancel_reason == "stopped_by_user"
+    assert worker_b.generations.stats()["cancelled"] == {"stopped_by_user": 1}
+    await events.aclose()
+    assert worker_b.generations.stats()["active"] == 0
+
+
+def test_sqlite_pubsub_delivers_to_other_participants_only(tmp_path):
+    db_path = str(tmp_path / "pubsub.db")
+    publisher = SQLitePubSub(db_path)
+    subscriber = SQLitePubSub(db_path)
+    received_by_publisher, received_by_subscriber = [], []
+    publisher.subscribe(lambda channel, message: received_by_publisher.append((channel, message)))
+    subscriber.subscribe(lambda channel, message: received_by_subscriber.append((channel, message)))
+
+    publisher.publish("session", {"session_id": "abc"})
+    publisher.poll()
+    subscriber.poll()
+
+    assert received_by_publisher == []
+    assert received_by_subscriber == [("session", {"session_id": "abc"})]
+    # Already delivered messages are not replayed
+    assert subscriber.poll() == 0
+
+
+async def test_sqlite_pubsub_poll_loop(tmp_path):
+    db_path = str(tmp_path / "pubsub.db")
+    publisher = SQLitePubSub(db_path)
+    subscriber = SQLitePubSub(db_path, poll_interval=0.01)
+    received = []
+    subscriber.subscribe(lambda channel, message: received.append(message))
+
+    await subscriber.start()
+    publisher.publish("websocket", {"session_id": "abc", "message": {"type": "ping"}})
+    for _ in range(50):
+        if received:
+            break
+        await asyncio.sleep(0.01)
+    await subscriber.stop()
+
+    assert received == [{"session_id": "abc", "message": {"type": "ping"}}]
@@ -0,0 +1,116 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services.rate_limiter import Limits, QueueFull, RateLimiter, TokenBucket
+
+OPENAI_STREAM = (
+    'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+    'data: [DONE]\n\n'
+)
+
+
+def test_token_bucket_refills_per_minute(clock):
+    bucket = TokenBucket(60, clock)
+    assert bucket.reserve(60) == 0.0
+    # Empty bucket: one more token takes a second at 1 token/s
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 3
+    assert bucket.reserve(1) == 0.0
+
+
+def test_token_bucket_lets_oversized_request_through_when_full(clock):
+    bucket = TokenBucket(10, clock)
+    assert bucket.reserve(500) == 0.0
+    assert bucket.reserve(1) > 0
+
+
+async def test_requests_over_concurrency_limit_wait():
+    limiter = RateLimiter()
+    scopes = [("model:test", Limits(max_concurrency=1))]
+    first = await limiter.acquire(scopes)
+    assert not first.queued
+
+    second = asyncio.create_task(limiter.acquire(scopes))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+    assert limiter.stats()["model:test"]["waiting"] == 1
+
+    first.release()
+    permit = await second
+    assert permit.queued
+    assert permit.waited_seconds > 0
+    permit.release()
+    assert limiter.stats()["model:test"]["active"] == 0
+
+
+async def test_try_acquire_only_takes_free_slots():
+    limiter = RateLimiter()
+    scopes = [("provider:openai", Limits(requests_per_minute=2)), ("model:test", Limits(max_concurrency=1))]
+    permit = await limiter.try_acquire(scopes)
+    assert permit is not None
+    assert await limiter.try_acquire(scopes) is None
+    permit.release()
+
+    permit = await limiter.try_acquire(scopes)
+    permit.release()
+    # The request bucket is empty now; nothing is held after the refusal
+    assert await limiter.try_acquire(scopes) is None
+    assert limiter.stats()["model:test"]["active"] == 0
+    assert limiter.stats()["model:test"]["waiting"] == 0
+
+
+async def test_full_queue_rejects_requests():
+    limiter = RateLimiter(max_waiting=1)
+    scopes = [("provider:openai", Limits(max_concurrency=1))]
+    held = await limiter.acquire(scopes)
+    waiting = asyncio.create_task(limiter.acquire(scopes))
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueFull):
+        await limiter.acquire(scopes)
+    held.release()
+    (await waiting).release()
+
+
+async def test_queue_timeout_rejects_and_releases_earlier_scopes():
+    limiter = RateLimiter(queue_timeout_seconds=0.01)
+    held = await limiter.acquire([("model:a", Limits(max_concurrency=1))])
+
+    with pytest.raises(QueueFull):
+        await limiter.acquire([("provider:p", Limits(max_concurrency=1)), ("model:a", Limits(max_concurrency=1))])
+    # The provider slot taken before timing out on the model was given back
+    assert limiter.stats()["provider:p"]["active"] == 0
+    (await limiter.acquire([("provider:p", Limits(max_concurrency=1))])).release()
+    held.release()
+
+
+async def test_request_bucket_delays_until_refilled():
+    limiter = RateLimiter()
+    scopes = [("model:a", Limits(requests_per_minute=600))]
+    limiter._scope("model:a", scopes[0][1])[1].requests.level = 0
+    permit = await limiter.acquire(scopes)
+    # 600/min refills one request every 0.1s
+    assert permit.queued
+    assert permit.waited_seconds >= 0.09
+
+
+async def test_queued_stream_starts_with_status_event(make_client):
+    llm = make_client(limits=Limits(max_concurrency=1))
+    handle = llm.get_provider()
+    blocker = await llm.rate_limiter.acquire([(f"model:{handle.name}", handle.limits)])
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text=OPENAI_STREAM, headers={"content-type": "text/event-stream"})
+    ))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        call = asyncio.create_task(llm.achat_completion(messages=[{"role": "user", "content": "hi"}], stream=True))
+        await asyncio.sleep(0.01)
+        blocker.release()
+        events = [event async for event in await call]
+
+    status = events[0].status
+    assert status["type"] == "status"
+    assert status["queue_wait_ms"] >= 0
+    assert events[-1].done
+    assert llm.rate_limiter.stats()[f"model:{handle.name}"]["active"] == 0
@@ -0,0 +1,166 @@
+import asyncio
+import time
+import httpx
+import pytest
+from email.utils import formatdate
+from unittest.mock import patch
+from app.services.request_policy import DeadlineExceeded, RequestPolicy, parse_retry_after
+
+OPENAI_STREAM = (
+    'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+    'data: [DONE]\n\n'
+)
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def make_policy_client(make_client):
+    def make(policy: RequestPolicy):
+        llm = make_client(fallbacks=())
+        llm.request_policy = policy
+        return llm
+    return make
+
+
+def test_backoff_is_jittered_exponential_and_capped():
+    policy = RequestPolicy(base_delay=1.0, max_delay=4.0, rng=lambda: 1.0)
+    assert [policy.backoff(attempt) for attempt in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    assert RequestPolicy(base_delay=1.0, rng=lambda: 0.25).backoff(1) == 0.5
+
+
+def test_backoff_honors_retry_after():
+    policy = RequestPolicy(base_delay=1.0, rng=lambda: 0.5)
+    assert policy.backoff(0, retry_after=10.0) == 10.0
+    assert policy.backoff(0, retry_after=0.0) == 0.5
+
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after(httpx.Headers({"retry-after": "7"})) == 7.0
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "250", "retry-after": "7"})) == 0.25
+    date = formatdate(1000030, usegmt=True)
+    assert parse_retry_after(httpx.Headers({"retry-after": date}), now=lambda: 1000000) == 30.0
+    assert parse_retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    assert parse_retry_after(httpx.Headers()) is None
+
+
+def test_timeouts_are_capped_by_deadline():
+    policy = RequestPolicy(connect_timeout=10, first_byte_timeout=60, idle_timeout=30)
+    timeout = policy.timeout(deadline=time.monotonic() + 5)
+    assert timeout.read <= 5 and timeout.connect <= 5
+    assert policy.idle_wait(deadline=time.monotonic() + 5) <= 5
+    with pytest.raises(DeadlineExceeded):
+        policy.timeout(deadline=time.monotonic() - 1)
+
+
+def test_first_byte_timeout_bounds_the_wait_before_the_stream_starts():
+    policy = RequestPolicy(first_byte_timeout=60, idle_timeout=30)
+    # Headers and the first event may take up to the first byte timeout, not the idle timeout
+    assert policy.timeout(deadline=None).read == 60
+    assert policy.first_token_timeout(deadline=None) == 60
+    assert policy.idle_wait(deadline=None) == 30
+
+
+def test_no_retry_when_backoff_would_pass_deadline():
+    policy = RequestPolicy(max_retries=3)
+    assert policy.should_retry(0, 0.1, None)
+    assert not policy.should_retry(3, 0.1, None)
+    assert not policy.should_retry(0, 10.0, time.monotonic() + 1)
+
+
+async def test_rate_limited_request_is_retried(make_policy_client):
+    responses = [
+        httpx.Response(429, headers={"retry-after": "0"}),
+        httpx.Response(200, text=OPENAI_STREAM, headers={"content-type": "text/event-stream"}),
+    ]
+    llm = make_policy_client(RequestPolicy(max_retries=2, base_delay=0.001))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        events = [event async for event in await llm.achat_completion(messages=MESSAGES, stream=True)]
+
+    assert events[-1].done
+    assert llm.retry_stats() == {"GPT-4 Turbo": 1}
+
+
+async def test_client_errors_are_not_retried(make_policy_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400)
+
+    llm = make_policy_client(RequestPolicy(max_retries=2, base_delay=0.001))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        with pytest.raises(Exception, match="OpenAI API request failed"):
+            await llm.achat_completion(messages=MESSAGES, stream=True)
+    assert len(calls) == 1
+
+
+async def test_first_token_timeout_retries_then_gives_up(make_policy_client, slow_stream):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, stream=slow_stream(1.0, OPENAI_STREAM), headers={"content-type": "text/event-stream"})
+
+    llm = make_policy_client(RequestPolicy(first_byte_timeout=0.02, max_retries=1, base_delay=0.001))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        with pytest.raises(Exception, match="no response within"):
+            await llm.achat_completion(messages=MESSAGES, stream=True)
+    assert len(calls) == 2
+
+
+class FailingStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+        raise httpx.ReadError("connection reset")
+
+
+async def test_errors_after_first_token_are_not_retried(make_policy_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, stream=FailingStream(), headers={"content-type": "text/event-stream"})
+
+    llm = make_policy_client(RequestPolicy(max_retries=2, base_delay=0.001))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True)
+        events = []
+        with pytest.raises(Exception, match="stream failed"):
+            async for event in stream:
+                events.append(event)
+
+    assert events[0].content == "Hi"
+    assert len(calls) == 1
+
+
+class StallingStream(httpx.AsyncByteStream):
+    def __init__(self, first_delay: float, stall: float):
+        self.first_delay = first_delay
+        self.stall = stall
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.first_delay)
+        yield b'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+        await asyncio.sleep(self.stall)
+        yield b"data: [DONE]\n\n"
+
+
+async def test_idle_timeout_applies_only_after_the_first_event(make_policy_client):
+    def handler(request):
+        return httpx.Response(200, stream=StallingStream(0.1, 1.0), headers={"content-type": "text/event-stream"})
+
+    # The first event takes longer than the idle timeout and still counts as in time
+    llm = make_policy_client(RequestPolicy(first_byte_timeout=1.0, idle_timeout=0.05, max_retries=0))
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        stream = await llm.achat_completion(messages=MESSAGES, stream=True)
+        events = []
+        with pytest.raises(Exception, match="stream stalled"):
+            async for event in stream:
+                events.append(event)
+
+    assert events[0].content == "Hi"
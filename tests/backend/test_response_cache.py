@@ -0,0 +1,87 @@
+import httpx
+from unittest.mock import patch
+from app.services.response_cache import ResponseCache, cache_key
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}]
+
+ANTHROPIC_STREAM = (
+    'event: content_block_delta\n'
+    'data: {"type": "content_block_delta", "delta": {"text": "Hello"}}\n\n'
+    'event: content_block_delta\n'
+    'data: {"type": "content_block_delta", "delta": {"text": " world"}}\n\n'
+    'event: message_stop\n'
+    'data: {"type": "message_stop"}\n\n'
+)
+
+
+def test_cache_key_ignores_extra_message_fields():
+    with_id = [dict(message, id="x") for message in MESSAGES]
+    assert cache_key("openai:gpt-4", MESSAGES, {}) == cache_key("openai:gpt-4", with_id, {})
+    assert cache_key("openai:gpt-4", MESSAGES, {}) != cache_key("openai:gpt-4o", MESSAGES, {})
+    assert cache_key("openai:gpt-4", MESSAGES, {}) != cache_key("openai:gpt-4", MESSAGES, {"tools": [1]})
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = ResponseCache(enabled=True, max_entries=2)
+    cache.put("a", {"content": "A"})
+    cache.put("b", {"content": "B"})
+    assert cache.get("a")["content"] == "A"
+    cache.put("c", {"content": "C"})
+
+    assert cache.get("b") is None
+    assert cache.get("a")["content"] == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(enabled=True, ttl_seconds=60, clock=clock)
+    cache.put("a", {"content": "A"})
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 2
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    ResponseCache(enabled=True, db_path=db_path).put("a", {"content": "A", "usage": None})
+
+    fresh = ResponseCache(enabled=True, db_path=db_path)
+    assert fresh.get("a") == {"content": "A", "usage": None}
+    assert fresh.stats()["disk_hits"] == 1
+    assert fresh.get("a") is not None
+    assert fresh.stats()["memory_hits"] == 1
+
+
+async def test_stream_is_replayed_from_cache(make_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, text=ANTHROPIC_STREAM, headers={"content-type": "text/event-stream"})
+
+    llm = make_client("Claude 3.5 Sonnet")
+    llm.response_cache = ResponseCache(enabled=True)
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        first = [event async for event in await llm.achat_completion(messages=MESSAGES, stream=True)]
+        second = [event async for event in await llm.achat_completion(messages=MESSAGES, stream=True)]
+
+    assert len(calls) == 1
+    assert second[-1].done
+    assert "".join(event.content for event in second if event.content) == "Hello world"
+    assert second[-2].usage["response_cache_hit"] is True
+    assert first[-1].done
+
+
+async def test_incomplete_stream_is_not_cached(make_client):
+    cut_off = ANTHROPIC_STREAM.split("event: message_stop")[0]
+    llm = make_client("Claude 3.5 Sonnet")
+    llm.response_cache = ResponseCache(enabled=True)
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text=cut_off, headers={"content-type": "text/event-stream"})
+    ))
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        [line async for line in await llm.achat_completion(messages=MESSAGES, stream=True)]
+
+    assert llm.response_cache.stats()["stores"] == 0
@@ -1,6 +1,9 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.services.session_manager import session_manager
+from app.services.context_window import context_window_manager
+from app.services.session_manager import SessionManager, session_manager
+from app.services.sqlite_session_backend import SQLiteSessionBackend
+from app.services.token_counter import token_counter
 
 client = TestClient(app)
 
@@ -49,4 +52,42 @@ def test_update_session_tools():
 
     # Clean up the session
     session_manager.delete_session(session_id)
-    assert session_manager.get_session(session_id) is None
\ No newline at end of file
+    assert session_manager.get_session(session_id) is None
+
+
+def test_sessions_load_lazily_after_restart(tmp_path):
+    from app.services.session_manager import SessionManager
+    from app.services.sqlite_session_backend import SQLiteSessionBackend
+
+    db_path = str(tmp_path / "sessions.db")
+    manager = SessionManager(backend=SQLiteSessionBackend(db_path))
+    session_id = manager.create_session("restart_test@example.com")
+    manager.set_system_prompt(session_id, "You are helpful.")
+    manager.append_message(session_id, {"role": "user", "content": "Hello"})
+    manager.update_session_tools(session_id, ["calculator"])
+
+    # A fresh manager starts with nothing resident and loads on first access
+    restarted = SessionManager(backend=SQLiteSessionBackend(db_path))
+    assert len(restarted.sessions) == 0
+    assert restarted.create_session("restart_test@example.com") == session_id
+    session = restarted.get_session(session_id)
+    assert [m["role"] for m in session["messages"]] == ["system", "user"]
+    assert session["selected_tools"] == ["calculator"]
+
+
+def test_evicted_sessions_release_per_session_caches(tmp_path):
+    manager = SessionManager(backend=SQLiteSessionBackend(str(tmp_path / "sessions.db")))
+    manager.sessions.max_resident = 1
+    first = manager.create_session("evict_first@example.com")
+    manager.append_message(first, {"role": "user", "content": "Hello"})
+    message = manager.get_session(first)["messages"][0]
+    context_window_manager.build_context(first, manager.context_messages(first), 1000)
+    assert token_counter._messages[id(message)][0] is message
+
+    second = manager.create_session("evict_second@example.com")
+
+    assert manager.user_sessions == {"evict_second@example.com": second}
+    assert first not in context_window_manager._sessions
+    assert id(message) not in token_counter._messages
+    # The evicted session is still found through the backend
+    assert manager.create_session("evict_first@example.com") == first
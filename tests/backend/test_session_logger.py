@@ -1,6 +1,8 @@
 import os
 import json
-from app.utils.session_logger import log_session_event, LOGS_DIR
+from app.services.session_manager import session_manager
+from app.utils.log_reader import iter_session_events
+from app.utils.session_logger import log_session_event, session_event_writer, LOGS_DIR
 from app.config import settings
 
 
@@ -101,3 +103,108 @@ def test_log_session_event_normal_mode():
     finally:
         # Restore test mode
         settings.test_mode = original_test_mode
+
+def read_events(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+def test_background_writer_batches_and_flushes(tmp_path):
+    from app.utils.session_logger import SessionEventWriter
+
+    writer = SessionEventWriter(batch_max_events=1000, flush_interval=60)
+    writer.start()
+    try:
+        log_a = str(tmp_path / "a.jsonl")
+        log_b = str(tmp_path / "b.jsonl")
+        for i in range(5):
+            writer.submit(log_a, {"n": i})
+        writer.submit(log_b, {"n": "b"})
+
+        assert writer.flush()
+        assert [e["n"] for e in read_events(log_a)] == [0, 1, 2, 3, 4]
+        assert read_events(log_b) == [{"n": "b"}]
+        stats = writer.stats()
+        assert stats["written"] == 6
+        assert stats["flushes"] == 1
+        assert stats["open_files"] == 2
+    finally:
+        writer.stop()
+    assert writer.stats()["open_files"] == 0
+
+def test_background_writer_flushes_on_stop(tmp_path):
+    from app.utils.session_logger import SessionEventWriter
+
+    writer = SessionEventWriter(batch_max_events=1000, flush_interval=60)
+    writer.start()
+    log_file = str(tmp_path / "nested" / "stop.jsonl")
+    writer.submit(log_file, {"event": "last"})
+    writer.stop()
+
+    assert read_events(log_file) == [{"event": "last"}]
+
+def test_background_writer_bounds_open_files_and_drops_when_full(tmp_path):
+    from app.utils.session_logger import SessionEventWriter
+
+    writer = SessionEventWriter(batch_max_events=1, flush_interval=60, max_open_files=2)
+    writer.start()
+    try:
+        for i in range(4):
+            writer.submit(str(tmp_path / f"{i}.jsonl"), {"n": i})
+        writer.flush()
+        assert writer.stats()["open_files"] == 2
+        assert all(read_events(str(tmp_path / f"{i}.jsonl")) == [{"n": i}] for i in range(4))
+    finally:
+        writer.stop()
+
+    full = SessionEventWriter(max_queue=1, flush_interval=60)
+    # Simulate a stalled writer: a queue with no consumer thread
+    import queue
+    full._queue = queue.Queue(maxsize=1)
+    full.submit(str(tmp_path / "x.jsonl"), {"n": 1})
+    full.submit(str(tmp_path / "x.jsonl"), {"n": 2})
+    assert full.stats()["dropped"] == 1
+    assert full.stats()["queued"] == 1
+
+def test_background_writer_survives_unserializable_event(tmp_path):
+    from app.utils.session_logger import SessionEventWriter
+
+    writer = SessionEventWriter(batch_max_events=1000, flush_interval=60)
+    writer.start()
+    try:
+        log_file = str(tmp_path / "bad.jsonl")
+        writer.submit(log_file, {"n": 1})
+        writer.submit(log_file, {"n": object()})
+        writer.submit(log_file, {"n": 2})
+        assert writer.flush()
+
+        writer.submit(log_file, {"n": 3})
+        assert writer.flush()
+        assert [e["n"] for e in read_events(log_file)] == [1, 2, 3]
+        stats = writer.stats()
+        assert stats["running"] is True
+        assert stats["write_errors"] == 1
+    finally:
+        writer.stop()
+    assert writer.stats()["running"] is False
+
+
+def test_system_prompt_text_is_not_written_to_session_log():
+    prompt = "You are a helpful assistant. Data source: quarterly revenue table " + "x" * 200
+    # Start from a fresh session even if an earlier run left one behind
+    session_manager.delete_session(session_manager.create_session("system_prompt_log@example.com"))
+    session_id = session_manager.create_session("system_prompt_log@example.com")
+    session_manager.set_system_prompt(session_id, prompt)
+    session_manager.update_session_messages(session_id, [{"role": "user", "content": "hi"},
+                                                         {"role": "system", "content": prompt}])
+    session_event_writer.flush()
+    log_file = os.path.join(LOGS_DIR, f"test_{session_id}.jsonl")
+
+    with open(log_file) as f:
+        raw = f.read()
+    assert "quarterly revenue table" not in raw
+    system_events = [event for event in iter_session_events(log_file) if event.get("role") == "system"]
+    assert len(system_events) == 2
+    assert all(event["system_prompt"] == prompt for event in system_events)
+    session_manager.delete_session(session_id)
+    session_event_writer.flush()
+    os.remove(log_file)
@@ -0,0 +1,139 @@
+import pytest
+from app.services.session_store import SessionStore, JSONFileSessionBackend
+from app.services.sqlite_session_backend import SQLiteSessionBackend
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "json":
+        return JSONFileSessionBackend(str(tmp_path / "sessions"))
+    return SQLiteSessionBackend(str(tmp_path / "sessions.db"))
+
+
+def make_session(email):
+    return {"user_email": email, "messages": [], "selected_tools": [], "selected_data_sources": [], "llm_name": None}
+
+
+def add(store, session_id, email):
+    session = make_session(email)
+    store.backend.create(session_id, session)
+    store.put(session_id, session)
+    return session
+
+
+def test_lru_eviction_recovers_from_backend(backend, clock):
+    store = SessionStore(max_resident=2, idle_ttl_seconds=1000, backend=backend, clock=clock)
+    add(store, "a", "a@example.com")
+    add(store, "b", "b@example.com")
+    store.get("a")  # "b" is now least recently used
+    add(store, "c", "c@example.com")
+
+    assert len(store) == 2
+    assert store.stats()["evictions"] == 1
+
+    recovered = store.get("b")
+    assert recovered["user_email"] == "b@example.com"
+    stats = store.stats()
+    assert stats["recoveries"] == 1
+    assert stats["misses"] == 1
+    assert len(store) == 2
+
+
+def test_idle_ttl_expiry(backend, clock):
+    store = SessionStore(max_resident=10, idle_ttl_seconds=60, backend=backend, clock=clock)
+    add(store, "idle", "idle@example.com")
+    clock.now = 30
+    add(store, "active", "active@example.com")
+    clock.now = 61
+
+    assert store.evict_expired() == 1
+    assert len(store) == 1
+    assert store.stats()["expirations"] == 1
+    # Expired sessions are still recoverable
+    assert store.get("idle")["user_email"] == "idle@example.com"
+
+
+def test_eviction_hook_sees_evicted_and_expired_sessions(backend, clock):
+    evicted = []
+    store = SessionStore(max_resident=1, idle_ttl_seconds=60, backend=backend, clock=clock,
+                         on_evict=lambda session_id, session: evicted.append((session_id, session["user_email"])))
+    add(store, "a", "a@example.com")
+    add(store, "b", "b@example.com")
+    clock.now = 61
+    store.evict_expired()
+    # Explicit deletes are the caller's business, not an eviction
+    add(store, "c", "c@example.com")
+    store.delete("c")
+
+    assert evicted == [("a", "a@example.com"), ("b", "b@example.com")]
+
+
+def test_written_through_changes_survive_eviction(backend, clock):
+    store = SessionStore(max_resident=1, idle_ttl_seconds=1000, backend=backend, clock=clock)
+    add(store, "a", "a@example.com")
+    backend.append_message("a", {"role": "user", "content": "hello"})
+    backend.update_fields("a", {"selected_tools": ["calculator"], "llm_name": "GPT-3.5 Turbo"})
+    add(store, "b", "b@example.com")
+
+    session = store.get("a")
+    assert session["messages"] == [{"role": "user", "content": "hello"}]
+    assert session["selected_tools"] == ["calculator"]
+    assert session["llm_name"] == "GPT-3.5 Turbo"
+
+
+def test_backend_message_operations(backend):
+    backend.create("s", make_session("s@example.com"))
+    backend.append_message("s", {"role": "system", "content": "v1"})
+    backend.append_message("s", {"role": "user", "content": "hi"})
+    backend.update_message("s", 0, {"role": "system", "content": "v2"})
+    assert [m["content"] for m in backend.load("s")["messages"]] == ["v2", "hi"]
+
+    backend.replace_messages("s", [{"role": "user", "content": "only"}])
+    assert backend.load("s")["messages"] == [{"role": "user", "content": "only"}]
+    assert backend.find_session_by_user("s@example.com") == "s"
+
+    backend.delete("s")
+    assert backend.load("s") is None
+    assert backend.find_session_by_user("s@example.com") is None
+
+
+def test_sqlite_backend_uses_wal_and_survives_reopen(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    backend = SQLiteSessionBackend(db_path)
+    assert backend._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    backend.create("s", make_session("s@example.com"))
+    backend.append_message("s", {"role": "user", "content": "persisted"})
+    backend.close()
+
+    reopened = SQLiteSessionBackend(db_path)
+    assert reopened.load("s")["messages"] == [{"role": "user", "content": "persisted"}]
+
+
+def test_sqlite_backend_adds_history_summary_column_to_old_databases(tmp_path):
+    import sqlite3
+    db_path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, user_email TEXT NOT NULL, "
+                 "selected_tools TEXT NOT NULL DEFAULT '[]', selected_data_sources TEXT NOT NULL DEFAULT '[]', "
+                 "llm_name TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO sessions VALUES ('s', 's@example.com', '[]', '[]', NULL, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    backend = SQLiteSessionBackend(db_path)
+    assert backend.load("s")["history_summary"] is None
+    summary = {"message": {"role": "user", "content": "summary"}, "covers": 4}
+    backend.update_fields("s", {"history_summary": summary})
+    assert backend.load("s")["history_summary"] == summary
+
+
+def test_hit_rate_without_backend(clock):
+    store = SessionStore(max_resident=10, idle_ttl_seconds=1000, clock=clock)
+    store.put("a", make_session("a@example.com"))
+    store.get("a")
+    store.get("missing")
+
+    stats = store.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,137 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services.llm_client import LLMClient
+from app.services.single_flight import SingleFlight
+
+
+class ControlledStream:
+    """Upstream stream whose lines are released by the test."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.opens = 0
+        self.closed = False
+
+    async def open(self):
+        self.opens += 1
+        return self._lines()
+
+    async def _lines(self):
+        try:
+            while True:
+                line = await self.queue.get()
+                if line is None:
+                    return
+                yield line
+        finally:
+            self.closed = True
+
+
+async def test_concurrent_subscribers_share_one_upstream_stream():
+    flights = SingleFlight()
+    upstream = ControlledStream()
+    first = await flights.stream("k", upstream.open)
+    second = await flights.stream("k", upstream.open)
+
+    for line in (b"a", b"b", None):
+        upstream.queue.put_nowait(line)
+    assert [line async for line in first] == [b"a", b"b"]
+    assert [line async for line in second] == [b"a", b"b"]
+    assert upstream.opens == 1
+    assert flights.stats()["coalesced"] == 1
+    assert flights.stats()["in_flight_streams"] == 0
+
+
+async def test_late_joiner_gets_buffered_lines_then_live_tail():
+    flights = SingleFlight()
+    upstream = ControlledStream()
+    first = await flights.stream("k", upstream.open)
+    upstream.queue.put_nowait(b"a")
+    assert await first.__anext__() == b"a"
+
+    late = await flights.stream("k", upstream.open)
+    upstream.queue.put_nowait(b"b")
+    upstream.queue.put_nowait(None)
+    assert [line async for line in late] == [b"a", b"b"]
+    assert [line async for line in first] == [b"b"]
+    assert upstream.opens == 1
+
+
+async def test_open_error_is_raised_to_every_caller():
+    flights = SingleFlight()
+    started = asyncio.Event()
+
+    async def failing_open():
+        await started.wait()
+        raise Exception("API request failed")
+
+    callers = [asyncio.create_task(flights.stream("k", failing_open)) for _ in range(2)]
+    await asyncio.sleep(0)
+    started.set()
+    for caller in callers:
+        with pytest.raises(Exception, match="API request failed"):
+            await caller
+
+
+async def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    flights = SingleFlight()
+    upstream = ControlledStream()
+    stream = await flights.stream("k", upstream.open)
+    upstream.queue.put_nowait(b"a")
+    assert await stream.__anext__() == b"a"
+
+    await stream.aclose()
+    await asyncio.sleep(0)
+    assert upstream.closed
+    assert flights.stats()["abandoned"] == 1
+    assert flights.stats()["in_flight_streams"] == 0
+
+
+async def test_upstream_open_is_cancelled_when_every_caller_leaves_before_it_opens():
+    flights = SingleFlight()
+    opening = asyncio.Event()
+    open_cancelled = asyncio.Event()
+
+    async def slow_open():
+        opening.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            open_cancelled.set()
+            raise
+
+    callers = [asyncio.create_task(flights.stream("k", slow_open)) for _ in range(2)]
+    await opening.wait()
+    callers[0].cancel()
+    await asyncio.sleep(0)
+    # The other caller still waits for the stream
+    assert not open_cancelled.is_set()
+    assert flights.stats()["in_flight_streams"] == 1
+
+    callers[1].cancel()
+    await asyncio.wait_for(open_cancelled.wait(), 1)
+    await asyncio.gather(*callers, return_exceptions=True)
+    assert flights.stats()["abandoned"] == 1
+    assert flights.stats()["in_flight_streams"] == 0
+
+
+async def test_identical_llm_requests_share_one_call():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "Hi"}}]})
+
+    llm = LLMClient()
+    llm.set_llm("GPT-4 Turbo")
+    llm.single_flight = SingleFlight()
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    messages = [{"role": "user", "content": "hi"}]
+    with patch("app.services.llm_client.http_pool.get_async_client", return_value=mock_client):
+        responses = await asyncio.gather(*(llm.achat_completion(messages=messages) for _ in range(3)))
+
+    assert len(calls) == 1
+    assert all(r.json()["choices"][0]["message"]["content"] == "Hi" for r in responses)
@@ -0,0 +1,62 @@
+import asyncio
+from app.services.generation_tracker import GenerationTracker
+from app.services.stream_coalescer import StreamCoalescer
+from app.services.stream_events import DONE, StreamDelta
+
+
+async def test_first_delta_is_sent_at_once_and_burst_is_merged():
+    sent = []
+    coalescer = StreamCoalescer(sent.append, window_seconds=0.05)
+    for text in "Hello":
+        coalescer.push(StreamDelta(content=text))
+    assert [event.content for event in sent] == ["H"]
+
+    await asyncio.sleep(0.08)
+    assert [event.content for event in sent] == ["H", "ello"]
+    assert (coalescer.received, coalescer.sent) == (5, 2)
+
+
+async def test_max_bytes_flushes_early():
+    sent = []
+    coalescer = StreamCoalescer(sent.append, window_seconds=10.0, max_bytes=4)
+    for text in ["a", "bb", "cc", "d"]:
+        coalescer.push(StreamDelta(content=text))
+    assert [event.content for event in sent] == ["a", "bbcc"]
+    coalescer.flush()
+    assert sent[-1].content == "d"
+
+
+async def test_other_events_flush_and_keep_order():
+    sent = []
+    coalescer = StreamCoalescer(sent.append, window_seconds=10.0)
+    coalescer.push(StreamDelta(content="a"))
+    coalescer.push(StreamDelta(content="b"))
+    coalescer.push(StreamDelta(content="c"))
+    coalescer.push(StreamDelta(usage={"completion_tokens": 3}))
+    coalescer.push(DONE)
+    assert [(event.content, event.usage, event.done) for event in sent] == [
+        ("a", None, False), ("bc", None, False), (None, {"completion_tokens": 3}, False), (None, None, True)]
+
+
+async def test_zero_window_passes_everything_through():
+    sent = []
+    coalescer = StreamCoalescer(sent.append, window_seconds=0)
+    for text in "abc":
+        coalescer.push(StreamDelta(content=text))
+    assert [event.content for event in sent] == ["a", "b", "c"]
+
+
+async def test_generation_coalesces_fast_stream():
+    async def open_stream():
+        async def stream():
+            for _ in range(100):
+                yield StreamDelta(content="x")
+            yield DONE
+        return stream()
+
+    tracker = GenerationTracker(coalesce_window_seconds=0.05)
+    events = [event async for event in tracker.start("s1", open_stream).events()]
+    assert "".join(event.content or "" for event in events) == "x" * 100
+    assert events[-1].done
+    assert len(events) < 10
+    assert tracker.stats()["deltas_received"] == 100
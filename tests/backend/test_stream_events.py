@@ -0,0 +1,48 @@
+import json
+import pytest
+from app.services.stream_events import DONE, AnthropicStreamParser, OpenAIStreamParser, StreamDelta, stream_parser
+
+
+def test_openai_parser_yields_content_usage_and_done():
+    parser = OpenAIStreamParser()
+    assert parser.feed("") is None
+    assert parser.feed(": keep-alive") is None
+    assert parser.feed('data: {"choices": [{"delta": {"role": "assistant"}}]}') is None
+    assert parser.feed('data: {"choices": [{"delta": {"content": "Hi"}}]}').content == "Hi"
+
+    event = parser.feed('data: {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 2, '
+                        '"prompt_tokens_details": {"cached_tokens": 8}}}')
+    assert event.content is None
+    assert event.usage["cache_read_tokens"] == 8
+    assert parser.feed("data: [DONE]") is DONE
+
+
+def test_openai_parser_flags_tool_calls():
+    event = OpenAIStreamParser().feed(
+        'data: {"choices": [{"delta": {"tool_calls": [{"index": 0, "function": {"name": "calc"}}]}}]}')
+    assert event.tool_calls[0]["function"]["name"] == "calc"
+
+
+def test_anthropic_parser_merges_usage_across_events():
+    parser = AnthropicStreamParser()
+    assert parser.feed("event: message_start") is None
+    assert parser.feed('data: {"type": "message_start", "message": {"usage": {"input_tokens": 5, '
+                       '"cache_read_input_tokens": 100}}}') is None
+    assert parser.feed('data: {"type": "content_block_delta", "delta": {"text": "Hello"}}').content == "Hello"
+    event = parser.feed('data: {"type": "message_delta", "usage": {"output_tokens": 3}}')
+    assert event.usage == {"prompt_tokens": 105, "completion_tokens": 3, "cache_read_tokens": 100,
+                           "cache_write_tokens": 0}
+    assert parser.feed('data: {"type": "message_stop"}') is DONE
+
+
+def test_sse_frame_matches_client_format():
+    for content in ("plain", 'quotes " and \\ backslash', "naïve ☃", "line\nbreak"):
+        assert StreamDelta(content=content).sse() == f"data: {json.dumps({'content': content})}\n\n".encode()
+    status = {"type": "status", "status": "queued"}
+    assert StreamDelta(status=status).sse() == f"data: {json.dumps(status)}\n\n".encode()
+    assert DONE.sse() == b"data: [DONE]\n\n"
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        stream_parser("mystery")
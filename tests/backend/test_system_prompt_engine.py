@@ -0,0 +1,56 @@
+from app.services.system_prompt_engine import SystemPromptEngine
+from app.services.data_source_manager import data_source_manager
+
+
+def make_engine(**kwargs):
+    engine = SystemPromptEngine(**kwargs)
+    engine.set_base_prompt("Base prompt.")
+    return engine
+
+
+def test_same_selection_in_any_order_hits_cache():
+    engine = make_engine()
+    first = engine.generate_system_prompt(["sql_query", "calculator"], ["new-mexico-history", "data-test"])
+    second = engine.generate_system_prompt(["calculator", "sql_query", "calculator"], ["data-test", "new-mexico-history"])
+
+    assert first == second
+    assert engine.cache_hits == 1
+    assert engine.cache_misses == 1
+    assert engine.cache_stats()["hit_rate"] == 0.5
+
+
+def test_set_base_prompt_invalidates_cache():
+    engine = make_engine()
+    assert engine.generate_system_prompt(["calculator"]).startswith("Base prompt.")
+
+    engine.set_base_prompt("New base.")
+    prompt = engine.generate_system_prompt(["calculator"])
+
+    assert prompt.startswith("New base.")
+    assert engine.cache_misses == 2
+
+
+def test_data_source_change_invalidates_cache():
+    engine = make_engine()
+    engine.generate_system_prompt(selected_data_sources=["cache-test-source"])
+
+    data_source_manager.register_data_source("cache-test-source", lambda: "CACHE TEST CONTENT")
+    try:
+        prompt = engine.generate_system_prompt(selected_data_sources=["cache-test-source"])
+    finally:
+        data_source_manager._data_sources.pop("cache-test-source")
+        data_source_manager.invalidate()
+
+    assert "CACHE TEST CONTENT" in prompt
+    assert engine.cache_misses == 2
+
+
+def test_cache_is_bounded():
+    engine = make_engine(max_cache_entries=2)
+    for tools in (["calculator"], ["sql_query"], ["user_lookup"]):
+        engine.generate_system_prompt(tools)
+
+    assert engine.cache_stats()["entries"] == 2
+    # The oldest selection was evicted
+    engine.generate_system_prompt(["calculator"])
+    assert engine.cache_misses == 4
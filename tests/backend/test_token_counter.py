@@ -0,0 +1,52 @@
+from app.services.token_counter import TokenCounter
+from app.services.system_prompt_engine import system_prompt_engine
+
+
+def test_counts_are_close_to_chars_per_token():
+    counter = TokenCounter()
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    assert abs(counter.count_text(text, "anthropic") - len(text) / 3.5) <= 1
+    assert counter.count_text("", "openai") == 0
+    assert counter.count_text("hi", "anthropic") == 1
+
+
+def test_non_ascii_text_counts_denser():
+    counter = TokenCounter()
+    assert counter.count_text("日本語のテキスト" * 10, "anthropic") > counter.count_text("abcdefgh" * 10, "anthropic")
+
+
+def test_text_counts_are_cached():
+    counter = TokenCounter()
+    block = "data source block " * 200
+    first = counter.count_text(block, "anthropic")
+    assert counter.count_text(block, "anthropic") == first
+    assert counter.text_hits == 1
+    assert counter.text_misses == 1
+
+
+def test_message_counts_are_cached_per_object():
+    counter = TokenCounter()
+    message = {"role": "user", "content": "Hello there"}
+    count = counter.count_message(message, "anthropic")
+    assert counter.count_message(message, "anthropic") == count
+    assert counter.message_hits == 1
+
+    # Replacing the content invalidates the cached count
+    message["content"] = "Hello there, with more words this time"
+    assert counter.count_message(message, "anthropic") > count
+    # So does a different provider family
+    counter.count_message(message, "openai")
+    assert counter.message_misses == 3
+
+
+def test_message_cache_is_bounded():
+    counter = TokenCounter(max_cached_messages=2)
+    for i in range(3):
+        counter.count_message({"role": "user", "content": f"message {i}"})
+    assert counter.stats()["cached_messages"] == 2
+
+
+def test_prompt_engine_reports_data_source_tokens():
+    tokens = system_prompt_engine.data_source_tokens(["new-mexico-history", "data-test", "data-test"], "anthropic")
+    assert list(tokens) == ["data-test", "new-mexico-history"]
+    assert all(count > 50 for count in tokens.values())
@@ -1,8 +1,12 @@
 import pytest
+from collections import OrderedDict
 from fastapi.testclient import TestClient
 from app.main import app
 from unittest.mock import patch, AsyncMock
 from app.config import settings
+from app.services.circuit_breaker import circuit_breakers
+from app.services.request_policy import request_policy
+from app.utils.session_logger import prompt_blob_store
 
 @pytest.fixture(scope="function", autouse=True)
 def setup_test_mode():
@@ -12,6 +16,23 @@ def setup_test_mode():
     yield
     settings.test_mode = original_test_mode
 
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Failures provoked by one test must not open circuits for the next"""
+    circuit_breakers.reset()
+    yield
+
+@pytest.fixture(autouse=True)
+def short_retry_backoff(monkeypatch):
+    """Tests provoking provider errors shouldn't sleep through real backoff delays"""
+    monkeypatch.setattr(request_policy, "base_delay", 0.001)
+
+@pytest.fixture(autouse=True)
+def isolated_prompt_blobs(monkeypatch, tmp_path):
+    """Prompt blobs written by tests go to a temporary directory, not the real logs/blobs"""
+    monkeypatch.setattr(prompt_blob_store, "directory", str(tmp_path / "blobs"))
+    monkeypatch.setattr(prompt_blob_store, "_known", OrderedDict())
+
 @pytest.fixture(scope="module")
 def test_client():
     with TestClient(app) as client:
@@ -2,17 +2,22 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.services.session_manager import session_manager
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 import json
 import requests
+from app.services.stream_events import StreamDelta
 
 client = TestClient(app)
 
 @pytest.fixture
 def mock_chat_completion_fixture(mocker):
-    mock_chat_completion = mocker.patch('app.services.llm_client.LLMClient.chat_completion')
-    # Default mock for chat_completion to return a simple response
-    mock_chat_completion.return_value = iter([b'data: {"choices": [{"delta": {"content": "Mocked LLM response."}}]}'])
+    mock_chat_completion = mocker.patch('app.services.llm_client.LLMClient.achat_completion', new_callable=AsyncMock)
+
+    # Default mock for achat_completion to return a simple response stream
+    async def mock_stream():
+        yield StreamDelta(content="Mocked LLM response.")
+
+    mock_chat_completion.return_value = mock_stream()
     return mock_chat_completion
 
 def test_health_endpoint_container():